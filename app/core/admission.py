@@ -0,0 +1,267 @@
+"""
+Adaptive admission control for the API Gateway.
+
+Every request is classified into a priority class and must acquire a slot
+from both the global limit and its class limit before it is handled. Limits
+follow AIMD: they grow by ~1 per window of fast completions and are cut
+multiplicatively when latency exceeds the class target or the event loop lags.
+When a slot is unavailable the caller answers 503 with Retry-After right away.
+A slot is held until the response's last byte is sent, so streamed bulk
+responses count against the limits for as long as they run.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+from fastapi.responses import JSONResponse
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.watchdog import watchdog
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Priority classes, highest priority first.
+CRITICAL = "critical"
+STANDARD = "standard"
+BULK = "bulk"
+
+# Path prefixes -> priority class. First match wins; default is STANDARD.
+ROUTE_CLASSES = [
+    ("/api/auth/login", CRITICAL),
+    ("/api/auth/register", CRITICAL),
+    ("/api/auth/refresh-token", CRITICAL),
+    ("/api/billing/webhook", CRITICAL),
+    ("/api/gateway/", CRITICAL),
+    ("/api/sbom/upload", BULK),
+    ("/api/sbom/batch", BULK),
+    ("/api/vulnerability/batch", BULK),
+]
+
+# Long-lived connections never hold an admission slot.
+EXEMPT_PATHS = ("/api/vulnerability/stream",)
+
+
+@dataclass
+class AdaptiveLimit:
+    """A concurrency limit adjusted with additive-increase/multiplicative-decrease."""
+
+    name: str
+    limit: float
+    min_limit: int
+    max_limit: int
+    target_latency: float
+    backoff: float = 0.7
+    in_flight: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    _last_decrease: float = field(default=0.0, repr=False)
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def on_sample(self, congested: bool):
+        now = time.monotonic()
+        if congested:
+            # Cut at most once per target window so a burst of slow
+            # completions does not collapse the limit to the floor.
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "target_latency_ms": int(self.target_latency * 1000),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+@dataclass
+class Ticket:
+    """Admission decision for a single request."""
+
+    admitted: bool
+    priority: str | None = None
+    retry_after: int = 0
+    started: float = 0.0
+
+
+class AdmissionController:
+    """Global + per-class adaptive concurrency limits with priority shedding."""
+
+    # Fraction of the global limit each class may occupy. Lower-priority
+    # classes hit their ceiling first and are therefore shed first.
+    GLOBAL_SHARE: ClassVar[dict[str, float]] = {
+        CRITICAL: 1.0,
+        STANDARD: 0.85,
+        BULK: 0.6,
+    }
+    # Loop-lag multiple (of the threshold) above which a class is shed outright.
+    LAG_SHED_FACTOR: ClassVar[dict[str, float | None]] = {
+        CRITICAL: None,
+        STANDARD: 2.0,
+        BULK: 1.0,
+    }
+    RETRY_AFTER: ClassVar[dict[str, int]] = {CRITICAL: 1, STANDARD: 2, BULK: 10}
+
+    def __init__(self):
+        max_limit = settings.ADMISSION_MAX_CONCURRENCY
+        target = settings.ADMISSION_TARGET_LATENCY_MS / 1000
+        self.enabled = settings.ADMISSION_ENABLED
+        self.lag_threshold = settings.ADMISSION_LAG_THRESHOLD_MS / 1000
+        self.global_limit = AdaptiveLimit(
+            "global",
+            max_limit / 2,
+            settings.ADMISSION_MIN_CONCURRENCY,
+            max_limit,
+            target,
+        )
+        self.classes = {
+            CRITICAL: AdaptiveLimit(CRITICAL, max_limit / 2, 8, max_limit, target * 2),
+            STANDARD: AdaptiveLimit(STANDARD, max_limit / 2, 4, max_limit, target),
+            BULK: AdaptiveLimit(
+                BULK, max(2, max_limit // 16), 1, max(2, max_limit // 4), target * 10
+            ),
+        }
+
+    @property
+    def loop_lag(self) -> float:
+        return watchdog.lag
+
+    # ----- classification -----
+    @staticmethod
+    def classify(path: str) -> str | None:
+        if path.startswith(EXEMPT_PATHS):
+            return None
+        for prefix, priority in ROUTE_CLASSES:
+            if path.startswith(prefix):
+                return priority
+        return STANDARD
+
+    # ----- acquire / release -----
+    def try_acquire(self, path: str) -> Ticket:
+        priority = self.classify(path) if self.enabled else None
+        if priority is None:
+            return Ticket(admitted=True)
+
+        cls = self.classes[priority]
+        ceiling = self.global_limit.limit * self.GLOBAL_SHARE[priority]
+        lag_factor = self.LAG_SHED_FACTOR[priority]
+        lagging = (
+            lag_factor is not None and self.loop_lag > self.lag_threshold * lag_factor
+        )
+
+        if lagging or self.global_limit.in_flight >= ceiling or not cls.has_capacity():
+            cls.rejected += 1
+            self.global_limit.rejected += 1
+            return Ticket(
+                admitted=False,
+                priority=priority,
+                retry_after=self.RETRY_AFTER[priority],
+            )
+
+        cls.in_flight += 1
+        cls.admitted += 1
+        self.global_limit.in_flight += 1
+        self.global_limit.admitted += 1
+        return Ticket(admitted=True, priority=priority, started=time.monotonic())
+
+    def release(self, ticket: Ticket, timed_out: bool = False):
+        """
+        Free the ticket's slots and feed the limits one sample. Only the
+        gateway's own signals count as congestion: latency, loop lag, and
+        requests that ran out of time here. Upstream error statuses do not.
+        """
+        if ticket.priority is None:
+            return
+        latency = time.monotonic() - ticket.started
+        cls = self.classes[ticket.priority]
+        # Judge against the class target so slow-by-nature bulk work does not
+        # drag the global limit down on its own.
+        congested = (
+            timed_out
+            or latency > cls.target_latency
+            or self.loop_lag > self.lag_threshold
+        )
+        cls.in_flight -= 1
+        self.global_limit.in_flight -= 1
+        cls.on_sample(congested)
+        self.global_limit.on_sample(congested)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loop_lag_ms": round(self.loop_lag * 1000, 2),
+            "lag_threshold_ms": int(self.lag_threshold * 1000),
+            "global": self.global_limit.snapshot(),
+            "classes": {name: c.snapshot() for name, c in self.classes.items()},
+        }
+
+
+# ----- middleware -----
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware: admits the request against the adaptive limits,
+    or answers 503 with Retry-After at once when over capacity. The slot is
+    released when the last body message is sent (or the request fails or
+    is cancelled), and the latency sample is taken then too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        ticket = admission.try_acquire(scope["path"])
+        if not ticket.admitted:
+            logger.warning(
+                {
+                    "event": "load_shed",
+                    "path": scope["path"],
+                    "priority": ticket.priority,
+                }
+            )
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Gateway is over capacity, please retry later"},
+                headers={"Retry-After": str(ticket.retry_after)},
+            )
+            return await response(scope, receive, send)
+
+        released = False
+        timed_out = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                admission.release(ticket, timed_out=timed_out or deadline.expired())
+
+        async def tracked_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                release()
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        except TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            # Errors, and cancellation when the client goes away.
+            release()
+
+
+admission = AdmissionController()
@@ -0,0 +1,76 @@
+"""
+Buffered request analytics.
+
+The request middleware only bumps in-memory counters; a background task
+flushes them to Redis in a single pipelined round trip, so no Redis call
+ever runs on the request path.
+"""
+
+import asyncio
+from collections import Counter
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class AnalyticsBuffer:
+    def __init__(self):
+        self.interval = settings.ANALYTICS_FLUSH_INTERVAL_S
+        self._hits = Counter()
+        self._statuses = Counter()
+        self._task = None
+        self._failing = False
+
+    def record(self, path: str, status: int):
+        self._hits[path] += 1
+        self._statuses[(path, status)] += 1
+
+    async def flush(self):
+        if not self._hits:
+            return
+        hits, statuses = self._hits, self._statuses
+        self._hits, self._statuses = Counter(), Counter()
+
+        r = get_async_redis()
+        if r is None:
+            return
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                for path, count in hits.items():
+                    pipe.incrby(f"stats:hits:{path}", count)
+                for (path, status), count in statuses.items():
+                    pipe.hincrby(f"stats:status:{path}", status, count)
+                await pipe.execute()
+            self._failing = False
+        except RedisError as e:
+            # Log once per outage rather than on every flush.
+            if not self._failing:
+                logger.warning({"event": "analytics_error", "error": str(e)})
+            self._failing = True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+analytics = AnalyticsBuffer()
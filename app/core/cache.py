@@ -0,0 +1,271 @@
+"""
+Gateway response cache.
+
+Upstream responses are stored in Redis so every replica shares them. An
+entry is served until its TTL expires; once it is older than
+`refresh_ahead` of its TTL, the read still hits and a background reload
+replaces it, so busy keys never go cold. Concurrent misses for one key on
+this replica share a single upstream call. Only 200 responses are cached.
+Without Redis every lookup falls through to the loader.
+"""
+
+import asyncio
+import base64
+import json
+import time
+from collections.abc import Awaitable, Callable
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from redis.exceptions import RedisError
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis_client import get_async_redis
+from app.core.upstreams import UPSTREAM_ERRORS
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+cache_lookups_total = metrics.counter(
+    "gateway_cache_lookups_total",
+    "Response cache lookups by cache and outcome (hit, miss)",
+)
+cache_hit_ratio = metrics.gauge(
+    "gateway_cache_hit_ratio", "Response cache hit ratio since startup by cache"
+)
+cache_refreshes_total = metrics.counter(
+    "gateway_cache_refreshes_total",
+    "Background refreshes by cache and outcome (stored, skipped, error)",
+)
+
+
+class CachedResponse:
+    def __init__(self, status: int, body: bytes, media_type: str, stored_at: float):
+        self.status = status
+        self.body = body
+        self.media_type = media_type
+        self.stored_at = stored_at
+
+    @classmethod
+    def from_upstream(cls, res) -> "CachedResponse":
+        return cls(
+            res.status_code,
+            res.content,
+            res.headers.get("content-type", "application/json"),
+            time.time(),
+        )
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        data = json.loads(raw)
+        return cls(data["s"], base64.b64decode(data["b"]), data["m"], data["t"])
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {
+                "s": self.status,
+                "b": base64.b64encode(self.body).decode(),
+                "m": self.media_type,
+                "t": self.stored_at,
+            }
+        )
+
+    def to_response(self, cache_status: str) -> Response:
+        return Response(
+            content=self.body,
+            status_code=self.status,
+            media_type=self.media_type,
+            headers={"x-cache": cache_status},
+        )
+
+
+Loader = Callable[[], Awaitable]
+# What a loader can fail with: the upstream call, or an answer it rejects.
+LOAD_ERRORS = (*UPSTREAM_ERRORS, HTTPException, ValueError)
+
+# Every cache by name, for the admin routes.
+caches: dict[str, "ResponseCache"] = {}
+
+
+class ResponseCache:
+    def __init__(self, name: str, ttl_s: float, refresh_ahead: float | None = None):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.refresh_ahead = (
+            settings.CACHE_REFRESH_AHEAD if refresh_ahead is None else refresh_ahead
+        )
+        self.hits = 0
+        self.misses = 0
+        self._loading: dict[str, asyncio.Task] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+        # Bumped on invalidate so a load started earlier cannot store stale data.
+        self._generation: dict[str, int] = {}
+        self._store_down = False
+        caches[name] = self
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _epoch_key(self, key: str) -> str:
+        return f"cache:{self.name}:epoch:{key}"
+
+    def _count(self, outcome: str):
+        if outcome == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        cache_lookups_total.inc(cache=self.name, outcome=outcome)
+        cache_hit_ratio.set(
+            round(self.hits / (self.hits + self.misses), 4), cache=self.name
+        )
+
+    def _store_error(self, e: Exception):
+        # One log line per outage, not per request.
+        if not self._store_down:
+            logger.warning(
+                {"event": "cache_store_error", "cache": self.name, "error": str(e)}
+            )
+        self._store_down = True
+
+    # ----- storage -----
+    async def peek(self, key: str) -> CachedResponse | None:
+        try:
+            raw = await get_async_redis().get(self._redis_key(key))
+        except RedisError as e:
+            self._store_error(e)
+            return None
+        self._store_down = False
+        return CachedResponse.loads(raw) if raw is not None else None
+
+    async def put(self, key: str, entry: CachedResponse):
+        try:
+            await get_async_redis().set(
+                self._redis_key(key), entry.dumps(), ex=max(1, int(self.ttl_s))
+            )
+        except RedisError as e:
+            self._store_error(e)
+
+    async def variant_key(self, key: str, variant: str) -> str:
+        """
+        Key for a derived form of `key` (e.g. a field projection), stored as
+        an entry of its own. invalidate(key) retires every variant at once
+        by moving `key` to a new epoch. Epochs are timestamps, never reused,
+        and each read keeps the current one alive for twice the TTL, so it
+        outlives every variant stored under it.
+        """
+        epoch_key = self._epoch_key(key)
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipe:
+                pipe.set(epoch_key, time.time_ns(), nx=True)
+                pipe.expire(epoch_key, self._epoch_ttl())
+                pipe.get(epoch_key)
+                *_, epoch = await pipe.execute()
+        except RedisError as e:
+            self._store_error(e)
+            epoch = None
+        return f"{key}@{epoch.decode() if epoch else 0}|{variant}"
+
+    def _epoch_ttl(self) -> int:
+        return max(1, int(self.ttl_s)) * 2
+
+    async def invalidate(self, key: str):
+        self._generation[key] = self._generation.get(key, 0) + 1
+        task = self._refreshing.pop(key, None)
+        if task is not None:
+            task.cancel()
+        try:
+            redis = get_async_redis()
+            await redis.delete(self._redis_key(key))
+            await redis.set(self._epoch_key(key), time.time_ns(), ex=self._epoch_ttl())
+        except RedisError as e:
+            self._store_error(e)
+
+    # ----- loading -----
+    async def load(self, key: str, loader: Loader) -> CachedResponse:
+        """Call the upstream once for `key` and store the result if cacheable."""
+        generation = self._generation.get(key, 0)
+        entry = CachedResponse.from_upstream(await loader())
+        if (
+            entry.status == 200
+            and self.ttl_s > 0
+            and self._generation.get(key, 0) == generation
+        ):
+            await self.put(key, entry)
+        return entry
+
+    async def _load_shared(self, key: str, loader: Loader) -> CachedResponse:
+        # The load runs as its own task so a caller that disconnects does
+        # not cancel it for the others waiting on the same key.
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = deadline.detached(self.load(key, loader))
+            task.add_done_callback(lambda t: self._loaded(key, t))
+        try:
+            # Each waiter gives up at its own request's deadline.
+            return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+        except TimeoutError:
+            if deadline.expired():
+                raise deadline.DeadlineExceeded("Request deadline exceeded")
+            raise
+
+    def _loaded(self, key: str, task: asyncio.Task):
+        self._loading.pop(key, None)
+        # Retrieve the error even if every waiter has gone away.
+        if not task.cancelled():
+            task.exception()
+
+    def _refresh(self, key: str, loader: Loader):
+        if key in self._refreshing:
+            return
+
+        async def run():
+            try:
+                entry = await self.load(key, loader)
+                outcome = "stored" if entry.status == 200 else "skipped"
+                cache_refreshes_total.inc(cache=self.name, outcome=outcome)
+            except asyncio.CancelledError:
+                raise
+            except LOAD_ERRORS as e:
+                cache_refreshes_total.inc(cache=self.name, outcome="error")
+                logger.warning(
+                    {
+                        "event": "cache_refresh_error",
+                        "cache": self.name,
+                        "error": str(e),
+                    }
+                )
+            finally:
+                if self._refreshing.get(key) is asyncio.current_task():
+                    del self._refreshing[key]
+
+        self._refreshing[key] = deadline.detached(run())
+
+    async def get(self, key: str, loader: Loader) -> Response:
+        """
+        Serve `key` from cache, loading it through `loader` (an async callable
+        returning an httpx response) on a miss. Sets `x-cache: hit|miss`.
+        A TTL of 0 disables the cache.
+        """
+        if self.ttl_s <= 0:
+            return CachedResponse.from_upstream(await loader()).to_response("miss")
+        entry = await self.peek(key)
+        if entry is not None:
+            self._count("hit")
+            if time.time() - entry.stored_at >= self.ttl_s * self.refresh_ahead:
+                self._refresh(key, loader)
+            return entry.to_response("hit")
+        self._count("miss")
+        return (await self._load_shared(key, loader)).to_response("miss")
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_s": self.ttl_s,
+            "refresh_ahead": self.refresh_ahead,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "refreshing": len(self._refreshing),
+        }
@@ -8,6 +8,190 @@ class Settings(BaseSettings):
     JWT_SECRET: str = os.getenv("JWT_SECRET", "myesi_secret_key")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
 
+    # Admission control / load shedding
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "512"))
+    ADMISSION_MIN_CONCURRENCY: int = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "16"))
+    ADMISSION_TARGET_LATENCY_MS: int = int(
+        os.getenv("ADMISSION_TARGET_LATENCY_MS", "500")
+    )
+    ADMISSION_LAG_THRESHOLD_MS: int = int(
+        os.getenv("ADMISSION_LAG_THRESHOLD_MS", "100")
+    )
+
+    # Event-loop watchdog
+    WATCHDOG_INTERVAL_MS: int = int(os.getenv("WATCHDOG_INTERVAL_MS", "100"))
+    WATCHDOG_STALL_THRESHOLD_MS: int = int(
+        os.getenv("WATCHDOG_STALL_THRESHOLD_MS", "250")
+    )
+
+    # Buffered request analytics
+    ANALYTICS_FLUSH_INTERVAL_S: float = float(
+        os.getenv("ANALYTICS_FLUSH_INTERVAL_S", "1.0")
+    )
+
+    # Upstream services: comma-separated replica URLs per service. The
+    # optional UPSTREAMS_FILE (YAML, service name -> {endpoints: [...],
+    # health_path: ...}) overrides these and is hot-reloaded on change.
+    USER_SERVICE_URLS: str = os.getenv("USER_SERVICE_URLS", "http://user-service:8001")
+    SBOM_SERVICE_URLS: str = os.getenv("SBOM_SERVICE_URLS", "http://sbom-service:8002")
+    VULN_SERVICE_URLS: str = os.getenv(
+        "VULN_SERVICE_URLS", "http://vulnerability-service:8003"
+    )
+    RISK_SERVICE_URLS: str = os.getenv("RISK_SERVICE_URLS", "http://risk-service:8004")
+    BILLING_SERVICE_URLS: str = os.getenv(
+        "BILLING_SERVICE_URLS", "http://billing-service:8005"
+    )
+    UPSTREAMS_FILE: str = os.getenv("UPSTREAMS_FILE", "upstreams.yaml")
+    UPSTREAM_LB_POLICY: str = os.getenv("UPSTREAM_LB_POLICY", "peak_ewma")
+    UPSTREAM_EWMA_TAU_S: float = float(os.getenv("UPSTREAM_EWMA_TAU_S", "10"))
+    UPSTREAM_MAX_FAILURES: int = int(os.getenv("UPSTREAM_MAX_FAILURES", "3"))
+    UPSTREAM_EJECT_SECONDS: float = float(os.getenv("UPSTREAM_EJECT_SECONDS", "30"))
+    UPSTREAM_HEALTH_INTERVAL_S: float = float(
+        os.getenv("UPSTREAM_HEALTH_INTERVAL_S", "5")
+    )
+    UPSTREAM_HEALTH_TIMEOUT_S: float = float(
+        os.getenv("UPSTREAM_HEALTH_TIMEOUT_S", "2")
+    )
+    UPSTREAM_MAX_CONNECTIONS: int = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "500"))
+    UPSTREAM_MAX_KEEPALIVE: int = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "100"))
+
+    # Hedged requests: "route[:percentile]" list of hedge-enabled routes
+    HEDGE_ROUTES: str = os.getenv(
+        "HEDGE_ROUTES", "sbom.get,vuln.by_sbom,risk.score,projects.get"
+    )
+    HEDGE_DEFAULT_PERCENTILE: float = float(os.getenv("HEDGE_DEFAULT_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY_MS: int = int(os.getenv("HEDGE_MIN_DELAY_MS", "20"))
+    HEDGE_BUDGET_RATIO: float = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+    HEDGE_BURST: float = float(os.getenv("HEDGE_BURST", "10"))
+
+    # Batch endpoints
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_PARALLELISM: int = int(os.getenv("BATCH_PARALLELISM", "16"))
+    BATCH_MAX_PARALLELISM: int = int(os.getenv("BATCH_MAX_PARALLELISM", "64"))
+
+    # List pagination: comma-separated list routes whose upstream honours
+    # offset/limit (others are skipped/truncated by the gateway itself)
+    PAGE_DEFAULT_LIMIT: int = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+    PAGE_MAX_LIMIT: int = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+    PAGINATED_UPSTREAMS: str = os.getenv("PAGINATED_UPSTREAMS", "")
+
+    # Idempotency-Key store
+    IDEMPOTENCY_ENABLED: bool = (
+        os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+    )
+    IDEMPOTENCY_TTL_S: int = int(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+    IDEMPOTENCY_PENDING_TTL_S: int = int(os.getenv("IDEMPOTENCY_PENDING_TTL_S", "300"))
+    IDEMPOTENCY_WAIT_S: float = float(os.getenv("IDEMPOTENCY_WAIT_S", "60"))
+    IDEMPOTENCY_POLL_INTERVAL_S: float = float(
+        os.getenv("IDEMPOTENCY_POLL_INTERVAL_S", "0.1")
+    )
+    IDEMPOTENCY_SPOOL_BYTES: int = int(
+        os.getenv("IDEMPOTENCY_SPOOL_BYTES", str(1024 * 1024))
+    )
+    IDEMPOTENCY_MAX_RESPONSE_BYTES: int = int(
+        os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024))
+    )
+
+    # Durable Stripe webhook queue
+    WEBHOOK_QUEUE_PATH: str = os.getenv("WEBHOOK_QUEUE_PATH", "data/webhooks.db")
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "20"))
+    WEBHOOK_BACKOFF_BASE_S: float = float(os.getenv("WEBHOOK_BACKOFF_BASE_S", "1"))
+    WEBHOOK_BACKOFF_MAX_S: float = float(os.getenv("WEBHOOK_BACKOFF_MAX_S", "300"))
+    WEBHOOK_DELIVERY_TIMEOUT_S: float = float(
+        os.getenv("WEBHOOK_DELIVERY_TIMEOUT_S", "30")
+    )
+    WEBHOOK_RETENTION_S: int = int(os.getenv("WEBHOOK_RETENTION_S", str(7 * 86400)))
+    WEBHOOK_MAX_BODY_BYTES: int = int(
+        os.getenv("WEBHOOK_MAX_BODY_BYTES", str(512 * 1024))
+    )
+    # Undelivered events kept at most; beyond this Stripe is told to retry later
+    WEBHOOK_QUEUE_MAX_DEPTH: int = int(os.getenv("WEBHOOK_QUEUE_MAX_DEPTH", "10000"))
+    # Stripe endpoint signing secrets (comma-separated while rotating them).
+    # The first one also re-signs events forwarded to billing-service.
+    # Unset: only the Stripe-Signature header's shape and age are checked.
+    STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+    STRIPE_SIGNATURE_TOLERANCE_S: int = int(
+        os.getenv("STRIPE_SIGNATURE_TOLERANCE_S", "300")
+    )
+
+    # Response caches: entries are refreshed in the background once older
+    # than CACHE_REFRESH_AHEAD of their TTL
+    CACHE_REFRESH_AHEAD: float = float(os.getenv("CACHE_REFRESH_AHEAD", "0.8"))
+    GITHUB_REPOS_CACHE_TTL_S: int = int(os.getenv("GITHUB_REPOS_CACHE_TTL_S", "600"))
+    # Scan results change while an SBOM is being processed: keep these short
+    VULN_CACHE_TTL_S: int = int(os.getenv("VULN_CACHE_TTL_S", "30"))
+    RISK_CACHE_TTL_S: int = int(os.getenv("RISK_CACHE_TTL_S", "30"))
+    SBOM_RECENT_CACHE_TTL_S: int = int(os.getenv("SBOM_RECENT_CACHE_TTL_S", "30"))
+    # An SBOM document never changes once stored
+    SBOM_PROJECTION_CACHE_TTL_S: int = int(
+        os.getenv("SBOM_PROJECTION_CACHE_TTL_S", "3600")
+    )
+
+    # Post-upload cache warming
+    CACHE_WARMING_ENABLED: bool = (
+        os.getenv("CACHE_WARMING_ENABLED", "true").lower() == "true"
+    )
+    CACHE_WARM_CONCURRENCY: int = int(os.getenv("CACHE_WARM_CONCURRENCY", "4"))
+    CACHE_WARM_QUEUE_SIZE: int = int(os.getenv("CACHE_WARM_QUEUE_SIZE", "256"))
+
+    # SBOM upload deduplication by content digest
+    SBOM_DEDUPE_ENABLED: bool = (
+        os.getenv("SBOM_DEDUPE_ENABLED", "true").lower() == "true"
+    )
+    SBOM_DEDUPE_TTL_S: int = int(os.getenv("SBOM_DEDUPE_TTL_S", str(7 * 86400)))
+    SBOM_DEDUPE_MAX_PER_PROJECT: int = int(
+        os.getenv("SBOM_DEDUPE_MAX_PER_PROJECT", "100")
+    )
+    # Larger JSON documents are hashed byte-for-byte instead of canonicalized.
+    # Canonicalizing streams (memory stays flat) but costs CPU, ~0.1 s per MiB
+    SBOM_CANONICAL_MAX_BYTES: int = int(
+        os.getenv("SBOM_CANONICAL_MAX_BYTES", str(32 * 1024 * 1024))
+    )
+
+    # Resumable chunked uploads
+    UPLOAD_SPOOL_DIR: str = os.getenv("UPLOAD_SPOOL_DIR", "data/uploads")
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024**3)))
+    UPLOAD_MAX_CHUNK_BYTES: int = int(
+        os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(64 * 1024**2))
+    )
+    UPLOAD_SESSION_TTL_S: int = int(os.getenv("UPLOAD_SESSION_TTL_S", str(86400)))
+    UPLOAD_GC_INTERVAL_S: float = float(os.getenv("UPLOAD_GC_INTERVAL_S", "600"))
+    UPLOAD_FINALIZE_TIMEOUT_S: float = float(
+        os.getenv("UPLOAD_FINALIZE_TIMEOUT_S", "900")
+    )
+
+    # Plan-aware quotas (plan looked up from billing-service, cached locally)
+    PLAN_QUOTAS_ENABLED: bool = (
+        os.getenv("PLAN_QUOTAS_ENABLED", "true").lower() == "true"
+    )
+    # JSON overrides, e.g. {"pro": {"upload": {"user": "500/hour"}}}
+    PLAN_QUOTAS: str = os.getenv("PLAN_QUOTAS", "")
+    DEFAULT_PLAN: str = os.getenv("DEFAULT_PLAN", "free")
+    PLAN_CACHE_TTL_S: int = int(os.getenv("PLAN_CACHE_TTL_S", "300"))
+    # Users kept in the plan cache; the least recently used go first
+    PLAN_CACHE_MAX_ENTRIES: int = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "10000"))
+    PLAN_LOOKUP_TIMEOUT_S: float = float(os.getenv("PLAN_LOOKUP_TIMEOUT_S", "0.5"))
+
+    # Vulnerability event streams (SSE)
+    SSE_BUFFER_SIZE: int = int(os.getenv("SSE_BUFFER_SIZE", "500"))
+    SSE_HEARTBEAT_S: float = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+    SSE_CLIENT_QUEUE_SIZE: int = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "1000"))
+    SSE_IDLE_GRACE_S: float = float(os.getenv("SSE_IDLE_GRACE_S", "60"))
+
+    # Graceful draining
+    DRAIN_GRACE_S: float = float(os.getenv("DRAIN_GRACE_S", "25"))
+    DRAIN_FLUSH_TIMEOUT_S: float = float(os.getenv("DRAIN_FLUSH_TIMEOUT_S", "5"))
+    DRAIN_RETRY_AFTER_S: int = int(os.getenv("DRAIN_RETRY_AFTER_S", "5"))
+    # Reconnect delay range (ms) handed to SSE clients, e.g. "1000-15000".
+    SSE_DRAIN_RETRY_MS: str = os.getenv("SSE_DRAIN_RETRY_MS", "1000-15000")
+
+    # Request deadlines (client header in ms, per-route defaults in seconds)
+    DEADLINE_HEADER: str = os.getenv("DEADLINE_HEADER", "X-Request-Timeout-Ms")
+    DEADLINE_DEFAULT_S: float = float(os.getenv("DEADLINE_DEFAULT_S", "30"))
+    DEADLINE_BATCH_S: float = float(os.getenv("DEADLINE_BATCH_S", "60"))
+    DEADLINE_UPLOAD_S: float = float(os.getenv("DEADLINE_UPLOAD_S", "900"))
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,209 @@
+"""
+End-to-end request deadlines.
+
+Every request gets a deadline: the route's default budget, shortened by the
+client's X-Request-Timeout-Ms header when that is sooner. The deadline
+lives in a context variable, so every upstream call made for the request
+is capped at the time left (see app.core.upstreams) and passes the remaining
+budget on in the same header. A request whose budget is spent fails with
+504 instead of starting more backend work.
+
+DeadlineMiddleware also cancels the request's work the moment the client
+disconnects, so backends stop computing answers nobody will read. Such
+requests are logged with status 499.
+"""
+
+import asyncio
+import contextvars
+import time
+
+from fastapi import HTTPException, Request
+from fastapi.exception_handlers import http_exception_handler
+from starlette.datastructures import Headers
+
+from app.core.analytics import analytics
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Path prefixes -> default budget in seconds (None: no deadline).
+# First match wins; everything else gets DEADLINE_DEFAULT_S.
+ROUTE_DEADLINES = [
+    ("/api/vulnerability/stream", None),
+    ("/api/gateway/", None),
+    ("/api/sbom/upload", settings.DEADLINE_UPLOAD_S),
+    ("/api/sbom/batch", settings.DEADLINE_BATCH_S),
+    ("/api/vulnerability/batch", settings.DEADLINE_BATCH_S),
+]
+
+# Monotonic time by which the current request must be answered.
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+deadline_exceeded_total = metrics.counter(
+    "gateway_deadline_exceeded_total", "Upstream calls refused or cut off by deadline"
+)
+client_disconnects_total = metrics.counter(
+    "gateway_client_disconnects_total", "Requests cancelled because the client left"
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out."""
+
+
+def route_budget(path: str) -> float | None:
+    for prefix, budget in ROUTE_DEADLINES:
+        if path.startswith(prefix):
+            return budget
+    return settings.DEADLINE_DEFAULT_S
+
+
+def parse_budget(value: str | None) -> float | None:
+    """X-Request-Timeout-Ms value -> seconds; None when absent or invalid."""
+    try:
+        ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    return ms / 1000 if ms > 0 else None
+
+
+def remaining() -> float | None:
+    """Seconds left for the current request, or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def detached(coro) -> asyncio.Task:
+    """
+    create_task() for background work started from a request (shared cache
+    loads, refreshes, stream readers): it must outlive the request and so
+    runs without the request's deadline.
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return asyncio.create_task(coro, context=context)
+
+
+# ----- exception handlers -----
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return await http_exception_handler(
+        request, HTTPException(status_code=504, detail="Request deadline exceeded")
+    )
+
+
+async def deadline_aware_http_exception_handler(request: Request, exc: HTTPException):
+    # Routes wrap upstream failures, a spent budget included, in a generic
+    # 500; report those as the gateway timeout they are.
+    if exc.status_code == 500 and expired():
+        exc = HTTPException(status_code=504, detail="Request deadline exceeded")
+    return await http_exception_handler(request, exc)
+
+
+# ----- middleware -----
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware: sets the request's deadline and cancels the
+    request when the client disconnects before the response is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget = route_budget(scope["path"])
+        requested = parse_budget(Headers(scope=scope).get(settings.DEADLINE_HEADER))
+        if requested is not None:
+            budget = requested if budget is None else min(budget, requested)
+        token = _deadline.set(time.monotonic() + budget if budget is not None else None)
+        try:
+            await self._run(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+
+    async def _run(self, scope, receive, send):
+        started = time.monotonic()
+        # One slot keeps request bodies flowing at the app's pace.
+        inbox: asyncio.Queue = asyncio.Queue(maxsize=1)
+        # "left": response bytes still due, when Content-Length is known.
+        state = {
+            "started": False,
+            "complete": False,
+            "disconnected": False,
+            "left": None,
+        }
+
+        async def watch():
+            # The only reader of the real receive(): once the body is in, it
+            # just waits for the server to report a disconnect.
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not state["complete"]:
+                        state["disconnected"] = True
+                        app_task.cancel()
+                    await inbox.put(message)
+                    return
+                await inbox.put(message)
+
+        async def app_receive():
+            if state["disconnected"] and inbox.empty():
+                return {"type": "http.disconnect"}
+            return await inbox.get()
+
+        async def app_send(message):
+            if message["type"] == "http.response.start":
+                state["started"] = True
+                length = Headers(raw=message.get("headers", [])).get("content-length")
+                state["left"] = int(length) if length is not None else None
+            elif message["type"] == "http.response.body":
+                if state["left"] is not None:
+                    state["left"] -= len(message.get("body", b""))
+                # Clients may hang up as soon as they hold the whole body.
+                if not message.get("more_body", False) or state["left"] == 0:
+                    state["complete"] = True
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, app_receive, app_send))
+        watcher = asyncio.create_task(watch())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not state["disconnected"] or asyncio.current_task().cancelling():
+                raise
+            client_disconnects_total.inc()
+            # A started response was logged when it started (e.g. streams).
+            if not state["started"]:
+                self._log_disconnect(scope, started)
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    def _log_disconnect(scope, started: float):
+        client = scope.get("client")
+        # Same shape as the access log line, so reports count these too.
+        logger.info(
+            {
+                "event": "request",
+                "request_id": scope.get("state", {}).get("request_id"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": 499,
+                "latency_ms": int((time.monotonic() - started) * 1000),
+                "client_ip": client[0] if client else "unknown",
+            }
+        )
+        analytics.record(scope["path"], 499)
@@ -0,0 +1,215 @@
+"""
+Graceful connection draining.
+
+Draining takes the gateway out of service without dropping work:
+1. readiness turns not-ready and new requests are refused with 503;
+2. in-flight requests get up to DRAIN_GRACE_S to finish (long-lived SSE
+   streams are not waited for, they would only run the grace out);
+3. SSE clients are told to reconnect after a random delay within
+   SSE_DRAIN_RETRY_MS, so they come back spread out rather than at once;
+4. buffered analytics, due webhook deliveries and queued log records
+   are flushed.
+
+It starts on SIGTERM (the process then exits as usual once drained) or
+from POST /api/gateway/drain. A second SIGTERM while draining exits at once.
+"""
+
+import asyncio
+import signal
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.core.admission import EXEMPT_PATHS
+from app.core.analytics import analytics
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.sse import sse_hub
+from app.core.webhook_queue import webhook_queue
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Still served while draining: liveness, readiness and the admin API.
+SERVED_WHILE_DRAINING = ("/", "/ready")
+SERVED_PREFIX_WHILE_DRAINING = "/api/gateway/"
+# Not counted as in flight: the long-lived streams that hold no admission
+# slot either. The drain closes them itself, after the grace period.
+UNTRACKED_PATHS = EXEMPT_PATHS
+
+draining_gauge = metrics.gauge("gateway_draining", "1 while the gateway is draining")
+
+
+def _retry_range() -> tuple:
+    low, _, high = settings.SSE_DRAIN_RETRY_MS.partition("-")
+    return int(low), int(high or low)
+
+
+class Drainer:
+    def __init__(self):
+        self.draining = False
+        self.in_flight = 0
+        self.started_at: float | None = None
+        self.report: dict | None = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._previous_handler = None
+        self._exit_requested = False
+
+    # ----- request tracking -----
+    def refuses(self, path: str) -> bool:
+        if not self.draining:
+            return False
+        return not (
+            path in SERVED_WHILE_DRAINING
+            or path.startswith(SERVED_PREFIX_WHILE_DRAINING)
+        )
+
+    def enter(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def exit(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle.set()
+
+    # ----- draining -----
+    def start(self) -> asyncio.Task:
+        """Begin draining (idempotent); returns the drain task."""
+        if self._task is None:
+            self.draining = True
+            self.started_at = time.time()
+            draining_gauge.set(1)
+            self._task = asyncio.create_task(self._drain())
+        return self._task
+
+    async def _drain(self):
+        logger.info({"event": "drain_started", "in_flight": self.in_flight})
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._idle.wait(), settings.DRAIN_GRACE_S)
+        except TimeoutError:
+            logger.warning(
+                {"event": "drain_grace_expired", "in_flight": self.in_flight}
+            )
+        abandoned = self.in_flight
+
+        sse_clients = sse_hub.close(retry_ms=_retry_range())
+        await analytics.flush()
+        webhooks = await webhook_queue.flush(settings.DRAIN_FLUSH_TIMEOUT_S)
+
+        self.report = {
+            "duration_s": round(time.monotonic() - start, 3),
+            "abandoned_requests": abandoned,
+            "sse_clients_redirected": sse_clients,
+            "webhooks_flushed": webhooks,
+        }
+        logger.info({"event": "drain_complete", **self.report})
+        # Log records are written by loguru's queue thread: wait for them.
+        await logger.complete()
+
+    async def drain(self):
+        await self.start()
+
+    # ----- signals -----
+    def install(self):
+        """
+        Drain on SIGTERM before handing the signal to the server's own
+        handler. Call from startup, after the server installed its handlers.
+        """
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._previous_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+        except ValueError:
+            # Not the main thread (e.g. under a test client): no signals.
+            self._previous_handler = None
+
+    def _on_sigterm(self, sig, frame):
+        if self._exit_requested or (self._task is not None and self._task.done()):
+            self._exit(sig, frame)
+            return
+        self._exit_requested = True
+        self._loop.call_soon_threadsafe(self._drain_then_exit, sig, frame)
+
+    def _drain_then_exit(self, sig, frame):
+        self.start().add_done_callback(lambda _: self._exit(sig, frame))
+
+    def _exit(self, sig, frame):
+        previous = self._previous_handler
+        if callable(previous):
+            previous(sig, frame)
+        else:
+            signal.signal(sig, previous or signal.SIG_DFL)
+            signal.raise_signal(sig)
+
+    def request_exit(self):
+        """Exit the process the way SIGTERM would, once drained."""
+        self._exit_requested = True
+        self._drain_then_exit(signal.SIGTERM, None)
+
+    def snapshot(self) -> dict:
+        return {
+            "draining": self.draining,
+            "started_at": self.started_at,
+            "in_flight": self.in_flight,
+            "complete": self._task is not None and self._task.done(),
+            "report": self.report,
+        }
+
+
+# ----- middleware -----
+class DrainMiddleware:
+    """
+    Pure ASGI middleware: answers 503 to new requests once draining has
+    begun, so clients retry against another instance. Other requests count
+    as in flight until their last body message is sent, so streamed
+    responses are waited for too, or until the client goes away. SSE
+    streams (UNTRACKED_PATHS) are not counted.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if drainer.refuses(scope["path"]):
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Gateway is shutting down, please retry"},
+                headers={
+                    "Retry-After": str(settings.DRAIN_RETRY_AFTER_S),
+                    "Connection": "close",
+                },
+            )
+            return await response(scope, receive, send)
+        if scope["path"].startswith(UNTRACKED_PATHS):
+            return await self.app(scope, receive, send)
+
+        drainer.enter()
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                drainer.exit()
+
+        async def tracked_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                finish()
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            # Errors, and cancellation when the client disconnects.
+            finish()
+
+
+drainer = Drainer()
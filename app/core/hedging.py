@@ -0,0 +1,177 @@
+"""
+Hedged requests for read-only upstream calls.
+
+If the first attempt of a hedge-enabled route has not answered within the
+route's recent latency percentile, a second attempt is sent to a different
+replica. The first good response wins and the other attempt is cancelled.
+Hedges draw from a global token budget so a slow backend cannot double the
+gateway's upstream load.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.upstreams import NoHealthyUpstream, upstreams
+
+hedges_total = metrics.counter(
+    "gateway_hedged_requests_total",
+    "Hedging decisions by route (sent, won, budget_exhausted, no_replica)",
+)
+hedge_delay_seconds = metrics.gauge(
+    "gateway_hedge_delay_seconds", "Current hedge trigger delay by route"
+)
+
+
+def _parse_routes(spec: str) -> dict[str, float]:
+    """'sbom.get:95,risk.score' -> {'sbom.get': 95.0, 'risk.score': default}"""
+    routes = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, pct = item.partition(":")
+        routes[name] = float(pct) if pct else settings.HEDGE_DEFAULT_PERCENTILE
+    return routes
+
+
+class LatencyWindow:
+    """Recent latencies of one route; percentiles are recomputed lazily."""
+
+    def __init__(self, size: int = 256, refresh_every: int = 16):
+        self.samples = deque(maxlen=size)
+        self.refresh_every = refresh_every
+        self._since_refresh = 0
+        self._sorted = []
+
+    def observe(self, latency: float):
+        self.samples.append(latency)
+        self._since_refresh += 1
+        if self._since_refresh >= self.refresh_every:
+            self._sorted = sorted(self.samples)
+            self._since_refresh = 0
+
+    def percentile(self, pct: float) -> float | None:
+        if len(self._sorted) < self.refresh_every:
+            return None
+        idx = min(len(self._sorted) - 1, int(len(self._sorted) * pct / 100))
+        return self._sorted[idx]
+
+
+class HedgeBudget:
+    """Token bucket: every primary request earns `ratio` of a hedge."""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Hedger:
+    def __init__(self):
+        self.routes = _parse_routes(settings.HEDGE_ROUTES)
+        self.windows: dict[str, LatencyWindow] = {}
+        self.budget = HedgeBudget(settings.HEDGE_BUDGET_RATIO, settings.HEDGE_BURST)
+
+    def delay_for(self, route: str) -> float | None:
+        window = self.windows.setdefault(route, LatencyWindow())
+        delay = window.percentile(self.routes[route])
+        if delay is None:
+            # Not enough history yet: never hedge blind.
+            return None
+        delay = max(delay, settings.HEDGE_MIN_DELAY_MS / 1000)
+        hedge_delay_seconds.set(delay, route=route)
+        return delay
+
+    async def request(
+        self, route: str, service_name: str, method: str, path: str, **kwargs
+    ) -> httpx.Response:
+        """Send an upstream request, hedging it if `route` is enabled."""
+        if route not in self.routes:
+            return await upstreams.request(service_name, method, path, **kwargs)
+
+        self.budget.deposit()
+        window = self.windows.setdefault(route, LatencyWindow())
+        delay = self.delay_for(route)
+        service = upstreams.get_service(service_name)
+        primary_ep = service.pick()
+        started = time.monotonic()
+        primary = asyncio.create_task(
+            upstreams.request(service_name, method, path, endpoint=primary_ep, **kwargs)
+        )
+        # A cancelled primary still reports its (censored) elapsed time, so
+        # a slow replica keeps pushing the percentile up.
+        primary.add_done_callback(lambda _: window.observe(time.monotonic() - started))
+        pending = {primary}
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    hedge = self._start_hedge(
+                        route, service, primary_ep, method, path, kwargs
+                    )
+                    if hedge is not None:
+                        pending.add(hedge)
+
+            # First successful response wins; a failure only counts once
+            # every attempt has failed.
+            error, fallback = None, None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    res = task.result()
+                    if res.status_code >= 500 and pending:
+                        fallback = res
+                        continue
+                    if task is not primary:
+                        hedges_total.inc(route=route, outcome="won")
+                    return res
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _start_hedge(self, route, service, primary_ep, method, path, kwargs):
+        try:
+            hedge_ep = service.pick(exclude={primary_ep.url})
+        except NoHealthyUpstream:
+            hedges_total.inc(route=route, outcome="no_replica")
+            return None
+        if not self.budget.withdraw():
+            hedges_total.inc(route=route, outcome="budget_exhausted")
+            return None
+        hedges_total.inc(route=route, outcome="sent")
+        return asyncio.create_task(
+            upstreams.request(service.name, method, path, endpoint=hedge_ep, **kwargs)
+        )
+
+    def snapshot(self) -> dict:
+        routes = {}
+        for route, pct in self.routes.items():
+            delay = self.delay_for(route)
+            routes[route] = {
+                "percentile": pct,
+                "delay_ms": round(delay * 1000, 2) if delay is not None else None,
+            }
+        return {"budget_tokens": round(self.budget.tokens, 2), "routes": routes}
+
+
+hedger = Hedger()
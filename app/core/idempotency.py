@@ -0,0 +1,309 @@
+"""
+Idempotency-Key support for mutating routes.
+
+A request carrying `Idempotency-Key` on one of IDEMPOTENT_ROUTES claims the
+key in Redis before it runs. Retries with the same key:
+- wait for the original call while it is still in flight (in-process future
+  on this replica, Redis polling across replicas),
+- get the stored response replayed once it has completed (within the TTL),
+- are rejected with 422 when their fingerprint (user, method, path, query,
+  body) differs from the original request's.
+Only 2xx answers and the handler's own rejections (400, 404, 422) are
+stored. Anything else (401/403, 408, 409, 429, 5xx) depends on when the
+call ran rather than on the request, so it releases the key and a retry
+runs for real.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import tempfile
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis_client import get_async_redis
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# (method, path) pairs that honour Idempotency-Key.
+IDEMPOTENT_ROUTES = {
+    ("POST", "/api/billing/create-checkout-session"),
+    ("POST", "/api/projects/"),
+    ("POST", "/api/vulnerability/refresh"),
+    ("POST", "/api/sbom/upload"),
+}
+
+# Client errors that are the request's own fault, and so replayed as is.
+REPLAYED_CLIENT_ERRORS = (400, 404, 422)
+
+HEADER = b"idempotency-key"
+CHUNK = 64 * 1024
+
+idempotency_total = metrics.counter(
+    "gateway_idempotency_requests_total",
+    "Idempotent requests by outcome (executed, replayed, waited, conflict, mismatch)",
+)
+
+
+class _Fingerprint:
+    """sha256 over the request identity and body, ignoring multipart boundaries."""
+
+    def __init__(self, scope: dict, user_id: str):
+        self._hash = hashlib.sha256()
+        for part in (
+            user_id,
+            scope["method"],
+            scope["path"],
+            scope.get("query_string", b"").decode(),
+        ):
+            self._hash.update(part.encode() + b"\0")
+        self._boundary = self._multipart_boundary(scope)
+        self._carry = b""
+
+    @staticmethod
+    def _multipart_boundary(scope: dict) -> bytes | None:
+        for name, value in scope["headers"]:
+            if name == b"content-type" and value.startswith(b"multipart/"):
+                for param in value.split(b";")[1:]:
+                    key, _, val = param.strip().partition(b"=")
+                    if key.lower() == b"boundary":
+                        return val.strip(b'"')
+        return None
+
+    def update(self, chunk: bytes):
+        if not self._boundary:
+            self._hash.update(chunk)
+            return
+        # Clients pick a fresh boundary per attempt, so strip it. Keep a
+        # tail shorter than the boundary in case one straddles two chunks.
+        data = (self._carry + chunk).replace(self._boundary, b"")
+        keep = len(self._boundary) - 1
+        self._hash.update(data[:-keep] if keep else data)
+        self._carry = data[-keep:] if keep else b""
+
+    def hexdigest(self) -> str:
+        self._hash.update(self._carry)
+        return self._hash.hexdigest()
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware so request bodies can be spooled and replayed."""
+
+    def __init__(self, app):
+        self.app = app
+        # Calls currently executing on this replica, by storage key.
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.IDEMPOTENCY_ENABLED:
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(HEADER)
+        if not key or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            return await self.app(scope, receive, send)
+        if len(key) > 255:
+            return await _send_json(
+                send, 400, {"detail": "Idempotency-Key must be at most 255 bytes"}
+            )
+
+        user = scope.get("state", {}).get("user")
+        user_id = str(getattr(user, "id", None) or "anonymous")
+        fingerprint = _Fingerprint(scope, user_id)
+        with tempfile.SpooledTemporaryFile(
+            max_size=settings.IDEMPOTENCY_SPOOL_BYTES
+        ) as spool:
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body = message.get("body", b"")
+                fingerprint.update(body)
+                if spool.tell() + len(body) > settings.IDEMPOTENCY_SPOOL_BYTES:
+                    # Past the in-memory part: this write goes to disk.
+                    await asyncio.to_thread(spool.write, body)
+                else:
+                    spool.write(body)
+                more = message.get("more_body", False)
+            size = spool.tell()
+            spool.seek(0)
+            await self._handle(
+                scope,
+                _replay_receive(spool, size, receive),
+                send,
+                storage_key=f"idem:{user_id}:{key.decode(errors='replace')}",
+                fp=fingerprint.hexdigest(),
+            )
+
+    # ----- claim / wait / replay -----
+    async def _handle(self, scope, receive, send, storage_key: str, fp: str):
+        redis = get_async_redis()
+        pending = json.dumps({"state": "pending", "fp": fp})
+        try:
+            claimed = await redis.set(
+                storage_key, pending, nx=True, ex=settings.IDEMPOTENCY_PENDING_TTL_S
+            )
+        except RedisError as e:
+            # Without Redis, still collapse duplicates within this replica.
+            logger.warning({"event": "idempotency_store_error", "error": str(e)})
+            redis = None
+            claimed = storage_key not in self._in_flight
+
+        if claimed:
+            return await self._execute(scope, receive, send, redis, storage_key, fp)
+
+        record = await self._wait_for_record(redis, storage_key, fp)
+        if record is None:
+            idempotency_total.inc(outcome="conflict")
+            return await _send_json(
+                send,
+                409,
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+            )
+        if record["state"] == "released":
+            # The original call failed and released the key: run for real.
+            return await self._handle(scope, receive, send, storage_key, fp)
+        if record["fp"] != fp:
+            idempotency_total.inc(outcome="mismatch")
+            return await _send_json(
+                send,
+                422,
+                {"detail": "Idempotency-Key was already used for a different request"},
+            )
+        idempotency_total.inc(outcome="replayed")
+        await _replay(send, record)
+
+    async def _wait_for_record(self, redis, storage_key: str, fp: str) -> dict | None:
+        """
+        Wait until the key's record is settled: "done", "released", or owned
+        by a different fingerprint. Returns None if still pending at timeout.
+        """
+        local = self._in_flight.get(storage_key)
+        if local is not None:
+            idempotency_total.inc(outcome="waited")
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(local), settings.IDEMPOTENCY_WAIT_S
+                )
+            except TimeoutError:
+                return None
+        if redis is None:
+            return {"state": "released", "fp": None}
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_S
+        waited = False
+        while True:
+            raw = await redis.get(storage_key)
+            if raw is None:
+                # Released after a failure, or expired.
+                return {"state": "released", "fp": None}
+            record = json.loads(raw)
+            if record["state"] == "done" or record["fp"] != fp:
+                return record
+            if time.monotonic() >= deadline:
+                return None
+            if not waited:
+                idempotency_total.inc(outcome="waited")
+                waited = True
+            await asyncio.sleep(settings.IDEMPOTENCY_POLL_INTERVAL_S)
+
+    async def _execute(self, scope, receive, send, redis, storage_key: str, fp: str):
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[storage_key] = future
+        captured = {"status": 500, "headers": [], "body": bytearray(), "ok": True}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [
+                    [k.decode("latin-1"), v.decode("latin-1")]
+                    for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body" and captured["ok"]:
+                captured["body"] += message.get("body", b"")
+                if len(captured["body"]) > settings.IDEMPOTENCY_MAX_RESPONSE_BYTES:
+                    captured["ok"] = False
+                    captured["body"] = bytearray()
+            await send(message)
+
+        record = None
+        try:
+            await self.app(scope, receive, capture_send)
+            idempotency_total.inc(outcome="executed")
+            if _replayable(captured["status"]) and captured["ok"]:
+                record = {
+                    "state": "done",
+                    "fp": fp,
+                    "status": captured["status"],
+                    "headers": captured["headers"],
+                    "body": base64.b64encode(bytes(captured["body"])).decode(),
+                }
+        finally:
+            await self._finish(redis, storage_key, record)
+            self._in_flight.pop(storage_key, None)
+            # Waiters replay the record, or retry for real when there is none.
+            future.set_result(record or {"state": "released", "fp": fp})
+
+    async def _finish(self, redis, storage_key: str, record: dict | None):
+        if redis is None:
+            return
+        try:
+            if record is None:
+                await redis.delete(storage_key)
+            else:
+                await redis.set(
+                    storage_key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_S
+                )
+        except RedisError as e:
+            logger.warning({"event": "idempotency_store_error", "error": str(e)})
+
+
+def _replayable(status: int) -> bool:
+    return 200 <= status < 300 or status in REPLAYED_CLIENT_ERRORS
+
+
+def _replay_receive(spool, size: int, receive):
+    """Re-emit the spooled request body, then defer to the real receive()."""
+    done = False
+    on_disk = size > settings.IDEMPOTENCY_SPOOL_BYTES
+
+    async def replay():
+        nonlocal done
+        if done:
+            return await receive()
+        if on_disk:
+            chunk = await asyncio.to_thread(spool.read, CHUNK)
+        else:
+            chunk = spool.read(CHUNK)
+        done = spool.tell() >= size
+        return {"type": "http.request", "body": chunk, "more_body": not done}
+
+    return replay
+
+
+async def _replay(send, record: dict):
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in record["headers"]]
+    headers.append((b"idempotent-replayed", b"true"))
+    await send(
+        {"type": "http.response.start", "status": record["status"], "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
+
+
+async def _send_json(send, status: int, content: dict):
+    body = json.dumps(content).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
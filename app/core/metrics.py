@@ -0,0 +1,119 @@
+"""
+In-process metrics registry for the API Gateway.
+
+Lightweight counters, gauges and histograms keyed by label sets. The whole
+registry is served as JSON through the gateway admin routes.
+"""
+
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0)
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "counter",
+            "help": self.help,
+            "series": [
+                {"labels": dict(k), "value": v} for k, v in self._values.items()
+            ],
+        }
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        self._values[_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["type"] = "gauge"
+        return data
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelKey, list] = {}
+        # Observations may come from the watchdog thread as well as the loop.
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        out = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative, buckets = 0, {}
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                out.append(
+                    {
+                        "labels": dict(key),
+                        "buckets": buckets,
+                        "count": cumulative,
+                        "sum": round(series[-1], 6),
+                    }
+                )
+        return {"type": "histogram", "help": self.help, "series": out}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str = "", buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        return {name: m.snapshot() for name, m in sorted(self._metrics.items())}
+
+
+metrics = MetricsRegistry()
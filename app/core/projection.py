@@ -0,0 +1,63 @@
+"""
+Server-side field projection for heavy upstream JSON responses.
+
+With `?fields=id,severity,package.name` the gateway streams the upstream
+document through a JsonProjector (see app.utils.jsonstream) and answers
+with only those fields, so the full document is never held in memory.
+Projected responses are cached as variants of the full response's cache
+key, one entry per canonical field list, and are retired with it when the
+full entry is invalidated.
+"""
+
+import asyncio
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.core.cache import Loader, ResponseCache
+from app.core.metrics import metrics
+from app.core.upstreams import upstreams
+from app.utils.jsonstream import JsonProjector, field_paths, field_tree
+
+projection_bytes_total = metrics.counter(
+    "gateway_projection_bytes_total",
+    "Bytes through field projection by direction (upstream, projected)",
+)
+
+
+def projection_loader(service: str, path: str, paths, **kwargs) -> Loader:
+    async def load() -> httpx.Response:
+        projector = JsonProjector(field_tree(paths))
+        async with upstreams.stream(service, "GET", path, **kwargs) as res:
+            if res.status_code != 200:
+                # Errors are small and passed through as they are.
+                await res.aread()
+                return res
+            out = bytearray()
+            async for chunk in res.aiter_bytes():
+                projection_bytes_total.inc(len(chunk), direction="upstream")
+                # Tokenizing is CPU work: keep it off the event loop.
+                out += await asyncio.to_thread(projector.feed, chunk)
+            out += projector.close()
+        projection_bytes_total.inc(len(out), direction="projected")
+        return httpx.Response(
+            200, content=bytes(out), headers={"content-type": "application/json"}
+        )
+
+    return load
+
+
+async def projected(
+    cache: ResponseCache, key: str, service: str, path: str, fields: str, **kwargs
+) -> Response:
+    """
+    Serve the `fields` projection of the upstream document at `path`, cached
+    as a variant of `key` in `cache`. Raises 400 for a malformed field list.
+    """
+    try:
+        paths = field_paths(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    variant = await cache.variant_key(key, "fields=" + ",".join(paths))
+    return await cache.get(variant, projection_loader(service, path, paths, **kwargs))
@@ -0,0 +1,268 @@
+"""
+Billing-plan-aware quotas.
+
+Each user's plan (and tenant, when billing reports one) comes from
+billing-service's latest-subscription endpoint and is held in a local
+LRU cache of PLAN_CACHE_MAX_ENTRIES users. Entries are served until
+PLAN_CACHE_TTL_S; after that the stale
+plan is still used while a background lookup refreshes it, so the request
+path only ever waits on billing-service for a user it has never seen (and
+then for at most PLAN_LOOKUP_TIMEOUT_S, falling back to DEFAULT_PLAN).
+Delivered Stripe subscription events refresh the affected user's entry.
+
+Quotas are enforced through the shared slowapi limiter storage, per user
+and per tenant, with limits taken from the plan's row in the quota table.
+A request is counted against both only once both have room, so one that
+is rejected uses up neither.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Annotated
+
+from fastapi import Depends, HTTPException
+from limits import parse
+from redis.exceptions import RedisError
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.limiter import limiter
+from app.core.metrics import metrics
+from app.core.upstreams import UPSTREAM_ERRORS, upstreams
+from app.core.webhook_queue import webhook_queue
+from app.utils.logger import setup_logger
+from app.utils.security import verify_jwt
+
+logger = setup_logger()
+
+BILLING_SERVICE = "billing-service"
+
+# plan -> quota -> {"user": limit, "tenant": limit}; PLAN_QUOTAS (JSON)
+# overrides individual entries.
+DEFAULT_QUOTAS = {
+    "free": {
+        "upload": {"user": "20/hour", "tenant": "40/hour"},
+        "refresh": {"user": "30/hour", "tenant": "60/hour"},
+    },
+    "pro": {
+        "upload": {"user": "200/hour", "tenant": "1000/hour"},
+        "refresh": {"user": "300/hour", "tenant": "1500/hour"},
+    },
+    "enterprise": {
+        "upload": {"user": "1000/hour", "tenant": "10000/hour"},
+        "refresh": {"user": "1500/hour", "tenant": "15000/hour"},
+    },
+}
+ACTIVE_STATUSES = ("active", "trialing", "past_due")
+TENANT_FIELDS = ("tenant_id", "organization_id", "org_id", "customer_id")
+
+plan_lookups_total = metrics.counter(
+    "gateway_plan_cache_lookups_total",
+    "Plan cache lookups by outcome (hit, stale, miss, fallback)",
+)
+quota_rejections_total = metrics.counter(
+    "gateway_quota_rejections_total", "Requests rejected by plan quotas"
+)
+
+
+def _load_quotas() -> dict:
+    quotas = json.loads(json.dumps(DEFAULT_QUOTAS))
+    if settings.PLAN_QUOTAS:
+        for plan, table in json.loads(settings.PLAN_QUOTAS).items():
+            for quota, scopes in table.items():
+                quotas.setdefault(plan, {}).setdefault(quota, {}).update(scopes)
+    return quotas
+
+
+@dataclass
+class PlanInfo:
+    plan: str
+    tenant: str | None
+    fetched_at: float
+
+
+def plan_from_subscription(data) -> PlanInfo:
+    """Read plan name and tenant out of a latest-subscription response."""
+    sub = data.get("subscription", data) if isinstance(data, dict) else None
+    plan, tenant = settings.DEFAULT_PLAN, None
+    if isinstance(sub, dict):
+        status = str(sub.get("status", "active")).lower()
+        raw = sub.get("plan") or sub.get("plan_name") or sub.get("tier")
+        if isinstance(raw, dict):
+            raw = raw.get("code") or raw.get("name") or raw.get("tier")
+        if raw and status in ACTIVE_STATUSES:
+            plan = str(raw).lower()
+        for field in TENANT_FIELDS:
+            if sub.get(field) is not None:
+                tenant = str(sub[field])
+                break
+    return PlanInfo(plan, tenant, time.time())
+
+
+class PlanCache:
+    def __init__(self):
+        # Least recently used first.
+        self._entries: OrderedDict[str, PlanInfo] = OrderedDict()
+        self._fetching: dict[str, asyncio.Task] = {}
+
+    def put(self, user_id: str, info: PlanInfo):
+        self._entries[user_id] = info
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > settings.PLAN_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def _fetch(self, user_id: str) -> asyncio.Task:
+        task = self._fetching.get(user_id)
+        if task is None:
+            task = self._fetching[user_id] = deadline.detached(self._load(user_id))
+            task.add_done_callback(lambda _: self._fetching.pop(user_id, None))
+        return task
+
+    async def _load(self, user_id: str) -> PlanInfo | None:
+        try:
+            res = await upstreams.request(
+                BILLING_SERVICE,
+                "GET",
+                "/api/billing/latest-subscription",
+                headers={"X-User-ID": user_id},
+                timeout=15.0,
+            )
+        except UPSTREAM_ERRORS as e:
+            logger.warning({"event": "plan_lookup_error", "error": str(e)})
+            return None
+        if res.status_code == 404:
+            # No subscription at all: the default plan.
+            info = PlanInfo(settings.DEFAULT_PLAN, None, time.time())
+        elif res.status_code >= 400:
+            logger.warning({"event": "plan_lookup_error", "status": res.status_code})
+            return None
+        else:
+            info = plan_from_subscription(res.json())
+        self.put(user_id, info)
+        return info
+
+    async def get(self, user_id: str) -> PlanInfo:
+        info = self._entries.get(user_id)
+        if info is not None:
+            self._entries.move_to_end(user_id)
+            if time.time() - info.fetched_at < settings.PLAN_CACHE_TTL_S:
+                plan_lookups_total.inc(outcome="hit")
+            else:
+                plan_lookups_total.inc(outcome="stale")
+                self._fetch(user_id)
+            return info
+        plan_lookups_total.inc(outcome="miss")
+        try:
+            info = await asyncio.wait_for(
+                asyncio.shield(self._fetch(user_id)), settings.PLAN_LOOKUP_TIMEOUT_S
+            )
+        except TimeoutError:
+            info = None
+        if info is None:
+            plan_lookups_total.inc(outcome="fallback")
+            return PlanInfo(settings.DEFAULT_PLAN, None, 0.0)
+        return info
+
+    async def on_webhook(self, event_type: str | None, payload: bytes):
+        """Refresh plans affected by a delivered Stripe event."""
+        if not event_type or not (
+            event_type.startswith("customer.subscription.")
+            or event_type in ("checkout.session.completed", "invoice.paid")
+        ):
+            return
+        obj = json.loads(payload).get("data", {}).get("object", {})
+        metadata = obj.get("metadata") or {}
+        user_id = (
+            metadata.get("user_id")
+            or metadata.get("userId")
+            or obj.get("client_reference_id")
+        )
+        if user_id is not None:
+            info = self._entries.get(str(user_id))
+            if info is not None:
+                info.fetched_at = 0.0
+            self._fetch(str(user_id))
+            return
+        # Cannot tell whose plan changed: let every entry refresh on next use.
+        for info in self._entries.values():
+            info.fetched_at = 0.0
+
+    def snapshot(self) -> dict:
+        plans: dict[str, int] = {}
+        for info in self._entries.values():
+            plans[info.plan] = plans.get(info.plan, 0) + 1
+        return {
+            "cached_users": len(self._entries),
+            "by_plan": plans,
+            "quotas": quotas,
+        }
+
+
+quotas = _load_quotas()
+plan_cache = PlanCache()
+webhook_queue.add_listener(plan_cache.on_webhook)
+
+
+def _admit(quota: str, checks: list) -> tuple | None:
+    """
+    Test every (scope, identity, limit) first and count a hit against all
+    of them only when all have room. Returns None when admitted, else
+    (scope, limit, seconds until reset) of the first exhausted one.
+    """
+    windows = [
+        (scope, limit, parse(limit), ("quota", quota, scope, identity))
+        for scope, identity, limit in checks
+    ]
+    for scope, limit, item, key in windows:
+        if not limiter.limiter.test(item, *key):
+            reset_at, _ = limiter.limiter.get_window_stats(item, *key)
+            return scope, limit, max(1, int(reset_at - time.time()))
+    for _, _, item, key in windows:
+        limiter.limiter.hit(item, *key)
+    return None
+
+
+def plan_quota(quota: str):
+    """
+    Dependency enforcing the caller's plan quota `quota` per user and, when
+    the plan belongs to a tenant, per tenant.
+    Example:
+        @router.post("/upload", dependencies=[Depends(plan_quota("upload"))])
+    """
+
+    async def wrapper(token_data: Annotated[dict, Depends(verify_jwt)]):
+        user_id = token_data.get("id") or token_data.get("sub")
+        if not settings.PLAN_QUOTAS_ENABLED or user_id is None:
+            return
+        info = await plan_cache.get(str(user_id))
+        table = quotas.get(info.plan) or quotas[settings.DEFAULT_PLAN]
+        scopes = table.get(quota)
+        if not scopes:
+            return
+
+        checks = [("user", str(user_id), scopes.get("user"))]
+        if info.tenant is not None:
+            checks.append(("tenant", info.tenant, scopes.get("tenant")))
+        checks = [check for check in checks if check[2]]
+        if not checks:
+            return
+        try:
+            rejected = await asyncio.to_thread(_admit, quota, checks)
+        except RedisError as e:
+            # Limiter storage down: fail open rather than block uploads.
+            logger.warning({"event": "quota_store_error", "error": str(e)})
+            return
+        if rejected is not None:
+            scope, limit, retry_after = rejected
+            quota_rejections_total.inc(quota=quota, plan=info.plan, scope=scope)
+            raise HTTPException(
+                status_code=429,
+                detail=f"{quota} quota of the {info.plan} plan exceeded "
+                f"({limit} per {scope})",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    return wrapper
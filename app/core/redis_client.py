@@ -1,7 +1,9 @@
 import redis
+import redis.asyncio as aioredis
 from app.core.config import settings
 
 _redis = None
+_async_redis = None
 
 
 def get_redis():
@@ -15,3 +17,21 @@ def get_redis():
             print("⚠️ Redis connection failed, continuing without Redis:", e)
             _redis = None
     return _redis
+
+
+def get_async_redis():
+    """
+    Shared asyncio Redis client for code running on the event loop.
+    Connections are opened lazily, so callers must handle connection errors.
+    """
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.from_url(settings.REDIS_URL)
+    return _async_redis
+
+
+async def close_async_redis():
+    global _async_redis
+    if _async_redis is not None:
+        await _async_redis.aclose()
+        _async_redis = None
@@ -0,0 +1,156 @@
+"""
+Content-hash deduplication of SBOM uploads.
+
+CI uploads the same SBOM on every build. Each upload is digested and looked
+up in a per-project index of recent digests in Redis; a match short-circuits
+to the SBOM ID it produced before instead of re-processing the document.
+
+CycloneDX and SPDX JSON documents get a canonical digest: fields that
+change on every generation (serial number, namespace, timestamps) are
+dropped, and neither formatting, key order nor the order of unordered lists
+(components, packages, relationships...) affects it. The digest is computed
+while the file is read (see CanonicalDigest), so memory is bounded by the
+open JSON containers, not the document. Any other file is hashed
+byte-for-byte.
+"""
+
+import hashlib
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis_client import get_async_redis
+from app.utils.jsonstream import CanonicalDigest
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+CHUNK = 64 * 1024
+
+# Fields that differ between two generations of the same SBOM: CycloneDX
+# serialNumber, version and metadata.timestamp, SPDX documentNamespace and
+# creationInfo.created. Neither format uses the other's.
+VOLATILE_FIELDS = (
+    ("serialNumber",),
+    ("version",),
+    ("metadata", "timestamp"),
+    ("documentNamespace",),
+    ("creationInfo", "created"),
+)
+# Lists whose order carries no meaning.
+UNORDERED_LISTS = {
+    "components",
+    "services",
+    "dependencies",
+    "dependsOn",
+    "packages",
+    "files",
+    "relationships",
+    "externalRefs",
+}
+
+sbom_dedupe_total = metrics.counter(
+    "gateway_sbom_dedupe_total",
+    "SBOM uploads by dedupe outcome (duplicate, new, stale, bypassed)",
+)
+
+
+def _sbom_format(top_level: dict) -> str | None:
+    if top_level.get("bomFormat") == "CycloneDX":
+        return "cyclonedx"
+    if "spdxVersion" in top_level:
+        return "spdx"
+    return None
+
+
+def digest_file(fileobj) -> tuple[str, str]:
+    """
+    Digest an uploaded file object in one streaming pass (blocking; run it
+    in a thread). Returns (digest, kind) where kind is "cyclonedx", "spdx"
+    or "raw". The file is left positioned at the start.
+    """
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    head = fileobj.read(CHUNK).lstrip()
+    fileobj.seek(0)
+
+    canonical = None
+    if head.startswith(b"{") and size <= settings.SBOM_CANONICAL_MAX_BYTES:
+        canonical = CanonicalDigest(UNORDERED_LISTS, VOLATILE_FIELDS)
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK), b""):
+        sha.update(chunk)
+        if canonical is not None:
+            try:
+                canonical.feed(chunk)
+            except ValueError:
+                canonical = None
+    fileobj.seek(0)
+
+    if canonical is not None:
+        try:
+            digest = canonical.hexdigest()
+        except ValueError:
+            digest = None
+        fmt = _sbom_format(canonical.top_level)
+        if digest is not None and fmt is not None:
+            return digest, fmt
+    return sha.hexdigest(), "raw"
+
+
+class DigestIndex:
+    """Per-project index of recent upload digests -> SBOM ID, in Redis."""
+
+    def _keys(self, project: str) -> tuple[str, str]:
+        # Sorted set (digest by upload time) + hash (digest -> SBOM ID).
+        return f"sbom:digests:{project}", f"sbom:digest_ids:{project}"
+
+    async def lookup(self, project: str, digest: str) -> str | None:
+        recency, ids = self._keys(project)
+        try:
+            r = get_async_redis()
+            seen_at = await r.zscore(recency, digest)
+            if seen_at is None or seen_at < time.time() - settings.SBOM_DEDUPE_TTL_S:
+                return None
+            sbom_id = await r.hget(ids, digest)
+        except RedisError as e:
+            logger.warning({"event": "sbom_dedupe_store_error", "error": str(e)})
+            return None
+        return sbom_id.decode() if sbom_id is not None else None
+
+    async def remember(self, project: str, digest: str, sbom_id: str):
+        recency, ids = self._keys(project)
+        keep = settings.SBOM_DEDUPE_MAX_PER_PROJECT
+        try:
+            r = get_async_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.zadd(recency, {digest: time.time()})
+                pipe.hset(ids, digest, sbom_id)
+                # Everything but the newest `keep` digests falls out.
+                pipe.zrange(recency, 0, -keep - 1)
+                pipe.zremrangebyrank(recency, 0, -keep - 1)
+                pipe.expire(recency, settings.SBOM_DEDUPE_TTL_S)
+                pipe.expire(ids, settings.SBOM_DEDUPE_TTL_S)
+                results = await pipe.execute()
+            evicted = results[2]
+            if evicted:
+                await r.hdel(ids, *evicted)
+        except RedisError as e:
+            logger.warning({"event": "sbom_dedupe_store_error", "error": str(e)})
+
+    async def forget(self, project: str, digest: str):
+        recency, ids = self._keys(project)
+        try:
+            r = get_async_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.zrem(recency, digest)
+                pipe.hdel(ids, digest)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning({"event": "sbom_dedupe_store_error", "error": str(e)})
+
+
+digest_index = DigestIndex()
@@ -0,0 +1,219 @@
+"""
+Shared, resumable vulnerability event streams.
+
+All clients watching one project share a single upstream SSE connection
+(a ProjectChannel). The gateway gives every event its own ID and keeps the
+last SSE_BUFFER_SIZE events per project in a ring buffer, so a client that
+reconnects with `Last-Event-ID` first gets what it missed from the buffer,
+then live events. A channel stays connected for SSE_IDLE_GRACE_S after its
+last client leaves so reconnecting clients find their gap buffered.
+
+IDs look like `<channel token>.<sequence>`. An ID from another channel
+(another replica, or a channel that has since closed) cannot be resumed
+and the client just continues with live events.
+"""
+
+import asyncio
+import random
+import secrets
+from collections import deque
+from collections.abc import AsyncIterator
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.upstreams import UPSTREAM_ERRORS, upstreams
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+VULN_SERVICE = "vulnerability-service"
+
+sse_clients = metrics.gauge("gateway_sse_clients", "Connected SSE clients")
+sse_events_total = metrics.counter(
+    "gateway_sse_events_total", "SSE events by outcome (received, replayed, dropped)"
+)
+
+Event = tuple[int, str]  # (sequence, event fields without id, one per line)
+
+
+class ProjectChannel:
+    def __init__(self, project_name: str, on_idle):
+        self.project_name = project_name
+        self.token = secrets.token_hex(4)
+        self.seq = 0
+        self.buffer: deque[Event] = deque(maxlen=settings.SSE_BUFFER_SIZE)
+        self.subscribers: set[asyncio.Queue] = set()
+        self._on_idle = on_idle
+        self._reader: asyncio.Task | None = None
+        self._idle_timer: asyncio.TimerHandle | None = None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.token}.{seq}"
+
+    # ----- upstream -----
+    def _publish(self, fields: str):
+        self.seq += 1
+        event = (self.seq, fields)
+        self.buffer.append(event)
+        sse_events_total.inc(outcome="received")
+        for queue in list(self.subscribers):
+            if queue.qsize() >= settings.SSE_CLIENT_QUEUE_SIZE:
+                # Too slow to keep up: end its stream. The client reconnects
+                # with Last-Event-ID and catches up from the buffer.
+                sse_events_total.inc(outcome="dropped")
+                self.subscribers.discard(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(event)
+
+    async def _read(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with upstreams.stream(
+                    VULN_SERVICE,
+                    "GET",
+                    "/api/vuln/stream",
+                    params={"project_name": self.project_name},
+                    headers={"X-From-Gateway": "true"},
+                    timeout=None,
+                ) as res:
+                    backoff = 1.0
+                    lines = []
+                    async for line in res.aiter_lines():
+                        if line:
+                            # Upstream IDs and comments are replaced by ours.
+                            if not line.startswith((":", "id:")):
+                                lines.append(line)
+                        elif lines:
+                            self._publish("\n".join(lines))
+                            lines = []
+            except asyncio.CancelledError:
+                raise
+            except UPSTREAM_ERRORS as e:
+                logger.warning(
+                    {
+                        "event": "sse_upstream_error",
+                        "project": self.project_name,
+                        "error": str(e),
+                    }
+                )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # ----- subscribers -----
+    def subscribe(self, last_event_id: str | None) -> tuple[asyncio.Queue, list]:
+        """Register a client; returns its live queue and the events to replay."""
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        if self._reader is None:
+            self._reader = deadline.detached(self._read())
+
+        replay = []
+        token, _, seq = (last_event_id or "").partition(".")
+        if token == self.token and seq.isdigit():
+            replay = [event for event in self.buffer if event[0] > int(seq)]
+            sse_events_total.inc(len(replay), outcome="replayed")
+        queue: asyncio.Queue = asyncio.Queue()
+        self.subscribers.add(queue)
+        sse_clients.inc()
+        return queue, replay
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        sse_clients.dec()
+        if not self.subscribers and self._idle_timer is None:
+            self._idle_timer = asyncio.get_running_loop().call_later(
+                settings.SSE_IDLE_GRACE_S, self._close_if_idle
+            )
+
+    def _close_if_idle(self):
+        self._idle_timer = None
+        if not self.subscribers:
+            self.close()
+            self._on_idle(self)
+
+    def close(self, retry_ms: tuple[int, int] | None = None):
+        """
+        Stop reading upstream and end every client's stream. With
+        `retry_ms`, each client is first told to reconnect after a random
+        delay in that range, so reconnects are spread out.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        for queue in list(self.subscribers):
+            if retry_ms is not None:
+                queue.put_nowait(random.randint(*retry_ms))
+            queue.put_nowait(None)
+
+
+class SSEHub:
+    def __init__(self):
+        self.channels: dict[str, ProjectChannel] = {}
+
+    def _forget(self, channel: ProjectChannel):
+        if self.channels.get(channel.project_name) is channel:
+            del self.channels[channel.project_name]
+
+    async def events(
+        self, project_name: str, last_event_id: str | None
+    ) -> AsyncIterator[str]:
+        """SSE text for one client: buffered replay, then live events."""
+        channel = self.channels.get(project_name)
+        if channel is None:
+            channel = self.channels[project_name] = ProjectChannel(
+                project_name, self._forget
+            )
+        queue, replay = channel.subscribe(last_event_id)
+        try:
+            for seq, fields in replay:
+                yield f"id: {channel.event_id(seq)}\n{fields}\n\n"
+            last_sent = replay[-1][0] if replay else 0
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), settings.SSE_HEARTBEAT_S
+                    )
+                except TimeoutError:
+                    # Comment line: keeps proxies from reaping an idle stream.
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    return
+                if isinstance(event, int):
+                    # Reconnect delay in ms, sent just before the stream ends.
+                    yield f"retry: {event}\n\n"
+                    continue
+                seq, fields = event
+                if seq <= last_sent:
+                    # Already sent as part of the replay.
+                    continue
+                last_sent = seq
+                yield f"id: {channel.event_id(seq)}\n{fields}\n\n"
+        finally:
+            channel.unsubscribe(queue)
+
+    def close(self, retry_ms: tuple[int, int] | None = None) -> int:
+        """End every stream and drop the upstream connections."""
+        clients = 0
+        for channel in list(self.channels.values()):
+            clients += len(channel.subscribers)
+            channel.close(retry_ms)
+        self.channels.clear()
+        return clients
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "clients": len(channel.subscribers),
+                "buffered": len(channel.buffer),
+                "last_event_id": channel.event_id(channel.seq),
+            }
+            for name, channel in self.channels.items()
+        }
+
+
+sse_hub = SSEHub()
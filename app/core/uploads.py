@@ -0,0 +1,270 @@
+"""
+Resumable chunked uploads.
+
+A client creates a session, PUTs the file in chunks at explicit offsets
+(each with an optional sha256), and finalizes it. Chunks are streamed
+straight to a spool file on local disk, so memory per upload stays bounded
+whatever the document size. If the connection drops, the client asks for
+the session's offset and carries on from there. Sessions untouched for
+UPLOAD_SESSION_TTL_S are garbage-collected.
+
+On disk, each session is a directory under UPLOAD_SPOOL_DIR holding
+`meta.json` (written once) and `data`; the size of `data` is the offset.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import anyio
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+# Request body pieces are gathered up to this size before each disk write.
+WRITE_BUFFER = 1024 * 1024
+
+upload_bytes_total = metrics.counter(
+    "gateway_resumable_upload_bytes_total", "Bytes accepted into upload sessions"
+)
+upload_sessions_total = metrics.counter(
+    "gateway_resumable_upload_sessions_total",
+    "Upload sessions by outcome (created, finalized, aborted, expired)",
+)
+
+
+class UploadError(Exception):
+    """A client error on an upload session, with the HTTP status to answer."""
+
+    def __init__(self, status_code: int, detail: str, offset: int | None = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.offset = offset
+
+
+class UploadSession:
+    def __init__(self, session_id: str, path: str, meta: dict):
+        self.id = session_id
+        self.path = path
+        self.meta = meta
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.path, "data")
+
+    @property
+    def offset(self) -> int:
+        return os.path.getsize(self.data_path)
+
+    def describe(self) -> dict:
+        return {
+            "upload_id": self.id,
+            "offset": self.offset,
+            "size": self.meta.get("size"),
+            "project_name": self.meta["project_name"],
+            "filename": self.meta["filename"],
+            "expires_in_s": max(
+                0,
+                int(
+                    os.path.getmtime(self.data_path)
+                    + settings.UPLOAD_SESSION_TTL_S
+                    - time.time()
+                ),
+            ),
+        }
+
+
+class UploadSessions:
+    def __init__(self, root: str):
+        self.root = root
+        # Only one writer per session at a time.
+        self._busy: dict[str, asyncio.Lock] = {}
+        self._task = None
+
+    # ----- sessions -----
+    def create(
+        self,
+        owner: str,
+        project_name: str,
+        filename: str,
+        content_type: str | None = None,
+        size: int | None = None,
+    ) -> UploadSession:
+        if size is not None and size > settings.UPLOAD_MAX_BYTES:
+            raise UploadError(
+                413, f"Uploads are limited to {settings.UPLOAD_MAX_BYTES} bytes"
+            )
+        session_id = secrets.token_urlsafe(24)
+        path = os.path.join(self.root, session_id)
+        os.makedirs(path)
+        meta = {
+            "owner": owner,
+            "project_name": project_name,
+            "filename": filename,
+            "content_type": content_type or "application/octet-stream",
+            "size": size,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        open(os.path.join(path, "data"), "wb").close()
+        upload_sessions_total.inc(outcome="created")
+        return UploadSession(session_id, path, meta)
+
+    def get(self, session_id: str, owner: str) -> UploadSession:
+        path = os.path.join(self.root, session_id)
+        try:
+            if not _SESSION_ID.match(session_id):
+                raise FileNotFoundError
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise UploadError(404, "Upload session not found")
+        # Someone else's session is indistinguishable from a missing one.
+        if meta["owner"] != owner:
+            raise UploadError(404, "Upload session not found")
+        return UploadSession(session_id, path, meta)
+
+    def discard(self, session: UploadSession, outcome: str = "aborted"):
+        shutil.rmtree(session.path, ignore_errors=True)
+        self._busy.pop(session.id, None)
+        upload_sessions_total.inc(outcome=outcome)
+
+    # ----- chunks -----
+    @asynccontextmanager
+    async def exclusive(self, session: UploadSession):
+        """Hold the session for one writer (chunk or finalize), or answer 409."""
+        lock = self._busy.setdefault(session.id, asyncio.Lock())
+        if lock.locked():
+            raise UploadError(409, "Another request is using this upload session")
+        async with lock:
+            yield
+
+    async def write_chunk(
+        self,
+        session: UploadSession,
+        offset: int,
+        body: AsyncIterator[bytes],
+        checksum: str | None = None,
+    ) -> int:
+        """
+        Append a chunk that must start at the session's current offset.
+        `checksum` is the chunk's hex sha256; on mismatch the chunk is
+        discarded. Returns the new offset.
+        """
+        async with self.exclusive(session):
+            current = session.offset
+            if offset != current:
+                raise UploadError(409, "Chunk offset does not match", offset=current)
+            limit = session.meta.get("size") or settings.UPLOAD_MAX_BYTES
+
+            sha = hashlib.sha256()
+            written = 0
+            # File operations run in worker threads, off the event loop.
+            f = await anyio.open_file(session.data_path, "r+b")
+            try:
+                await f.seek(current)
+                buffer = bytearray()
+                async for piece in body:
+                    written += len(piece)
+                    if written > settings.UPLOAD_MAX_CHUNK_BYTES:
+                        raise UploadError(
+                            413,
+                            f"Chunks are limited to {settings.UPLOAD_MAX_CHUNK_BYTES} bytes",
+                        )
+                    if current + written > limit:
+                        raise UploadError(413, "Chunk goes past the end of the upload")
+                    sha.update(piece)
+                    buffer += piece
+                    if len(buffer) >= WRITE_BUFFER:
+                        await f.write(buffer)
+                        buffer.clear()
+                await f.write(buffer)
+                if checksum and sha.hexdigest() != checksum.lower():
+                    raise UploadError(400, "Chunk checksum mismatch", offset=current)
+                await f.flush()
+                await asyncio.to_thread(os.fsync, f.wrapped.fileno())
+            except BaseException:
+                # Keep only whole, verified chunks: the offset stays resumable.
+                # Shielded: a disconnect cancels the request, not the cleanup.
+                with anyio.CancelScope(shield=True):
+                    await f.truncate(current)
+                raise
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await f.aclose()
+        upload_bytes_total.inc(written)
+        return current + written
+
+    async def sha256(self, session: UploadSession) -> str:
+        def digest():
+            sha = hashlib.sha256()
+            with open(session.data_path, "rb") as f:
+                for chunk in iter(lambda: f.read(WRITE_BUFFER), b""):
+                    sha.update(chunk)
+            return sha.hexdigest()
+
+        return await asyncio.to_thread(digest)
+
+    # ----- garbage collection -----
+    def collect(self) -> int:
+        """Remove sessions idle for longer than UPLOAD_SESSION_TTL_S."""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - settings.UPLOAD_SESSION_TTL_S
+        removed = 0
+        for session_id in os.listdir(self.root):
+            path = os.path.join(self.root, session_id)
+            if session_id in self._busy and self._busy[session_id].locked():
+                continue
+            data = os.path.join(path, "data")
+            try:
+                # Every accepted chunk touches `data`.
+                last_used = os.path.getmtime(data if os.path.exists(data) else path)
+            except OSError:
+                continue
+            if last_used < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                self._busy.pop(session_id, None)
+                upload_sessions_total.inc(outcome="expired")
+                removed += 1
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.collect)
+                if removed:
+                    logger.info({"event": "upload_sessions_expired", "count": removed})
+            except OSError as e:
+                logger.error({"event": "upload_gc_error", "error": str(e)})
+            await asyncio.sleep(settings.UPLOAD_GC_INTERVAL_S)
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+upload_sessions = UploadSessions(settings.UPLOAD_SPOOL_DIR)
@@ -0,0 +1,398 @@
+"""
+Upstream registry and client-side load balancing.
+
+Each backend service can have several replicas. Requests are balanced with
+power-of-two-choices over a peak-EWMA latency cost (or plain least
+outstanding requests), endpoints are ejected by active health probes and
+passive error tracking, and endpoint lists are re-read from the upstreams
+file whenever it changes — no restart required.
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import httpx
+import yaml
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Default topology, used for services absent from the upstreams file.
+DEFAULT_SERVICES = {
+    "user-service": {
+        "urls": settings.USER_SERVICE_URLS,
+        "health_path": "/health",
+    },
+    "sbom-service": {
+        "urls": settings.SBOM_SERVICE_URLS,
+        "health_path": "/health",
+    },
+    "vulnerability-service": {
+        "urls": settings.VULN_SERVICE_URLS,
+        "health_path": "/api/vuln/health",
+    },
+    "risk-service": {
+        "urls": settings.RISK_SERVICE_URLS,
+        "health_path": "/health",
+    },
+    "billing-service": {
+        "urls": settings.BILLING_SERVICE_URLS,
+        "health_path": "/health",
+    },
+}
+
+upstream_requests_total = metrics.counter(
+    "gateway_upstream_requests_total", "Upstream requests by service and outcome"
+)
+upstream_latency_seconds = metrics.histogram(
+    "gateway_upstream_latency_seconds", "Upstream response latency by service"
+)
+
+
+class NoHealthyUpstream(Exception):
+    pass
+
+
+# What an upstream call can fail with, besides an error status.
+UPSTREAM_ERRORS = (httpx.HTTPError, NoHealthyUpstream, TimeoutError)
+# What re-reading a malformed or unreadable UPSTREAMS_FILE can fail with.
+CONFIG_ERRORS = (OSError, yaml.YAMLError, KeyError, TypeError, AttributeError)
+
+
+@dataclass
+class Endpoint:
+    url: str
+    healthy: bool = True
+    outstanding: int = 0
+    ewma: float = 0.0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    _last_sample: float = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def cost(self, policy: str) -> float:
+        if policy == "least_outstanding":
+            return self.outstanding
+        # Peak-EWMA: latency estimate scaled by the queue we would join.
+        return (self.ewma or 1e-3) * (self.outstanding + 1)
+
+    def observe_latency(self, rtt: float):
+        now = time.monotonic()
+        if rtt > self.ewma:
+            # Peak sensitivity: jump straight to a new high.
+            self.ewma = rtt
+        else:
+            decay = math.exp(-(now - self._last_sample) / settings.UPSTREAM_EWMA_TAU_S)
+            self.ewma = self.ewma * decay + rtt * (1 - decay)
+        self._last_sample = now
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ejected": time.monotonic() < self.ejected_until,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma * 1000, 2),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class Service:
+    def __init__(self, name: str, urls: list[str], health_path: str):
+        self.name = name
+        self.health_path = health_path
+        self.endpoints: dict[str, Endpoint] = {}
+        self.set_endpoints(urls)
+
+    def set_endpoints(self, urls: list[str]):
+        # Keep the stats of endpoints that survive the reload.
+        self.endpoints = {
+            url: self.endpoints.get(url) or Endpoint(url=url) for url in urls
+        }
+
+    def pick(self, exclude=()) -> Endpoint:
+        now = time.monotonic()
+        candidates = [
+            ep
+            for ep in self.endpoints.values()
+            if ep.available(now) and ep.url not in exclude
+        ]
+        if not candidates:
+            # Fail open: a degraded replica beats a guaranteed error.
+            candidates = [ep for ep in self.endpoints.values() if ep.url not in exclude]
+        if not candidates:
+            raise NoHealthyUpstream(f"No endpoints configured for {self.name}")
+        if len(candidates) == 1:
+            return candidates[0]
+        policy = settings.UPSTREAM_LB_POLICY
+        a, b = random.sample(candidates, 2)
+        return a if a.cost(policy) <= b.cost(policy) else b
+
+
+class UpstreamRegistry:
+    def __init__(self):
+        self.services: dict[str, Service] = {}
+        self._config_mtime: float | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._health_task = None
+        self.reload()
+
+    # ----- configuration -----
+    def _read_config(self) -> dict:
+        config = {
+            name: {
+                "endpoints": [u.strip() for u in spec["urls"].split(",") if u.strip()],
+                "health_path": spec["health_path"],
+            }
+            for name, spec in DEFAULT_SERVICES.items()
+        }
+        path = settings.UPSTREAMS_FILE
+        if path and os.path.exists(path):
+            with open(path) as f:
+                overrides = yaml.safe_load(f) or {}
+            for name, spec in overrides.items():
+                entry = config.setdefault(name, {"health_path": "/health"})
+                entry.update({k: v for k, v in spec.items() if v is not None})
+            self._config_mtime = os.path.getmtime(path)
+        return config
+
+    def reload(self) -> dict:
+        """(Re)load endpoint lists; existing endpoint stats are preserved."""
+        config = self._read_config()
+        for name, spec in config.items():
+            service = self.services.get(name)
+            if service is None:
+                self.services[name] = Service(
+                    name, spec["endpoints"], spec["health_path"]
+                )
+            else:
+                service.health_path = spec["health_path"]
+                service.set_endpoints(spec["endpoints"])
+        for name in set(self.services) - set(config):
+            del self.services[name]
+        logger.info(
+            {
+                "event": "upstreams_loaded",
+                "services": {n: list(s.endpoints) for n, s in self.services.items()},
+            }
+        )
+        return self.snapshot()
+
+    def _config_changed(self) -> bool:
+        path = settings.UPSTREAMS_FILE
+        if not path or not os.path.exists(path):
+            return False
+        return os.path.getmtime(path) != self._config_mtime
+
+    # ----- shared client -----
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # One pooled client for all upstream traffic. The cookie jar
+            # refuses to store anything so cookies never leak across users.
+            jar = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+            self._client = httpx.AsyncClient(
+                cookies=jar,
+                limits=httpx.Limits(
+                    max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+                ),
+            )
+        return self._client
+
+    @staticmethod
+    def _prepare(kwargs: dict) -> dict:
+        # Per-request cookies are forwarded as a plain header instead of
+        # going through the (deliberately inert) client cookie jar.
+        cookies = kwargs.pop("cookies", None)
+        if cookies:
+            headers = dict(kwargs.get("headers") or {})
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+            kwargs["headers"] = headers
+
+        # Cap the call at the request's remaining budget and pass it on.
+        left = deadline.remaining()
+        if left is not None:
+            if left <= 0:
+                deadline.deadline_exceeded_total.inc(outcome="refused")
+                raise deadline.DeadlineExceeded("Request deadline exceeded")
+            timeout = kwargs.get("timeout", left)
+            if timeout is None or isinstance(timeout, (int, float)):
+                kwargs["timeout"] = left if timeout is None else min(timeout, left)
+            headers = dict(kwargs.get("headers") or {})
+            headers[settings.DEADLINE_HEADER] = str(int(left * 1000))
+            kwargs["headers"] = headers
+        return kwargs
+
+    # ----- outcome tracking -----
+    def _record(self, service: Service, ep: Endpoint, elapsed: float, outcome: str):
+        ep.outstanding -= 1
+        upstream_requests_total.inc(service=service.name, outcome=outcome)
+        if outcome in ("cancelled", "deadline"):
+            # Abandoned by us (hedge loser, client gone, budget spent): says
+            # nothing about the replica's health or latency.
+            return
+        ep.observe_latency(elapsed)
+        upstream_latency_seconds.observe(elapsed, service=service.name)
+        if outcome == "ok":
+            ep.consecutive_failures = 0
+            return
+        ep.consecutive_failures += 1
+        if ep.consecutive_failures >= settings.UPSTREAM_MAX_FAILURES:
+            ep.ejected_until = time.monotonic() + settings.UPSTREAM_EJECT_SECONDS
+            logger.warning(
+                {
+                    "event": "upstream_ejected",
+                    "service": service.name,
+                    "endpoint": ep.url,
+                    "failures": ep.consecutive_failures,
+                }
+            )
+
+    def get_service(self, name: str) -> Service:
+        service = self.services.get(name)
+        if service is None:
+            raise NoHealthyUpstream(f"Unknown upstream service {name}")
+        return service
+
+    # ----- request API -----
+    async def request(
+        self,
+        service_name: str,
+        method: str,
+        path: str,
+        exclude=(),
+        endpoint: Endpoint | None = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Send a request to the best available replica of a service, or to
+        `endpoint` when the caller has already picked one.
+        """
+        kwargs = self._prepare(kwargs)
+        service = self.get_service(service_name)
+        ep = endpoint or service.pick(exclude)
+        ep.outstanding += 1
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            res = await self.client.request(method, f"{ep.url}{path}", **kwargs)
+            outcome = "ok" if res.status_code < 500 else "error"
+            return res
+        except httpx.TimeoutException:
+            if deadline.expired():
+                outcome = "deadline"
+                deadline.deadline_exceeded_total.inc(outcome="cut_off")
+                raise deadline.DeadlineExceeded("Request deadline exceeded")
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._record(service, ep, time.monotonic() - started, outcome)
+
+    @asynccontextmanager
+    async def stream(self, service_name: str, method: str, path: str, **kwargs):
+        """Open a streaming response from the best available replica."""
+        kwargs = self._prepare(kwargs)
+        service = self.get_service(service_name)
+        ep = service.pick()
+        ep.outstanding += 1
+        started = time.monotonic()
+        elapsed = None
+        outcome = "error"
+        try:
+            async with self.client.stream(method, f"{ep.url}{path}", **kwargs) as res:
+                # Time to headers: stream lifetimes say nothing about latency.
+                elapsed = time.monotonic() - started
+                outcome = "ok" if res.status_code < 500 else "error"
+                yield res
+        except asyncio.CancelledError:
+            if elapsed is None:
+                outcome = "cancelled"
+            raise
+        finally:
+            if elapsed is None:
+                elapsed = time.monotonic() - started
+            self._record(service, ep, elapsed, outcome)
+
+    # ----- active health checks -----
+    async def _probe(self, service: Service, ep: Endpoint):
+        try:
+            res = await self.client.get(
+                f"{ep.url}{service.health_path}",
+                timeout=settings.UPSTREAM_HEALTH_TIMEOUT_S,
+            )
+            # Any non-5xx answer proves the replica is up and serving.
+            healthy = res.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != ep.healthy:
+            logger.info(
+                {
+                    "event": "upstream_health_changed",
+                    "service": service.name,
+                    "endpoint": ep.url,
+                    "healthy": healthy,
+                }
+            )
+        ep.healthy = healthy
+        if healthy and ep.ejected_until and time.monotonic() >= ep.ejected_until:
+            ep.consecutive_failures = 0
+            ep.ejected_until = 0.0
+
+    async def _health_loop(self):
+        while True:
+            if self._config_changed():
+                try:
+                    self.reload()
+                except CONFIG_ERRORS as e:
+                    logger.error({"event": "upstreams_reload_error", "error": str(e)})
+            await asyncio.gather(
+                *(
+                    self._probe(service, ep)
+                    for service in list(self.services.values())
+                    for ep in list(service.endpoints.values())
+                )
+            )
+            await asyncio.sleep(settings.UPSTREAM_HEALTH_INTERVAL_S)
+
+    def start(self):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "health_path": s.health_path,
+                "endpoints": [ep.snapshot() for ep in s.endpoints.values()],
+            }
+            for name, s in self.services.items()
+        }
+
+
+upstreams = UpstreamRegistry()
@@ -0,0 +1,229 @@
+"""
+Cache warming for SBOM-derived views.
+
+Right after an SBOM is uploaded (or its vulnerabilities refreshed) the whole
+project team asks for the same views. `warmer.warm_sbom()` queues a job that
+loads them into the gateway response cache in the background, so those
+first reads are cache hits instead of cold upstream calls.
+
+Jobs are keyed by SBOM ID: a newer job for the same SBOM replaces a queued
+or running one, and any job can be cancelled through the admin routes.
+At most CACHE_WARM_CONCURRENCY views are fetched at once.
+"""
+
+import asyncio
+from collections import deque
+from urllib.parse import urlencode
+
+from app.core.cache import LOAD_ERRORS, Loader, ResponseCache
+from app.core.config import settings
+from app.core.hedging import hedger
+from app.core.metrics import metrics
+from app.core.upstreams import upstreams
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+SBOM_SERVICE = "sbom-service"
+VULN_SERVICE = "vulnerability-service"
+RISK_SERVICE = "risk-service"
+
+warm_jobs_total = metrics.counter(
+    "gateway_cache_warm_jobs_total",
+    "Cache warming jobs by outcome (queued, replaced, cancelled, dropped, done)",
+)
+warm_fetches_total = metrics.counter(
+    "gateway_cache_warm_fetches_total",
+    "Views fetched by the warmer by cache and outcome (stored, skipped, error)",
+)
+
+# ----- cached views -----
+vuln_cache = ResponseCache("vuln_by_sbom", settings.VULN_CACHE_TTL_S)
+risk_cache = ResponseCache("risk_score", settings.RISK_CACHE_TTL_S)
+recent_cache = ResponseCache("sbom_recent", settings.SBOM_RECENT_CACHE_TTL_S)
+# Only field projections of SBOM documents are cached (see app.core.projection).
+sbom_cache = ResponseCache("sbom_projection", settings.SBOM_PROJECTION_CACHE_TTL_S)
+
+
+def vulns_loader(sbom_id: str) -> Loader:
+    return lambda: hedger.request(
+        "vuln.by_sbom", VULN_SERVICE, "GET", f"/api/vuln/{sbom_id}"
+    )
+
+
+def risk_loader(sbom_id: str) -> Loader:
+    return lambda: hedger.request(
+        "risk.score",
+        RISK_SERVICE,
+        "GET",
+        "/api/risk/score",
+        params={"sbom_id": sbom_id},
+        timeout=30.0,
+    )
+
+
+def recent_key(params: dict) -> str:
+    return urlencode(sorted(params.items()))
+
+
+def recent_loader(params: dict) -> Loader:
+    return lambda: upstreams.request(
+        SBOM_SERVICE, "GET", "/api/sbom/recent", params=params, timeout=30.0
+    )
+
+
+def sbom_id_from(data) -> str | None:
+    """Pick the SBOM ID out of an sbom-service upload response."""
+    if not isinstance(data, dict):
+        return None
+    for candidate in (data, data.get("sbom"), data.get("data")):
+        if isinstance(candidate, dict):
+            for field in ("sbom_id", "id"):
+                if candidate.get(field) is not None:
+                    return str(candidate[field])
+    return None
+
+
+# ----- warming jobs -----
+Target = tuple[ResponseCache, str, Loader]
+
+
+class WarmJob:
+    def __init__(self, key: str, targets: list[Target]):
+        self.key = key
+        self.targets: deque[Target] = deque(targets)
+        self.running: set[asyncio.Task] = set()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.targets.clear()
+        for task in self.running:
+            task.cancel()
+
+
+class CacheWarmer:
+    def __init__(self):
+        # Jobs with targets still to fetch, oldest first.
+        self._queue: deque[WarmJob] = deque()
+        self._jobs: dict[str, WarmJob] = {}
+        self._wake = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def submit(self, key: str, targets: list[Target]) -> bool:
+        """Queue a job, replacing any job with the same key."""
+        if not settings.CACHE_WARMING_ENABLED:
+            return False
+        if self._cancel(key):
+            warm_jobs_total.inc(outcome="replaced")
+        elif len(self._jobs) >= settings.CACHE_WARM_QUEUE_SIZE:
+            warm_jobs_total.inc(outcome="dropped")
+            return False
+        job = WarmJob(key, targets)
+        self._jobs[key] = job
+        self._queue.append(job)
+        self._wake.set()
+        warm_jobs_total.inc(outcome="queued")
+        return True
+
+    def warm_sbom(self, sbom_id, project_name: str | None = None) -> bool:
+        """Warm the views every developer opens after an upload or refresh."""
+        sbom_id = str(sbom_id)
+        targets = [
+            (vuln_cache, sbom_id, vulns_loader(sbom_id)),
+            (risk_cache, sbom_id, risk_loader(sbom_id)),
+            (recent_cache, recent_key({}), recent_loader({})),
+        ]
+        if project_name:
+            params = {"project_name": project_name}
+            targets.append((recent_cache, recent_key(params), recent_loader(params)))
+        return self.submit(f"sbom:{sbom_id}", targets)
+
+    def _cancel(self, key: str) -> bool:
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def cancel(self, key: str) -> bool:
+        """Cancel a queued or running job; returns False if it is unknown."""
+        cancelled = self._cancel(key)
+        if cancelled:
+            warm_jobs_total.inc(outcome="cancelled")
+        return cancelled
+
+    def _next(self) -> tuple[WarmJob, Target] | None:
+        while self._queue:
+            job = self._queue[0]
+            if job.cancelled or not job.targets:
+                self._queue.popleft()
+                continue
+            target = job.targets.popleft()
+            # Round-robin between jobs so one large job cannot starve others.
+            self._queue.rotate(-1)
+            return job, target
+        return None
+
+    async def _fetch(self, job: WarmJob, target: Target):
+        cache, key, loader = target
+        task = asyncio.create_task(cache.load(key, loader))
+        job.running.add(task)
+        try:
+            entry = await asyncio.shield(task)
+            outcome = "stored" if entry.status == 200 else "skipped"
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # The worker itself is being stopped.
+                task.cancel()
+                raise
+            outcome = "cancelled"
+        except LOAD_ERRORS as e:
+            outcome = "error"
+            logger.warning(
+                {"event": "cache_warm_error", "job": job.key, "error": str(e)}
+            )
+        finally:
+            job.running.discard(task)
+        if outcome != "cancelled":
+            warm_fetches_total.inc(cache=cache.name, outcome=outcome)
+        if not job.targets and not job.running and self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+            warm_jobs_total.inc(outcome="done")
+
+    async def _run_worker(self):
+        while True:
+            item = self._next()
+            if item is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            await self._fetch(*item)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._run_worker())
+                for _ in range(settings.CACHE_WARM_CONCURRENCY)
+            ]
+
+    async def stop(self):
+        for key in list(self._jobs):
+            self._cancel(key)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": settings.CACHE_WARMING_ENABLED,
+            "workers": len(self._workers),
+            "jobs": {
+                key: {"pending": len(job.targets), "running": len(job.running)}
+                for key, job in self._jobs.items()
+            },
+        }
+
+
+warmer = CacheWarmer()
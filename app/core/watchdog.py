@@ -0,0 +1,119 @@
+"""
+Event-loop lag watchdog.
+
+An asyncio task ticks at a fixed interval and records how late each tick
+fires (the loop lag) into a histogram. A companion thread watches the tick
+heartbeat; when the loop has been stuck longer than the stall threshold it
+captures the loop thread's stack — the code that is blocking right now —
+and logs it with the route and request ID of the request being served.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag_seconds = metrics.histogram(
+    "gateway_event_loop_lag_seconds",
+    "Delay between scheduled and actual watchdog ticks",
+    buckets=LAG_BUCKETS,
+)
+loop_stalls_total = metrics.counter(
+    "gateway_event_loop_stalls_total",
+    "Loop stalls longer than the threshold, with the stack captured",
+)
+
+
+def _request_context(frame) -> dict:
+    """Walk outwards from the blocking frame to the ASGI scope that owns it."""
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+            route = scope.get("route")
+            return {
+                "route": getattr(route, "path", None) or scope.get("path"),
+                "method": scope.get("method"),
+                "request_id": scope.get("state", {}).get("request_id"),
+            }
+        frame = frame.f_back
+    return {"route": None, "method": None, "request_id": None}
+
+
+class LoopWatchdog:
+    def __init__(self):
+        self.interval = settings.WATCHDOG_INTERVAL_MS / 1000
+        self.stall_threshold = settings.WATCHDOG_STALL_THRESHOLD_MS / 1000
+        self.lag = 0.0  # EWMA of recent lag, in seconds
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            loop_lag_seconds.observe(lag)
+            # EWMA so a single hiccup does not dominate consumers such as
+            # admission control.
+            self.lag = self.lag * 0.8 + lag * 0.2
+
+    def _watch(self):
+        reported_for = None
+        while not self._stop.wait(self.interval):
+            beat = self._heartbeat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.stall_threshold or reported_for == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported_for = beat
+            loop_stalls_total.inc()
+            logger.warning(
+                {
+                    "event": "loop_stall",
+                    "stalled_ms": int(stalled * 1000),
+                    **_request_context(frame),
+                    "stack": "".join(traceback.format_stack(frame, limit=20)),
+                }
+            )
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._thread = None
+
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,441 @@
+"""
+Durable Stripe webhook queue.
+
+`stripe_webhook` checks the Stripe signature, appends the raw payload and
+signature headers to an embedded SQLite log and acknowledges Stripe right
+away. A background worker forwards events to billing-service in arrival
+order. A failed delivery is retried with exponential backoff without holding
+up the events behind it; an event billing-service rejects with a 4xx is
+dead-lettered at once. Events are de-duplicated by Stripe event ID for
+WEBHOOK_RETENTION_S after delivery.
+
+billing-service verifies the Stripe signature again, with the same secret
+and timestamp tolerance. An event can wait here longer than that (e.g.
+through a billing-service outage), so each delivery carries a fresh
+signature made with STRIPE_WEBHOOK_SECRET; the original was checked on
+receipt. A 400 that still blames the signature is retried rather than
+dead-lettered, as it points at secret configuration, not at the event.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.upstreams import UPSTREAM_ERRORS, upstreams
+from app.utils.logger import setup_logger
+
+logger = setup_logger()
+
+BILLING_SERVICE = "billing-service"
+# Only these headers are needed downstream to verify and parse the event.
+FORWARDED_HEADERS = ("stripe-signature", "content-type", "user-agent")
+# 4xx answers worth retrying; any other 4xx is final.
+RETRYABLE_STATUSES = (408, 425, 429)
+
+webhook_queue_depth = metrics.gauge(
+    "gateway_webhook_queue_depth", "Webhook events waiting for delivery"
+)
+webhook_queue_oldest_age = metrics.gauge(
+    "gateway_webhook_queue_oldest_age_seconds", "Age of the oldest undelivered event"
+)
+webhook_events_total = metrics.counter(
+    "gateway_webhook_events_total",
+    "Webhook events by outcome (rejected, queued, duplicate, delivered, retried, dead)",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL UNIQUE,
+    event_type TEXT,
+    payload BLOB NOT NULL,
+    headers TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    delivered_at REAL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_pending
+    ON webhook_events (delivered_at, dead, seq);
+"""
+
+
+class WebhookRejected(Exception):
+    """A webhook the gateway will not queue, with the HTTP status to answer."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _secrets() -> list[str]:
+    # Comma-separated so a rotated secret can be accepted alongside the new one.
+    return [k.strip() for k in settings.STRIPE_WEBHOOK_SECRET.split(",") if k.strip()]
+
+
+def _check_signature(payload: bytes, header: str | None):
+    if not header:
+        raise WebhookRejected(400, "Missing Stripe-Signature header")
+    timestamp, signatures = None, []
+    for part in header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        raise WebhookRejected(400, "Malformed Stripe-Signature header")
+    if not signatures:
+        raise WebhookRejected(400, "Malformed Stripe-Signature header")
+    if timestamp < time.time() - settings.STRIPE_SIGNATURE_TOLERANCE_S:
+        raise WebhookRejected(400, "Stripe-Signature timestamp is too old")
+
+    keys = _secrets()
+    if not keys:
+        return
+    signed = str(timestamp).encode() + b"." + payload
+    for key in keys:
+        expected = hmac.new(key.encode(), signed, hashlib.sha256).hexdigest()
+        if any(hmac.compare_digest(expected, sig) for sig in signatures):
+            return
+    raise WebhookRejected(400, "Stripe signature does not match")
+
+
+def verify_signature(payload: bytes, header: str | None):
+    """
+    Check a Stripe-Signature header ("t=<unix time>,v1=<hex>,...") the way
+    Stripe's libraries do: t no older than STRIPE_SIGNATURE_TOLERANCE_S and
+    a v1 HMAC-SHA256 of "<t>.<payload>" under one of STRIPE_WEBHOOK_SECRET.
+    Raises WebhookRejected (400) otherwise.
+    """
+    try:
+        _check_signature(payload, header)
+    except WebhookRejected:
+        webhook_events_total.inc(outcome="rejected")
+        raise
+
+
+def _resigned(headers: dict, payload: bytes) -> dict:
+    """
+    The stored headers with a Stripe-Signature for the current time, signed
+    with the first (current) secret. Unchanged when no secret is set.
+    """
+    keys = _secrets()
+    if not keys:
+        return headers
+    timestamp = int(time.time())
+    signed = str(timestamp).encode() + b"." + payload
+    signature = hmac.new(keys[0].encode(), signed, hashlib.sha256).hexdigest()
+    fresh = {k: v for k, v in headers.items() if k.lower() != "stripe-signature"}
+    fresh["stripe-signature"] = f"t={timestamp},v1={signature}"
+    return fresh
+
+
+def _signature_rejected(res) -> bool:
+    text = res.text.lower()
+    return res.status_code == 400 and ("signature" in text or "timestamp" in text)
+
+
+class WebhookQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._listeners = []
+
+    # ----- storage (runs in a worker thread) -----
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # Acknowledged to Stripe means on disk.
+            db.execute("PRAGMA synchronous=FULL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def _run(self, fn, *args):
+        with self._lock:
+            db = self._conn()
+            with db:
+                return fn(db, *args)
+
+    @staticmethod
+    def _insert(db, event_id, event_type, payload, headers) -> bool:
+        known = db.execute(
+            "SELECT 1 FROM webhook_events WHERE event_id = ?", (event_id,)
+        ).fetchone()
+        if known:
+            return False
+        (depth,) = db.execute(
+            "SELECT COUNT(*) FROM webhook_events "
+            "WHERE delivered_at IS NULL AND dead = 0"
+        ).fetchone()
+        if depth >= settings.WEBHOOK_QUEUE_MAX_DEPTH:
+            # Stripe retries 5xx answers for days.
+            raise WebhookRejected(503, "Webhook queue is full")
+        db.execute(
+            "INSERT INTO webhook_events "
+            "(event_id, event_type, payload, headers, received_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (event_id, event_type, payload, headers, time.time()),
+        )
+        return True
+
+    @staticmethod
+    def _next_due(db, now: float):
+        """The oldest event due for an attempt, else when the next one is due."""
+        row = db.execute(
+            "SELECT seq, event_id, event_type, payload, headers, attempts "
+            "FROM webhook_events WHERE delivered_at IS NULL AND dead = 0 "
+            "AND next_attempt_at <= ? ORDER BY seq LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is not None:
+            return row, now
+        (next_at,) = db.execute(
+            "SELECT MIN(next_attempt_at) FROM webhook_events "
+            "WHERE delivered_at IS NULL AND dead = 0"
+        ).fetchone()
+        return None, next_at
+
+    @staticmethod
+    def _mark(db, seq, delivered, dead, attempts, next_at, error):
+        db.execute(
+            "UPDATE webhook_events SET delivered_at = ?, dead = ?, attempts = ?, "
+            "next_attempt_at = ?, last_error = ? WHERE seq = ?",
+            (time.time() if delivered else None, dead, attempts, next_at, error, seq),
+        )
+
+    @staticmethod
+    def _stats(db) -> dict:
+        depth, oldest = db.execute(
+            "SELECT COUNT(*), MIN(received_at) FROM webhook_events "
+            "WHERE delivered_at IS NULL AND dead = 0"
+        ).fetchone()
+        (dead,) = db.execute(
+            "SELECT COUNT(*) FROM webhook_events WHERE dead = 1"
+        ).fetchone()
+        return {
+            "depth": depth,
+            "oldest_age_s": round(time.time() - oldest, 3) if oldest else 0.0,
+            "dead": dead,
+        }
+
+    @staticmethod
+    def _prune(db, before: float):
+        db.execute(
+            "DELETE FROM webhook_events WHERE (delivered_at IS NOT NULL "
+            "AND delivered_at < ?) OR (dead = 1 AND received_at < ?)",
+            (before, before),
+        )
+
+    # ----- public API -----
+    async def enqueue(self, payload: bytes, headers: dict) -> bool:
+        """
+        Durably store an event. Returns False if it was already known; raises
+        WebhookRejected (503) when the queue is full.
+        """
+        try:
+            event = json.loads(payload)
+            event_id, event_type = str(event["id"]), event.get("type")
+        except (ValueError, KeyError, TypeError):
+            # Not a parseable Stripe event: still keep it, keyed by content.
+            event_id = "sha256:" + hashlib.sha256(payload).hexdigest()
+            event_type = None
+        kept = json.dumps(
+            {k: v for k, v in headers.items() if k.lower() in FORWARDED_HEADERS}
+        )
+        try:
+            inserted = await asyncio.to_thread(
+                self._run, self._insert, event_id, event_type, payload, kept
+            )
+        except WebhookRejected:
+            webhook_events_total.inc(outcome="rejected")
+            raise
+        webhook_events_total.inc(outcome="queued" if inserted else "duplicate")
+        if inserted:
+            self._wake.set()
+        return inserted
+
+    def add_listener(self, callback):
+        """Await `callback(event_type, payload)` after each delivered event."""
+        self._listeners.append(callback)
+
+    async def _notify(self, event_type, payload: bytes):
+        for callback in self._listeners:
+            try:
+                await callback(event_type, payload)
+            except Exception:
+                # Listeners are other modules' code: log, and keep notifying.
+                logger.exception({"event": "webhook_listener_error"})
+
+    async def stats(self) -> dict:
+        stats = await asyncio.to_thread(self._run, self._stats)
+        webhook_queue_depth.set(stats["depth"])
+        webhook_queue_oldest_age.set(stats["oldest_age_s"])
+        return stats
+
+    # ----- delivery worker -----
+    def _backoff(self, attempts: int) -> float:
+        delay = min(
+            settings.WEBHOOK_BACKOFF_MAX_S,
+            settings.WEBHOOK_BACKOFF_BASE_S * (2 ** (attempts - 1)),
+        )
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _deliver(self, event_id, payload, headers) -> tuple:
+        """
+        Forward one event. Returns (error, retry): error is None on success,
+        retry False when billing-service rejected the event for good.
+        """
+        try:
+            res = await upstreams.request(
+                BILLING_SERVICE,
+                "POST",
+                "/api/billing/webhook",
+                content=payload,
+                headers=_resigned(json.loads(headers), payload),
+                timeout=settings.WEBHOOK_DELIVERY_TIMEOUT_S,
+            )
+        except UPSTREAM_ERRORS as e:
+            return f"transport: {e}", True
+        if res.status_code < 300:
+            return None, False
+        retry = (
+            res.status_code >= 500
+            or res.status_code in RETRYABLE_STATUSES
+            or _signature_rejected(res)
+        )
+        return f"status {res.status_code}: {res.text[:200]}", retry
+
+    async def process_one(self) -> float | None:
+        """
+        Try to deliver the oldest due event. Returns 0 after an attempt, else
+        how long until the next event is due, or None when the queue is empty.
+        """
+        row, next_at = await asyncio.to_thread(self._run, self._next_due, time.time())
+        if row is None:
+            return None if next_at is None else max(next_at - time.time(), 0.01)
+        seq, event_id, event_type, payload, headers, attempts = row
+
+        error, retry = await self._deliver(event_id, payload, headers)
+        attempts += 1
+        if error is None:
+            await asyncio.to_thread(
+                self._run, self._mark, seq, True, 0, attempts, 0, None
+            )
+            webhook_events_total.inc(outcome="delivered")
+            await self._notify(event_type, payload)
+            return 0
+        dead = not retry or attempts >= settings.WEBHOOK_MAX_ATTEMPTS
+        next_at = time.time() + self._backoff(attempts)
+        await asyncio.to_thread(
+            self._run, self._mark, seq, False, int(dead), attempts, next_at, error
+        )
+        webhook_events_total.inc(outcome="dead" if dead else "retried")
+        logger.warning(
+            {
+                "event": "webhook_delivery_failed",
+                "event_id": event_id,
+                "attempts": attempts,
+                "dead": dead,
+                "error": error,
+            }
+        )
+        # The events behind it go ahead while it backs off.
+        return 0
+
+    async def _run_worker(self):
+        last_prune = 0.0
+        while True:
+            # Cleared before processing so an enqueue meanwhile is not lost.
+            self._wake.clear()
+            try:
+                wait = await self.process_one()
+                await self.stats()
+                if time.time() - last_prune > 3600:
+                    before = time.time() - settings.WEBHOOK_RETENTION_S
+                    await asyncio.to_thread(self._run, self._prune, before)
+                    last_prune = time.time()
+            except (sqlite3.Error, OSError) as e:
+                logger.error({"event": "webhook_worker_error", "error": str(e)})
+                wait = settings.WEBHOOK_BACKOFF_BASE_S
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=wait or 60)
+            except TimeoutError:
+                pass
+
+    def start(self):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            logger.warning(
+                {
+                    "event": "webhook_secret_unset",
+                    "msg": "STRIPE_WEBHOOK_SECRET unset: signatures are not verified",
+                }
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_worker())
+
+    async def flush(self, timeout: float) -> int:
+        """
+        Stop the worker and attempt whatever is due right now, for up to
+        `timeout` seconds. Returns how many delivery attempts were made;
+        undelivered events stay queued on disk.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        processed = 0
+
+        async def deliver_due():
+            nonlocal processed
+            while await self.process_one() == 0:
+                processed += 1
+
+        try:
+            await asyncio.wait_for(deliver_due(), timeout)
+        except TimeoutError:
+            pass
+        except (sqlite3.Error, OSError) as e:
+            logger.error({"event": "webhook_flush_error", "error": str(e)})
+        return processed
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+webhook_queue = WebhookQueue(settings.WEBHOOK_QUEUE_PATH)
@@ -6,6 +6,7 @@ Handles app initialization, rate limiting, analytics middleware, and router regi
 import time
 import uuid
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
@@ -13,14 +14,31 @@ from slowapi import _rate_limit_exceeded_handler
 from jose import JWTError, jwt
 from app.db.models import User
 from app.utils.logger import setup_logger
-from app.core.redis_client import get_redis
+from app.core.redis_client import get_redis, close_async_redis
 from app.core.limiter import limiter  # moved limiter to avoid circular import
+from app.core.admission import AdmissionMiddleware
+from app.core.deadline import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    deadline_aware_http_exception_handler,
+    deadline_exceeded_handler,
+)
+from app.core.analytics import analytics
+from app.core.watchdog import watchdog
+from app.core.upstreams import upstreams
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.webhook_queue import webhook_queue
+from app.core.warming import warmer
+from app.core.drain import DrainMiddleware, drainer
+from app.core.sse import sse_hub
+from app.core.uploads import upload_sessions
 from fastapi import HTTPException
 from app.modules.auth.routes import router as auth_router
 from app.modules.vuln.routes import router as vuln_router
 from app.modules.risk.routes import router as risk_router
 from app.modules.billing.routes import router as billing_router
 from app.modules.sbom.routes import router as sbom_router, projects_router
+from app.modules.admin.routes import router as admin_router
 from app.core.config import settings
 
 app = FastAPI()
@@ -44,8 +62,15 @@ app = FastAPI(
 # --------------------------------------------------------
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_exception_handler(HTTPException, deadline_aware_http_exception_handler)
+app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
+# --------------------------------------------------------
+# Idempotency-Key support (inside CORS, after user is attached)
+# --------------------------------------------------------
+app.add_middleware(IdempotencyMiddleware)
+
 # --------------------------------------------------------
 # Enable CORS
 # --------------------------------------------------------
@@ -67,16 +92,33 @@ app.add_middleware(
 async def startup_event():
     """Initialize Redis on app startup."""
     app.state.redis = get_redis()
+    watchdog.start()
+    analytics.start()
+    upstreams.start()
+    webhook_queue.start()
+    warmer.start()
+    upload_sessions.start()
+    drainer.install()
     logger.info({"event": "startup", "msg": "Redis client initialized"})
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Graceful shutdown."""
+    # A no-op when SIGTERM or the admin endpoint already drained.
+    await drainer.drain()
+    await watchdog.stop()
+    await analytics.stop()
+    await warmer.stop()
+    await upload_sessions.stop()
+    sse_hub.close()
+    await webhook_queue.stop()
+    await upstreams.stop()
     try:
         app.state.redis.close()
     except Exception:
         pass
+    await close_async_redis()
     logger.info({"event": "shutdown", "msg": "App shutdown"})
 
 
@@ -122,6 +164,18 @@ async def attach_user_middleware(request: Request, call_next):
     return response
 
 
+# --------------------------------------------------------
+# Admission Control Middleware: shed load before it queues up
+# --------------------------------------------------------
+app.add_middleware(AdmissionMiddleware)
+
+
+# --------------------------------------------------------
+# Drain Middleware: refuse new work while draining, count in-flight requests
+# --------------------------------------------------------
+app.add_middleware(DrainMiddleware)
+
+
 # --------------------------------------------------------
 # Analytics and Logging Middleware
 # --------------------------------------------------------
@@ -129,9 +183,11 @@ async def attach_user_middleware(request: Request, call_next):
 
 @app.middleware("http")
 async def analytics_and_logging_middleware(request: Request, call_next):
-    """Tracks request latency, logs info, and updates Redis analytics."""
+    """Tracks request latency, logs info, and buffers analytics for Redis."""
     start = time.time()
     request_id = str(uuid.uuid4())
+    # Exposed through the ASGI scope so the loop watchdog can attribute stalls.
+    request.state.request_id = request_id
     client_ip = (
         request.client.host
         if request.client
@@ -153,12 +209,7 @@ async def analytics_and_logging_middleware(request: Request, call_next):
                 "client_ip": client_ip,
             }
         )
-        try:
-            r = app.state.redis
-            r.incr(f"stats:hits:{request.url.path}")
-            r.hincrby(f"stats:status:{request.url.path}", 500, 1)
-        except Exception:
-            pass
+        analytics.record(request.url.path, 500)
         raise
 
     latency = time.time() - start
@@ -175,17 +226,17 @@ async def analytics_and_logging_middleware(request: Request, call_next):
             "client_ip": client_ip,
         }
     )
-
-    try:
-        r = app.state.redis
-        r.incr(f"stats:hits:{request.url.path}")
-        r.hincrby(f"stats:status:{request.url.path}", status, 1)
-    except Exception:
-        logger.warning({"event": "analytics_error", "path": request.url.path})
+    analytics.record(request.url.path, status)
 
     return response
 
 
+# --------------------------------------------------------
+# Request deadlines and cancellation on client disconnect (outermost)
+# --------------------------------------------------------
+app.add_middleware(DeadlineMiddleware)
+
+
 # --------------------------------------------------------
 # Register Routers
 # --------------------------------------------------------
@@ -195,6 +246,7 @@ app.include_router(projects_router, prefix="/api/projects", tags=["Projects"])
 app.include_router(vuln_router, prefix="/api/vulnerability", tags=["Vuln"])
 app.include_router(risk_router, prefix="/api/risk", tags=["Risk"])
 app.include_router(billing_router, prefix="/api/billing", tags=["Billing"])
+app.include_router(admin_router, prefix="/api/gateway", tags=["Gateway Admin"])
 
 
 # --------------------------------------------------------
@@ -204,3 +256,13 @@ app.include_router(billing_router, prefix="/api/billing", tags=["Billing"])
 def root():
     """Basic healthcheck route."""
     return {"status": "ok", "service": "api-gateway"}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: fails once the gateway starts draining."""
+    if drainer.draining:
+        return JSONResponse(
+            status_code=503, content={"status": "draining", "service": "api-gateway"}
+        )
+    return {"status": "ready", "service": "api-gateway"}
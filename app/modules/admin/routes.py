@@ -0,0 +1,120 @@
+"""
+Gateway admin routes.
+Exposes live gateway internals to administrators.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.admission import admission
+from app.core.cache import caches
+from app.core.drain import drainer
+from app.core.hedging import hedger
+from app.core.metrics import metrics
+from app.core.quotas import plan_cache
+from app.core.sse import sse_hub
+from app.core.upstreams import CONFIG_ERRORS, upstreams
+from app.core.warming import warmer
+from app.core.webhook_queue import webhook_queue
+from app.utils.security import require_role
+
+router = APIRouter(dependencies=[Depends(require_role(["admin"]))])
+
+
+# ----- ADMISSION CONTROL -----
+@router.get("/admission")
+async def admission_status():
+    """Return live admission limits, in-flight counts and loop lag."""
+    return admission.snapshot()
+
+
+# ----- METRICS -----
+@router.get("/metrics")
+async def gateway_metrics():
+    """Return all in-process gateway metrics."""
+    return metrics.snapshot()
+
+
+# ----- UPSTREAMS -----
+@router.get("/upstreams")
+async def upstream_status():
+    """Return every upstream endpoint with its health and load stats."""
+    return upstreams.snapshot()
+
+
+@router.post("/upstreams/reload")
+async def reload_upstreams():
+    """Re-read endpoint lists from config without restarting the gateway."""
+    try:
+        return upstreams.reload()
+    except CONFIG_ERRORS as e:
+        raise HTTPException(status_code=500, detail=f"Upstream reload error: {e}")
+
+
+# ----- HEDGING -----
+@router.get("/hedging")
+async def hedging_status():
+    """Return hedge-enabled routes, their current delays and the budget."""
+    return hedger.snapshot()
+
+
+# ----- WEBHOOK QUEUE -----
+@router.get("/webhooks")
+async def webhook_queue_status():
+    """Return webhook queue depth, oldest event age and dead-letter count."""
+    return await webhook_queue.stats()
+
+
+# ----- RESPONSE CACHES -----
+@router.get("/caches")
+async def cache_status():
+    """Return hit ratio and refresh activity of every response cache."""
+    return {name: cache.snapshot() for name, cache in caches.items()}
+
+
+# ----- CACHE WARMING -----
+@router.get("/warming")
+async def warming_status():
+    """Return queued and running cache warming jobs."""
+    return warmer.snapshot()
+
+
+@router.delete("/warming/{job_key}")
+async def cancel_warming(job_key: str):
+    """Cancel a queued or running cache warming job (e.g. sbom:<id>)."""
+    if not warmer.cancel(job_key):
+        raise HTTPException(status_code=404, detail="No such warming job")
+    return {"cancelled": job_key}
+
+
+# ----- PLAN QUOTAS -----
+@router.get("/plans")
+async def plan_quota_status():
+    """Return cached plan counts and the quota table per plan."""
+    return plan_cache.snapshot()
+
+
+# ----- EVENT STREAMS -----
+@router.get("/streams")
+async def stream_status():
+    """Return connected clients and buffered events per project stream."""
+    return sse_hub.snapshot()
+
+
+# ----- DRAINING -----
+@router.get("/drain")
+async def drain_status():
+    """Return whether the gateway is draining and how the drain went."""
+    return drainer.snapshot()
+
+
+@router.post("/drain", status_code=202)
+async def start_drain(exit: bool = False):
+    """
+    Start draining this instance. With `exit=true` the process shuts down
+    once drained, as it would on SIGTERM.
+    """
+    if exit:
+        drainer.request_exit()
+    else:
+        drainer.start()
+    return drainer.snapshot()
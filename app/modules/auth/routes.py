@@ -5,14 +5,25 @@ Handles registration, login, and token refresh endpoints.
 
 from fastapi import APIRouter, HTTPException, Request, Depends, Response
 from fastapi.responses import JSONResponse
-import httpx
+from app.core.cache import ResponseCache
+from app.core.config import settings
 from app.core.limiter import limiter
+from app.core.upstreams import upstreams
+from app.utils.pagination import paginated_list
 from app.utils.security import require_role
 
 router = APIRouter()
 
-# URL of user-service
-USER_SERVICE_URL = "http://user-service:8001"
+# Upstream name of user-service (see app.core.upstreams)
+USER_SERVICE = "user-service"
+
+# Per-user GitHub repo listings; user-service calls the GitHub API on a miss.
+github_repos_cache = ResponseCache("github_repos", settings.GITHUB_REPOS_CACHE_TTL_S)
+
+
+def _user_id(request: Request):
+    user = getattr(request.state, "user", None)
+    return getattr(user, "id", None)
 
 
 # ----- REGISTER -----
@@ -22,10 +33,9 @@ async def register_user(request: Request):
     """Forward register request to User Service."""
     try:
         payload = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{USER_SERVICE_URL}/api/users/register", json=payload
-            )
+        res = await upstreams.request(
+            USER_SERVICE, "POST", "/api/users/register", json=payload
+        )
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -39,8 +49,9 @@ async def login_user(request: Request, response: Response):
     """Forward login request to User Service."""
     try:
         payload = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.post(f"{USER_SERVICE_URL}/api/users/login", json=payload)
+        res = await upstreams.request(
+            USER_SERVICE, "POST", "/api/users/login", json=payload
+        )
 
         if "set-cookie" in res.headers:
             cookies = res.headers.get_list("set-cookie")
@@ -62,10 +73,13 @@ async def refresh_token(request: Request, response: Response):
         # Forward cookies from client to User Service
         cookies = request.cookies
 
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            res = await client.post(
-                f"{USER_SERVICE_URL}/api/users/refresh-token", cookies=cookies
-            )
+        res = await upstreams.request(
+            USER_SERVICE,
+            "POST",
+            "/api/users/refresh-token",
+            cookies=cookies,
+            follow_redirects=True,
+        )
 
         # Copy refreshed cookie (if any)
         if "set-cookie" in res.headers:
@@ -82,8 +96,7 @@ async def refresh_token(request: Request, response: Response):
 @router.get("/admin/dashboard", dependencies=[Depends(require_role(["admin"]))])
 async def admin_dashboard(request: Request):
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{USER_SERVICE_URL}/api/admin/dashboard")
+        res = await upstreams.request(USER_SERVICE, "GET", "/api/admin/dashboard")
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -94,11 +107,21 @@ async def admin_dashboard(request: Request):
 # ----- ADMIN GET ALL USERS -----
 @router.get("/admin/users/", dependencies=[Depends(require_role(["admin"]))])
 async def get_all_users(request: Request):
-    """Forward request to User Service to retrieve all users."""
+    """
+    Forward request to User Service to retrieve all users.
+    Supports limit/cursor pagination and format=ndjson streaming.
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{USER_SERVICE_URL}/api/admin/users")
-        return res.json()
+        return await paginated_list(
+            request,
+            "users.list",
+            USER_SERVICE,
+            "/api/admin/users",
+            # The upstream answers with a bare JSON array.
+            list_key=None,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Gateway → User Service error: {str(e)}"
@@ -111,11 +134,9 @@ async def update_user(request: Request, user_id: int):
     """Forward update user request to User Service."""
     try:
         payload = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.put(
-                f"{USER_SERVICE_URL}/api/admin/users/{user_id}",
-                json=payload,
-            )
+        res = await upstreams.request(
+            USER_SERVICE, "PUT", f"/api/admin/users/{user_id}", json=payload
+        )
         return JSONResponse(content=res.json(), status_code=res.status_code)
     except Exception as e:
         raise HTTPException(
@@ -128,8 +149,7 @@ async def update_user(request: Request, user_id: int):
 @router.post("/logout")
 async def logout_user(request: Request):
     """Forward logout request to User Service."""
-    async with httpx.AsyncClient() as client:
-        res = await client.post(f"{USER_SERVICE_URL}/api/users/logout")
+    res = await upstreams.request(USER_SERVICE, "POST", "/api/users/logout")
     return res.json()
 
 
@@ -145,8 +165,7 @@ async def test_auth(request: Request):  # added request argument
 async def github_connect(request: Request):
     """Forward GitHub connect request to User Service."""
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{USER_SERVICE_URL}/auth/github/connect")
+        res = await upstreams.request(USER_SERVICE, "GET", "/auth/github/connect")
         return JSONResponse(content=res.json(), status_code=res.status_code)
     except Exception as e:
         raise HTTPException(
@@ -165,13 +184,19 @@ async def github_callback(request: Request):
         auth_header = request.headers.get("Authorization")
         cookies = request.cookies
 
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{USER_SERVICE_URL}/auth/github/callback",
-                params={"code": code, "state": state},
-                cookies=cookies,
-                headers={"Authorization": auth_header} if auth_header else {},
-            )
+        res = await upstreams.request(
+            USER_SERVICE,
+            "GET",
+            "/auth/github/callback",
+            params={"code": code, "state": state},
+            cookies=cookies,
+            headers={"Authorization": auth_header} if auth_header else {},
+        )
+
+        # A (re)connected GitHub account may see a different set of repos.
+        user_id = _user_id(request)
+        if res.status_code < 400 and user_id is not None:
+            await github_repos_cache.invalidate(str(user_id))
 
         return Response(
             content=res.content, status_code=res.status_code, headers=res.headers
@@ -188,15 +213,22 @@ async def github_repos(request: Request, token: str = None):
     """
     Forward GitHub repos request to User Service.
     Token is optional; user-service will read github_token from DB if logged in.
+    Listings are cached per authenticated user and refreshed in the background.
     """
     try:
         # Forward cookies for auth
         cookies = request.cookies
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{USER_SERVICE_URL}/auth/github/repos", cookies=cookies
+
+        async def load():
+            return await upstreams.request(
+                USER_SERVICE, "GET", "/auth/github/repos", cookies=cookies
             )
-        return JSONResponse(content=res.json(), status_code=res.status_code)
+
+        user_id = _user_id(request)
+        if user_id is None:
+            res = await load()
+            return JSONResponse(content=res.json(), status_code=res.status_code)
+        return await github_repos_cache.get(str(user_id), load)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Gateway → User Service error: {str(e)}"
@@ -5,14 +5,17 @@ Forwards requests from API Gateway to Billing Service.
 
 from app.utils.logger import setup_logger
 from fastapi import APIRouter, Depends, HTTPException, Request
-import httpx
+from app.core.quotas import plan_cache, plan_from_subscription
+from app.core.upstreams import upstreams
+from app.core.config import settings
+from app.core.webhook_queue import WebhookRejected, verify_signature, webhook_queue
 from app.utils.security import require_role
 
 router = APIRouter()
 logger = setup_logger()
 
-# URL of Billing Service
-BILLING_SERVICE_URL = "http://billing-service:8005"
+# Upstream name of Billing Service (see app.core.upstreams)
+BILLING_SERVICE = "billing-service"
 
 
 # ----- CREATE CHECKOUT SESSION -----
@@ -31,15 +34,16 @@ async def create_checkout(request: Request):
         if user:
             body["user"] = {"id": user.id, "email": user.email}
         logger.info(
-            f"Forwarding /create-checkout-session to Billing Service: {BILLING_SERVICE_URL}/api/billing/create-checkout-session"
+            f"Forwarding /create-checkout-session to Billing Service: {BILLING_SERVICE}/api/billing/create-checkout-session"
         )
 
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{BILLING_SERVICE_URL}/api/billing/create-checkout-session",
-                json=body,
-                timeout=30.0,
-            )
+        res = await upstreams.request(
+            BILLING_SERVICE,
+            "POST",
+            "/api/billing/create-checkout-session",
+            json=body,
+            timeout=30.0,
+        )
 
         return res.json()
     except Exception as e:
@@ -51,31 +55,45 @@ async def create_checkout(request: Request):
 
 
 # ----- STRIPE WEBHOOK -----
+async def _read_body(request: Request, limit: int) -> bytes:
+    """Read the request body, refusing with 413 beyond `limit` bytes."""
+    too_large = HTTPException(status_code=413, detail="Webhook payload too large")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
+
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
     """
-    Forward Stripe webhook payload to Billing Service.
-    Note: No authentication required — this is called directly by Stripe servers.
+    Queue Stripe webhook payload for delivery to Billing Service.
+    Note: No user authentication — this is called directly by Stripe servers,
+    so the Stripe-Signature header is verified before anything is stored.
+    The event is stored durably and acknowledged at once; a background worker
+    forwards it (see app.core.webhook_queue).
     """
     try:
-        payload = await request.body()
+        payload = await _read_body(request, settings.WEBHOOK_MAX_BODY_BYTES)
         headers = dict(request.headers)
 
-        logger.info(
-            f"Forwarding /webhook to Billing Service: {BILLING_SERVICE_URL}/api/billing/webhook"
-        )
-
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{BILLING_SERVICE_URL}/api/billing/webhook",
-                content=payload,
-                headers=headers,
-                timeout=30.0,
-            )
+        verify_signature(payload, headers.get("stripe-signature"))
+        queued = await webhook_queue.enqueue(payload, headers)
+        logger.info(f"Queued /webhook for Billing Service (new event: {queued})")
 
-        return res.json()
+        return {"received": True, "duplicate": not queued}
+    except WebhookRejected as e:
+        logger.warning(f"Rejected /webhook request: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error forwarding /webhook request: {str(e)}")
+        logger.error(f"Error queueing /webhook request: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Gateway -> Billing Service webhook error: {str(e)}",
@@ -92,16 +110,19 @@ async def get_latest_subscription(request: Request):
         user = getattr(request.state, "user", None)
         headers = {"X-User-ID": str(user.id)} if user else {}
 
-        print("User: ", user)
-
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{BILLING_SERVICE_URL}/api/billing/latest-subscription",
-                headers=headers,
-                timeout=15.0,
-            )
+        res = await upstreams.request(
+            BILLING_SERVICE,
+            "GET",
+            "/api/billing/latest-subscription",
+            headers=headers,
+            timeout=15.0,
+        )
 
-        return res.json()
+        data = res.json()
+        # Free refresh of the plan used for quotas.
+        if user and res.status_code < 300:
+            plan_cache.put(str(user.id), plan_from_subscription(data))
+        return data
     except Exception as e:
         logger.error(f"Error forwarding /latest-subscription: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Gateway error: {str(e)}")
@@ -115,14 +136,12 @@ async def get_subscription_plans(request: Request):
     """
     try:
         logger.info(
-            f"Forwarding /plans to Billing Service: {BILLING_SERVICE_URL}/api/billing/plans"
+            f"Forwarding /plans to Billing Service: {BILLING_SERVICE}/api/billing/plans"
         )
 
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{BILLING_SERVICE_URL}/api/billing/plans",
-                timeout=15.0,
-            )
+        res = await upstreams.request(
+            BILLING_SERVICE, "GET", "/api/billing/plans", timeout=15.0
+        )
 
         return res.json()
     except Exception as e:
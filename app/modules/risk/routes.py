@@ -3,15 +3,18 @@ Risk module routes.
 Forwards requests from API Gateway to Risk Service.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request, logger
-import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.core.hedging import hedger
+from app.core.upstreams import upstreams
+from app.core.warming import risk_cache, risk_loader
+from app.utils.logger import setup_logger
 from app.utils.security import require_role
 
-
 router = APIRouter()
+logger = setup_logger()
 
-# URL of Risk Service
-RISK_SERVICE_URL = "http://risk-service:8004"
+# Upstream name of Risk Service (see app.core.upstreams)
+RISK_SERVICE = "risk-service"
 
 
 # ----- GET RISK SCORE -----
@@ -28,13 +31,23 @@ async def risk_score(request: Request):
                 status_code=400, detail="Missing sbom_id query parameter"
             )
 
+        # Plain per-SBOM lookups are cached (and warmed after uploads).
+        if list(params) == ["sbom_id"]:
+            return await risk_cache.get(
+                params["sbom_id"], risk_loader(params["sbom_id"])
+            )
+
         logger.info(
-            f"Forwarding /score request to Risk Service: {RISK_SERVICE_URL}/api/risk/score with params {params}"
+            f"Forwarding /score request to Risk Service: {RISK_SERVICE}/api/risk/score with params {params}"
+        )
+        res = await hedger.request(
+            "risk.score",
+            RISK_SERVICE,
+            "GET",
+            "/api/risk/score",
+            params=params,
+            timeout=30.0,
         )
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{RISK_SERVICE_URL}/api/risk/score", params=params, timeout=30.0
-            )
         return res.json()
     except Exception as e:
         logger.error(f"Error forwarding /score request: {str(e)}")
@@ -52,10 +65,11 @@ async def risk_trends(request: Request):
     try:
         params = dict(request.query_params)
         logger.info(
-            f"Forwarding /trends request to Risk Service: {RISK_SERVICE_URL}/api/risk/trends with params {params}"
+            f"Forwarding /trends request to Risk Service: {RISK_SERVICE}/api/risk/trends with params {params}"
+        )
+        res = await upstreams.request(
+            RISK_SERVICE, "GET", "/api/risk/trends", timeout=30.0
         )
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{RISK_SERVICE_URL}/api/risk/trends", timeout=30.0)
         logger.info(f"Risk Service responded: status={res.status_code}")
         return res.json()
     except Exception as e:
@@ -3,20 +3,63 @@ SBOM module routes.
 Forwards requests from API Gateway to SBOM Service.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, logger
-import httpx
+import asyncio
+import secrets
+from typing import Annotated
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.core.config import settings
+from app.core.hedging import hedger
+from app.core.projection import projected
+from app.core.quotas import plan_quota
+from app.core.sbom_dedupe import digest_file, digest_index, sbom_dedupe_total
+from app.core.uploads import UploadError, upload_sessions
+from app.core.upstreams import UPSTREAM_ERRORS, upstreams
+from app.core.warming import (
+    recent_cache,
+    recent_key,
+    recent_loader,
+    sbom_cache,
+    sbom_id_from,
+    warmer,
+)
+from app.utils.batch import (
+    NDJSON_MEDIA_TYPE,
+    bounded_as_completed,
+    fetch_batch_item,
+    ndjson_line,
+    parse_batch_request,
+)
+from app.utils.logger import setup_logger
+from app.utils.pagination import paginated_list
 from app.utils.security import require_role
 
 router = APIRouter()
+logger = setup_logger()
+
+# Upstream name of sbom-service (see app.core.upstreams)
+SBOM_SERVICE = "sbom-service"
+# File read size when streaming an upload on to SBOM Service.
+UPLOAD_READ_BYTES = 256 * 1024
 
-# URL of sbom-service
-SBOM_SERVICE_URL = "http://sbom-service:8002"
+# Decoded JWT of a caller with the developer role.
+DeveloperToken = Annotated[dict, Depends(require_role(["developer"]))]
 
 
 # ----- UPLOAD SBOM -----
-@router.post("/upload", dependencies=[Depends(require_role(["developer"]))])
+@router.post(
+    "/upload",
+    dependencies=[Depends(require_role(["developer"])), Depends(plan_quota("upload"))],
+)
 async def upload_sbom(request: Request, file: UploadFile = File(...)):
-    """Forward SBOM upload to SBOM Service."""
+    """
+    Forward SBOM upload to SBOM Service.
+    An upload identical to a recent one for the same project (by content
+    digest) returns the existing SBOM ID with "deduplicated": true instead.
+    Send form field force=true to upload regardless.
+    """
     try:
         form = await request.form()
         project_name = form.get("project_name")
@@ -24,75 +67,371 @@ async def upload_sbom(request: Request, file: UploadFile = File(...)):
         if not project_name:
             raise HTTPException(status_code=400, detail="Missing project_name")
 
-        # Prepare multipart/form-data to send
-        form_data = {
-            "project_name": (None, project_name),
-            "file": (file.filename, await file.read(), file.content_type),
-        }
-
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{SBOM_SERVICE_URL}/api/sbom/upload", files=form_data, timeout=60.0
-            )
-        return res.json()
+        force = str(form.get("force", "")).lower() in ("1", "true", "yes")
+        _, data = await _forward_upload(
+            project_name, file.filename, file.file, file.content_type, force, 60.0
+        )
+        return data
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Gateway -> SBOM Service upload error: {str(e)}"
         )
 
 
-# ----- GET SBOM BY ID -----
-@router.get("/{sbom_id}", dependencies=[Depends(require_role(["developer"]))])
-async def get_sbom(sbom_id: str):
-    """Forward get SBOM by ID."""
+async def _forward_upload(
+    project_name: str,
+    filename: str,
+    fileobj,
+    content_type: str,
+    force: bool,
+    timeout: float,
+):
+    """
+    Dedupe then stream an SBOM file object to SBOM Service.
+    Returns (status_code, response body).
+    """
+    digest = None
+    if settings.SBOM_DEDUPE_ENABLED:
+        digest, kind = await asyncio.to_thread(digest_file, fileobj)
+        if force:
+            sbom_dedupe_total.inc(outcome="bypassed")
+        else:
+            existing = await _find_duplicate(project_name, digest)
+            if existing is not None:
+                sbom_dedupe_total.inc(outcome="duplicate")
+                return 200, {
+                    "sbom_id": existing,
+                    "project_name": project_name,
+                    "digest": digest,
+                    "digest_kind": kind,
+                    "deduplicated": True,
+                }
+            sbom_dedupe_total.inc(outcome="new")
+
+    # multipart/form-data, streamed with the file read in chunks.
+    headers, body = await _multipart_upload(
+        project_name, filename, fileobj, content_type
+    )
+    res = await upstreams.request(
+        SBOM_SERVICE,
+        "POST",
+        "/api/sbom/upload",
+        content=body,
+        headers=headers,
+        timeout=timeout,
+    )
+    data = res.json()
+    sbom_id = sbom_id_from(data)
+    if res.status_code < 300 and sbom_id:
+        if digest is not None:
+            await digest_index.remember(project_name, digest, sbom_id)
+        warmer.warm_sbom(sbom_id, project_name)
+    if isinstance(data, dict) and res.status_code < 300:
+        data["deduplicated"] = False
+    return res.status_code, data
+
+
+async def _multipart_upload(project_name: str, filename, fileobj, content_type):
+    """
+    Headers and an async body for SBOM Service's upload form. The file is
+    read from its start in worker threads, so the loop never waits on disk.
+    """
+    boundary = secrets.token_hex(16)
+    # Quoted the way browsers and httpx do it.
+    quoted = (filename or "upload").translate(
+        {ord('"'): "%22", ord("\r"): "%0D", ord("\n"): "%0A"}
+    )
+    head = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="project_name"\r\n\r\n'
+        f"{project_name}\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{quoted}"\r\n'
+        f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    def size() -> int:
+        fileobj.seek(0, 2)
+        end = fileobj.tell()
+        fileobj.seek(0)
+        return end
+
+    length = len(head) + await asyncio.to_thread(size) + len(tail)
+
+    async def body():
+        yield head
+        while chunk := await asyncio.to_thread(fileobj.read, UPLOAD_READ_BYTES):
+            yield chunk
+        yield tail
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(length),
+    }
+    return headers, body()
+
+
+async def _find_duplicate(project_name: str, digest: str):
+    """
+    Return the SBOM ID of a recent identical upload, if SBOM Service
+    confirms it still exists. When it cannot tell, upload normally.
+    """
+    sbom_id = await digest_index.lookup(project_name, digest)
+    if sbom_id is None:
+        return None
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{SBOM_SERVICE_URL}/api/sbom/{sbom_id}")
-        return res.json()
-    except Exception as e:
+        # Only the status matters: leave before the SBOM body is read.
+        async with upstreams.stream(SBOM_SERVICE, "GET", f"/api/sbom/{sbom_id}") as res:
+            status = res.status_code
+    except UPSTREAM_ERRORS as e:
+        logger.warning({"event": "sbom_dedupe_check_error", "error": str(e)})
+        return None
+    if status == 404:
+        # Deleted since: forget it and process the upload normally.
+        sbom_dedupe_total.inc(outcome="stale")
+        await digest_index.forget(project_name, digest)
+        return None
+    return sbom_id if 200 <= status < 300 else None
+
+
+# ----- RESUMABLE UPLOADS -----
+def _owner(token_data: dict) -> str:
+    return str(token_data.get("id") or token_data.get("sub"))
+
+
+def _upload_error(e: UploadError) -> JSONResponse:
+    content = {"detail": e.detail}
+    headers = {}
+    if e.offset is not None:
+        content["offset"] = e.offset
+        headers["Upload-Offset"] = str(e.offset)
+    return JSONResponse(status_code=e.status_code, content=content, headers=headers)
+
+
+@router.post("/uploads", dependencies=[Depends(plan_quota("upload"))])
+async def create_upload(request: Request, token_data: DeveloperToken):
+    """
+    Start a resumable upload.
+    Body: {"project_name", "filename", "size"?, "content_type"?}.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    if not isinstance(body, dict) or not body.get("project_name"):
+        raise HTTPException(status_code=400, detail="Missing project_name")
+    size = body.get("size")
+    if size is not None and (not isinstance(size, int) or size < 0):
         raise HTTPException(
-            status_code=500, detail=f"Gateway -> SBOM Service upload error: {str(e)}"
+            status_code=400, detail="size must be a non-negative integer"
+        )
+    try:
+        session = upload_sessions.create(
+            _owner(token_data),
+            body["project_name"],
+            body.get("filename") or "sbom.json",
+            body.get("content_type"),
+            size,
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return JSONResponse(
+        status_code=201,
+        content={
+            **session.describe(),
+            "max_chunk_bytes": settings.UPLOAD_MAX_CHUNK_BYTES,
+        },
+    )
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, token_data: DeveloperToken):
+    """Return the session's offset, i.e. where the next chunk must start."""
+    try:
+        session = upload_sessions.get(upload_id, _owner(token_data))
+    except UploadError as e:
+        return _upload_error(e)
+    return JSONResponse(
+        content=session.describe(), headers={"Upload-Offset": str(session.offset)}
+    )
+
+
+@router.put("/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str, request: Request, token_data: DeveloperToken
+):
+    """
+    Append the request body at `Upload-Offset` (must equal the current
+    offset). Optional `Upload-Checksum: sha256 <hex>` verifies the chunk.
+    """
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Upload-Offset header required")
+    checksum = None
+    if "upload-checksum" in request.headers:
+        algo, _, checksum = request.headers["upload-checksum"].partition(" ")
+        if algo.lower() != "sha256" or not checksum:
+            raise HTTPException(
+                status_code=400, detail="Upload-Checksum must be 'sha256 <hex>'"
+            )
+    try:
+        session = upload_sessions.get(upload_id, _owner(token_data))
+        new_offset = await upload_sessions.write_chunk(
+            session, offset, request.stream(), checksum.strip() if checksum else None
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return JSONResponse(
+        content={"upload_id": upload_id, "offset": new_offset},
+        headers={"Upload-Offset": str(new_offset)},
+    )
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: Request, token_data: DeveloperToken):
+    """
+    Hand the assembled file to SBOM Service as a stream.
+    Optional body: {"sha256": "<hex of the whole file>", "force": bool}.
+    The session is kept if SBOM Service fails, so finalize can be retried.
+    """
+    body = {}
+    if await request.body():
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be JSON")
+    try:
+        session = upload_sessions.get(upload_id, _owner(token_data))
+        async with upload_sessions.exclusive(session):
+            size = session.meta.get("size")
+            if size is not None and session.offset != size:
+                raise UploadError(409, "Upload is incomplete", offset=session.offset)
+            expected = body.get("sha256")
+            if expected and await upload_sessions.sha256(session) != expected.lower():
+                raise UploadError(400, "File checksum mismatch")
+
+            async with await anyio.open_file(session.data_path, "rb") as f:
+                # Only read in worker threads (digest and multipart body).
+                status, data = await _forward_upload(
+                    session.meta["project_name"],
+                    session.meta["filename"],
+                    f.wrapped,
+                    session.meta["content_type"],
+                    bool(body.get("force")),
+                    settings.UPLOAD_FINALIZE_TIMEOUT_S,
+                )
+    except UploadError as e:
+        return _upload_error(e)
+    except (*UPSTREAM_ERRORS, OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=500, detail=f"Gateway -> SBOM Service upload error: {e}"
+        )
+    if status < 300:
+        upload_sessions.discard(session, outcome="finalized")
+    return JSONResponse(status_code=status, content=data)
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str, token_data: DeveloperToken):
+    """Abandon an upload session and delete its spooled data."""
+    try:
+        session = upload_sessions.get(upload_id, _owner(token_data))
+    except UploadError as e:
+        return _upload_error(e)
+    upload_sessions.discard(session)
+    return {"upload_id": upload_id, "aborted": True}
+
+
+# ----- BATCH GET SBOMs -----
+@router.post("/batch", dependencies=[Depends(require_role(["developer"]))])
+async def batch_get_sboms(request: Request):
+    """
+    Fetch many SBOMs in one call: body {"ids": [...], "parallelism": n}.
+    Streams one NDJSON line per ID as soon as it completes:
+    {"id", "status", "data"} or {"id", "status", "error"}.
+    """
+    try:
+        ids, parallelism = parse_batch_request(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def fetch(sbom_id: str):
+        return await fetch_batch_item(
+            sbom_id,
+            lambda: hedger.request(
+                "sbom.get", SBOM_SERVICE, "GET", f"/api/sbom/{sbom_id}"
+            ),
         )
 
+    async def results():
+        async for item in bounded_as_completed(ids, fetch, parallelism):
+            yield ndjson_line(item)
+
+    return StreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
 
 # ----- LIST SBOMs -----
 @router.get("/list", dependencies=[Depends(require_role(["developer"]))])
 async def list_sboms(request: Request):
-    """Forward SBOM list request."""
+    """
+    Forward SBOM list request.
+    Supports limit/cursor pagination and format=ndjson streaming.
+    """
     try:
-        params = dict(request.query_params)
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{SBOM_SERVICE_URL}/api/sbom/list", params=params)
-        return res.json()
+        return await paginated_list(
+            request,
+            "sbom.list",
+            SBOM_SERVICE,
+            "/api/sbom/list",
+            # The upstream answers with a bare JSON array.
+            list_key=None,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
-            status_code=500, detail=f"Gateway -> SBOM Service upload error: {str(e)}"
+            status_code=500, detail=f"Gateway -> SBOM Service list error: {str(e)}"
         )
 
 
 # ----- SHOW RECENT -----
 @router.get("/recent", dependencies=[Depends(require_role(["developer"]))])
 async def show_recent(request: Request):
-    """Forward SBOM recent list request to SBOM Service."""
+    """Forward SBOM recent list request to SBOM Service (cached, warmed on upload)."""
     try:
         # Lấy query params (project_name, limit, ...)
         params = dict(request.query_params)
-
-        logger.info(
-            f"Forwarding /recent request to SBOM Service: {SBOM_SERVICE_URL}/api/sbom/recent with params {params}"
+        return await recent_cache.get(recent_key(params), recent_loader(params))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Gateway -> SBOM Service recent list error: {str(e)}",
         )
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{SBOM_SERVICE_URL}/api/sbom/recent", params=params, timeout=30.0
+
+
+# ----- GET SBOM BY ID -----
+@router.get("/{sbom_id}", dependencies=[Depends(require_role(["developer"]))])
+async def get_sbom(sbom_id: str, fields: str | None = None):
+    """
+    Forward get SBOM by ID.
+    `fields=components.name,...` returns only those fields, cached.
+    """
+    try:
+        if fields:
+            return await projected(
+                sbom_cache, sbom_id, SBOM_SERVICE, f"/api/sbom/{sbom_id}", fields
             )
-        logger.info(
-            f"SBOM Service responded: status={res.status_code} content={res.text}"
+        res = await hedger.request(
+            "sbom.get", SBOM_SERVICE, "GET", f"/api/sbom/{sbom_id}"
         )
         return res.json()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
-            status_code=500,
-            detail=f"Gateway -> SBOM Service recent list error: {str(e)}",
+            status_code=500, detail=f"Gateway -> SBOM Service upload error: {str(e)}"
         )
 
 
@@ -102,11 +441,18 @@ projects_router = APIRouter(dependencies=[Depends(require_role(["developer"]))])
 
 @projects_router.get("/")
 async def list_projects(request: Request):
+    """Supports limit/cursor pagination and format=ndjson streaming."""
     try:
-        params = dict(request.query_params)
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{SBOM_SERVICE_URL}/api/projects", params=params)
-        return res.json()
+        return await paginated_list(
+            request,
+            "projects.list",
+            SBOM_SERVICE,
+            "/api/projects",
+            # The upstream answers with a bare JSON array.
+            list_key=None,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Gateway -> SBOM Service errorrrr: {e}"
@@ -116,8 +462,9 @@ async def list_projects(request: Request):
 @projects_router.get("/{project_id}")
 async def get_project(project_id: int):
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{SBOM_SERVICE_URL}/api/projects/{project_id}")
+        res = await hedger.request(
+            "projects.get", SBOM_SERVICE, "GET", f"/api/projects/{project_id}"
+        )
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -129,8 +476,7 @@ async def get_project(project_id: int):
 async def create_project(request: Request):
     try:
         data = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.post(f"{SBOM_SERVICE_URL}/api/projects", json=data)
+        res = await upstreams.request(SBOM_SERVICE, "POST", "/api/projects", json=data)
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -142,10 +488,9 @@ async def create_project(request: Request):
 async def update_project(project_id: int, request: Request):
     try:
         data = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.put(
-                f"{SBOM_SERVICE_URL}/api/projects/{project_id}", json=data
-            )
+        res = await upstreams.request(
+            SBOM_SERVICE, "PUT", f"/api/projects/{project_id}", json=data
+        )
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -156,8 +501,9 @@ async def update_project(project_id: int, request: Request):
 @projects_router.delete("/{project_id}")
 async def delete_project(project_id: int):
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.delete(f"{SBOM_SERVICE_URL}/api/projects/{project_id}")
+        res = await upstreams.request(
+            SBOM_SERVICE, "DELETE", f"/api/projects/{project_id}"
+        )
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -5,10 +5,10 @@ router = APIRouter()
 
 
 @router.get("/admin/dashboard")
-def admin_dashboard(user=Depends(role_required(["admin"]))):
+async def admin_dashboard(user=Depends(role_required(["admin"]))):
     return {"message": "Welcome Admin!", "user": user}
 
 
 @router.get("/user/profile")
-def user_profile(user=Depends(role_required(["user", "admin"]))):
+async def user_profile(user=Depends(role_required(["user", "admin"]))):
     return {"message": "User Profile Accessed", "user": user}
@@ -5,13 +5,25 @@ Forwards requests from API Gateway to Vulnerability Service.
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
-import httpx
+from app.core.hedging import hedger
+from app.core.projection import projected
+from app.core.quotas import plan_quota
+from app.core.sse import sse_hub
+from app.core.upstreams import upstreams
+from app.core.warming import risk_cache, vuln_cache, vulns_loader, warmer
+from app.utils.batch import (
+    NDJSON_MEDIA_TYPE,
+    bounded_as_completed,
+    fetch_batch_item,
+    ndjson_line,
+    parse_batch_request,
+)
 from app.utils.security import require_role
 
 router = APIRouter()
 
-# URL of vuln-service (chạy trong Docker)
-VULN_SERVICE_URL = "http://vulnerability-service:8003"
+# Upstream name of vuln-service (see app.core.upstreams)
+VULN_SERVICE = "vulnerability-service"
 
 
 # ----- HEALTH CHECK -----
@@ -19,8 +31,7 @@ VULN_SERVICE_URL = "http://vulnerability-service:8003"
 async def health_check():
     """Check vuln service health."""
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{VULN_SERVICE_URL}/api/vuln/health")
+        res = await upstreams.request(VULN_SERVICE, "GET", "/api/vuln/health")
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -35,41 +46,65 @@ async def stream_vulnerabilities(request: Request):
     if not project_name:
         raise HTTPException(status_code=400, detail="project_name required")
 
-    async def event_stream():
-        async with httpx.AsyncClient(timeout=None) as client:
-            # giữ kết nối tới vuln-service SSE
-            async with client.stream(
-                "GET",
-                f"{VULN_SERVICE_URL}/api/vuln/stream",
-                params={"project_name": project_name},
-                headers={"X-From-Gateway": "true"},  # đánh dấu request
-            ) as res:
-                async for line in res.aiter_lines():
-                    if await request.is_disconnected():
-                        print("❌ Client disconnected")
-                        break
-                    if line.strip():
-                        yield f"{line}\n"
-
+    # Browsers resend the last ID they saw on reconnect; polyfills that
+    # cannot set headers pass it as a query parameter instead.
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get(
+        "last_event_id"
+    )
     return StreamingResponse(
-        event_stream(),
+        sse_hub.events(project_name, last_event_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
+            # Stop nginx-style proxies from buffering the stream.
+            "X-Accel-Buffering": "no",
         },
     )
 
 
+# ----- BATCH GET VULNS BY SBOM -----
+@router.post("/batch", dependencies=[Depends(require_role(["developer"]))])
+async def batch_get_vulns(request: Request):
+    """
+    Fetch vulnerability lists for many SBOMs: body {"ids": [...], "parallelism": n}.
+    Streams one NDJSON line per SBOM ID as soon as it completes.
+    """
+    try:
+        ids, parallelism = parse_batch_request(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def fetch(sbom_id: str):
+        return await fetch_batch_item(
+            sbom_id,
+            lambda: hedger.request(
+                "vuln.by_sbom", VULN_SERVICE, "GET", f"/api/vuln/{sbom_id}"
+            ),
+        )
+
+    async def results():
+        async for item in bounded_as_completed(ids, fetch, parallelism):
+            yield ndjson_line(item)
+
+    return StreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
+
 # ----- GET VULNS BY SBOM -----
 @router.get("/{sbom_id}", dependencies=[Depends(require_role(["developer"]))])
-async def get_vulns_by_sbom(sbom_id: str):
-    """Forward request to get vulnerabilities for a given SBOM ID."""
-    print("HERE")
+async def get_vulns_by_sbom(sbom_id: str, fields: str | None = None):
+    """
+    Forward request to get vulnerabilities for a given SBOM ID (cached).
+    `fields=id,severity,...` returns only those fields (see app.core.projection).
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{VULN_SERVICE_URL}/api/vuln/{sbom_id}")
-        return res.json()
+        if fields:
+            return await projected(
+                vuln_cache, sbom_id, VULN_SERVICE, f"/api/vuln/{sbom_id}", fields
+            )
+        return await vuln_cache.get(sbom_id, vulns_loader(sbom_id))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Gateway -> Vuln Service error: {str(e)}"
@@ -77,13 +112,24 @@ async def get_vulns_by_sbom(sbom_id: str):
 
 
 # ----- REFRESH -----
-@router.post("/refresh", dependencies=[Depends(require_role(["developer"]))])
+@router.post(
+    "/refresh",
+    dependencies=[Depends(require_role(["developer"])), Depends(plan_quota("refresh"))],
+)
 async def refresh_vuln(request: Request):
     """Forward vulnerability refresh request."""
     try:
         body = await request.json()
-        async with httpx.AsyncClient() as client:
-            res = await client.post(f"{VULN_SERVICE_URL}/api/vuln/refresh", json=body)
+        res = await upstreams.request(
+            VULN_SERVICE, "POST", "/api/vuln/refresh", json=body
+        )
+        # Drop the refreshed SBOM's views, then reload them before the team
+        # asks for them.
+        if res.status_code < 300 and isinstance(body, dict) and body.get("sbom_id"):
+            sbom_id = str(body["sbom_id"])
+            await vuln_cache.invalidate(sbom_id)
+            await risk_cache.invalidate(sbom_id)
+            warmer.warm_sbom(sbom_id, body.get("project_name"))
         return res.json()
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,317 @@
+"""
+Offline latency and error report over the gateway's JSON logs.
+
+Reads logs/gateway.json and its rotated siblings (gateway.<date>.json) in
+one streaming pass and prints, per time window and route template, the
+request count, error rates and latency percentiles.
+
+    python -m app.tools.log_report logs/ --window 15m
+    python -m app.tools.log_report logs/gateway.json --format csv --jobs 8
+
+Files are memory-mapped and split into newline-aligned byte ranges that are
+scanned by a process pool. Only lines holding a `request` event are
+decoded, with a regex instead of a JSON parse. Every worker keeps one
+log-bucketed histogram per (window, route), so memory is bounded by the
+number of routes and windows, not by log volume, and partial results merge
+by adding bucket counts.
+"""
+
+import argparse
+import ast
+import csv
+import glob
+import json
+import math
+import mmap
+import os
+import re
+import sys
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import UTC, datetime
+
+# Byte ranges handed to a worker.
+RANGE_BYTES = 32 * 1024 * 1024
+# Relative width of a latency bucket: percentiles are exact to within ~2%.
+BUCKET_GROWTH = 1.02
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+_MARKER = b"'event': 'request'"
+_FIELDS = re.compile(
+    rb"'method': '(?P<method>[A-Z]+)', 'path': '(?P<path>[^']*)', "
+    rb"'status': (?P<status>\d+), 'latency_ms': (?P<latency>\d+)"
+)
+_TIMESTAMP = re.compile(rb'"timestamp": (\d+(?:\.\d+)?)')
+
+# Path segments that are identifiers rather than part of the route.
+_ID_SEGMENT = re.compile(
+    r"^(\d+"
+    r"|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|[0-9a-fA-F]{12,}"
+    r"|[A-Za-z0-9_-]{20,})$"
+)
+_WINDOW = re.compile(r"^(\d+)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+Key = tuple[int, str]  # (window start, "METHOD /route/{id}")
+
+
+def normalize_path(path: str) -> str:
+    """/api/sbom/42/x -> /api/sbom/{id}/x"""
+    return "/".join(
+        "{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")
+    )
+
+
+# ----- histogram -----
+class LatencyHistogram:
+    """Sparse log-bucketed histogram of latencies in ms; mergeable."""
+
+    __slots__ = ("buckets", "count", "max")
+
+    def __init__(self):
+        self.buckets: dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.max = 0
+
+    def observe(self, latency_ms: int):
+        # Bucket 0 holds 0 ms; bucket i > 0 covers (g^(i-1), g^i] ms.
+        index = math.ceil(math.log(latency_ms) / _LOG_GROWTH) + 1 if latency_ms else 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.max = max(self.max, latency_ms)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = BUCKET_GROWTH ** (index - 1) if index else 0.0
+                return float(min(upper, self.max))
+        return float(self.max)
+
+
+class RouteStats:
+    __slots__ = ("client_errors", "latency", "server_errors")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.client_errors = 0
+        self.server_errors = 0
+
+    def add(self, status: int, latency_ms: int):
+        self.latency.observe(latency_ms)
+        if status >= 500:
+            self.server_errors += 1
+        elif status >= 400:
+            self.client_errors += 1
+
+    def merge(self, other: "RouteStats"):
+        self.latency.merge(other.latency)
+        self.client_errors += other.client_errors
+        self.server_errors += other.server_errors
+
+
+# ----- scanning -----
+def _parse_slow(line: bytes) -> tuple[float, str, str, int, int] | None:
+    """Fallback for lines the regex cannot read (e.g. quotes in the path)."""
+    try:
+        record = json.loads(line)["record"]
+        event = ast.literal_eval(record["message"])
+        return (
+            record["time"]["timestamp"],
+            event["method"],
+            event["path"],
+            int(event["status"]),
+            int(event["latency_ms"]),
+        )
+    except (ValueError, SyntaxError, KeyError, TypeError):
+        return None
+
+
+def _iter_requests(buf, start: int, end: int) -> Iterator[tuple]:
+    pos = start
+    while pos < end:
+        nl = buf.find(b"\n", pos)
+        if nl == -1:
+            nl = len(buf)
+        # Cheap pre-filter: most lines are not request events.
+        if buf.find(_MARKER, pos, nl) != -1:
+            line = buf[pos:nl]
+            fields = _FIELDS.search(line)
+            ts = _TIMESTAMP.search(line)
+            if fields and ts:
+                yield (
+                    float(ts.group(1)),
+                    fields["method"].decode(),
+                    fields["path"].decode(errors="replace"),
+                    int(fields["status"]),
+                    int(fields["latency"]),
+                )
+            else:
+                parsed = _parse_slow(line)
+                if parsed is not None:
+                    yield parsed
+        pos = nl + 1
+
+
+def scan_range(job: tuple[str, int, int, int]) -> dict[Key, RouteStats]:
+    """Aggregate the request events of one newline-aligned byte range."""
+    path, start, end, window_s = job
+    stats: dict[Key, RouteStats] = {}
+    templates: dict[str, str] = {}
+    with (
+        open(path, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf,
+    ):
+        for ts, method, req_path, status, latency in _iter_requests(buf, start, end):
+            template = templates.get(req_path)
+            if template is None:
+                template = templates[req_path] = normalize_path(req_path)
+            key = (int(ts // window_s) * window_s, f"{method} {template}")
+            route = stats.get(key)
+            if route is None:
+                route = stats[key] = RouteStats()
+            route.add(status, latency)
+    return stats
+
+
+def split_ranges(path: str, window_s: int) -> list[tuple[str, int, int, int]]:
+    """Cut a file into ~RANGE_BYTES pieces that start and end on a newline."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    jobs = []
+    with (
+        open(path, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf,
+    ):
+        start = 0
+        while start < size:
+            end = buf.find(b"\n", min(start + RANGE_BYTES, size - 1))
+            end = size if end == -1 else end + 1
+            jobs.append((path, start, end, window_s))
+            start = end
+    return jobs
+
+
+def find_logs(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "gateway*.json"))))
+        else:
+            files.append(path)
+    return files
+
+
+def build_report(files: list[str], window_s: int, jobs: int) -> dict[Key, RouteStats]:
+    ranges = [r for path in files for r in split_ranges(path, window_s)]
+    if jobs <= 1 or len(ranges) <= 1:
+        return _merge(map(scan_range, ranges))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return _merge(pool.map(scan_range, ranges))
+
+
+def _merge(partials) -> dict[Key, RouteStats]:
+    merged: dict[Key, RouteStats] = {}
+    for partial in partials:
+        for key, route in partial.items():
+            if key in merged:
+                merged[key].merge(route)
+            else:
+                merged[key] = route
+    return merged
+
+
+# ----- output -----
+COLUMNS = [
+    "window_start",
+    "route",
+    "count",
+    "error_rate_5xx",
+    "error_rate_4xx",
+    "p50_ms",
+    "p90_ms",
+    "p99_ms",
+    "max_ms",
+]
+
+
+def rows(report: dict[Key, RouteStats]) -> Iterator[dict]:
+    for (window, route), stats in sorted(report.items()):
+        count = stats.latency.count
+        yield {
+            "window_start": datetime.fromtimestamp(window, tz=UTC).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+            "route": route,
+            "count": count,
+            "error_rate_5xx": round(stats.server_errors / count, 4),
+            "error_rate_4xx": round(stats.client_errors / count, 4),
+            "p50_ms": round(stats.latency.percentile(50), 1),
+            "p90_ms": round(stats.latency.percentile(90), 1),
+            "p99_ms": round(stats.latency.percentile(99), 1),
+            "max_ms": stats.latency.max,
+        }
+
+
+def print_table(report: dict[Key, RouteStats], out=sys.stdout):
+    data = list(rows(report))
+    widths = {
+        col: max([len(col)] + [len(str(row[col])) for row in data]) for col in COLUMNS
+    }
+    print("  ".join(col.ljust(widths[col]) for col in COLUMNS), file=out)
+    for row in data:
+        print("  ".join(str(row[col]).ljust(widths[col]) for col in COLUMNS), file=out)
+
+
+def parse_window(spec: str) -> int:
+    m = _WINDOW.match(spec)
+    if not m or int(m.group(1)) == 0:
+        raise argparse.ArgumentTypeError("window must look like 30s, 15m, 1h or 1d")
+    return int(m.group(1)) * _UNITS[m.group(2)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Per-route latency and error report over gateway JSON logs."
+    )
+    parser.add_argument(
+        "paths", nargs="*", default=["logs"], help="log files or directories"
+    )
+    parser.add_argument("--window", type=parse_window, default="1h")
+    parser.add_argument("--format", choices=("table", "csv", "json"), default="table")
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes"
+    )
+    args = parser.parse_args(argv)
+
+    files = find_logs(args.paths)
+    if not files:
+        parser.error("no log files found")
+    report = build_report(files, args.window, args.jobs)
+
+    if args.format == "json":
+        json.dump(list(rows(report)), sys.stdout, indent=2)
+        print()
+    elif args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows(report))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
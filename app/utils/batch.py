@@ -0,0 +1,81 @@
+"""
+Helpers for batch endpoints: bounded-parallelism fan-out and NDJSON output.
+"""
+
+import asyncio
+import itertools
+import json
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from typing import Any
+
+from app.core.config import settings
+from app.core.upstreams import UPSTREAM_ERRORS
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_line(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+async def bounded_as_completed(
+    items: Iterable,
+    worker: Callable[[Any], Awaitable[Any]],
+    parallelism: int,
+) -> AsyncIterator[Any]:
+    """
+    Run `worker` over `items` with at most `parallelism` calls in flight and
+    yield each result as soon as it is ready (completion order, not input
+    order). Workers are expected to turn their own failures into results.
+    Closing the iterator early cancels whatever is still running.
+    """
+    it = iter(items)
+    pending = {
+        asyncio.ensure_future(worker(i)) for i in itertools.islice(it, parallelism)
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for item in itertools.islice(it, len(done)):
+                pending.add(asyncio.ensure_future(worker(item)))
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def parse_batch_request(body: Any) -> tuple[list, int]:
+    """
+    Validate a `{"ids": [...], "parallelism": n}` batch body and return the
+    de-duplicated IDs and the effective parallelism. Raises ValueError.
+    """
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("Body must be a JSON object with a non-empty 'ids' list")
+    if len(ids) > settings.BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {settings.BATCH_MAX_ITEMS} ids per batch")
+    try:
+        requested = int(body.get("parallelism", settings.BATCH_PARALLELISM))
+    except (TypeError, ValueError):
+        raise ValueError("'parallelism' must be an integer")
+    parallelism = max(1, min(requested, settings.BATCH_MAX_PARALLELISM))
+    # Preserve order, drop duplicates.
+    return list(dict.fromkeys(str(i) for i in ids)), parallelism
+
+
+async def fetch_batch_item(item_id: str, call: Callable[[], Awaitable]) -> dict:
+    """Run one upstream call and turn its outcome into a per-item result."""
+    try:
+        res = await call()
+    except UPSTREAM_ERRORS as e:
+        return {"id": item_id, "status": 502, "error": f"Upstream error: {e}"}
+    try:
+        data = res.json()
+    except ValueError:
+        return {"id": item_id, "status": 502, "error": "Upstream returned non-JSON"}
+    if res.status_code >= 400:
+        return {"id": item_id, "status": res.status_code, "error": data}
+    return {"id": item_id, "status": res.status_code, "data": data}
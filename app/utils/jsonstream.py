@@ -0,0 +1,565 @@
+"""
+Incremental JSON helpers for relaying large upstream documents without
+loading them into memory.
+"""
+
+import codecs
+import hashlib
+import json
+import re
+
+# Bytes that can change the tokenizer state. Everything else is copied as-is.
+_SPECIAL = re.compile(rb'[\[\]{},"\\]')
+
+_QUOTE, _BACKSLASH = ord('"'), ord("\\")
+_OPEN, _CLOSE, _COMMA = b"[{", b"]}", ord(",")
+
+
+class ArrayItemSplitter:
+    """
+    Split a JSON byte stream into the raw bytes of each element of one list.
+
+    `list_key` names the list: None for a top-level array, otherwise the
+    dotted path of keys leading to it through nested objects ("items" for
+    {"items": [...]}, "data.items" for {"data": {"items": [...]}}). Only
+    the element currently being assembled is buffered; everything outside
+    the list is discarded. Call feed() with successive chunks; it returns
+    the elements completed in that chunk. `found` turns true once the list
+    has opened and `done` once it has been closed.
+    """
+
+    def __init__(self, list_key: str | None = None):
+        self.path = list_key.split(".") if list_key else []
+        self.depth = 0
+        self.target_depth = None
+        self.in_string = False
+        self.skip_next = False
+        self.done = False
+        self._item = bytearray()
+        # Containers open above the list: [is_object, key, expecting_key].
+        self._frames: list[list] = []
+        # Bytes of the object key being read, if one is.
+        self._key: bytearray | None = None
+
+    @property
+    def found(self) -> bool:
+        return self.target_depth is not None
+
+    def _flush(self, segment: bytes, out: list[bytes]):
+        self._item += segment
+        item = bytes(self._item).strip()
+        self._item = bytearray()
+        if item:
+            out.append(item)
+
+    def _end_key(self, segment: bytes):
+        raw = bytes(self._key + segment)
+        self._key = None
+        frame = self._frames[-1]
+        frame[1] = json.loads(b'"' + raw + b'"') if b"\\" in raw else raw.decode()
+        frame[2] = False
+
+    def _at_list(self) -> bool:
+        # An array opening where every open container is an object keyed
+        # by the next part of the path.
+        if len(self._frames) != len(self.path):
+            return False
+        return all(
+            is_object and key == part
+            for (is_object, key, _), part in zip(self._frames, self.path)
+        )
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        out: list[bytes] = []
+        if self.done:
+            return out
+        seg_start = key_start = 0
+        skip_to = 1 if self.skip_next else 0
+        self.skip_next = False
+
+        for m in _SPECIAL.finditer(chunk):
+            p = m.start()
+            if p < skip_to:
+                continue
+            c = chunk[p]
+            if self.in_string:
+                if c == _BACKSLASH:
+                    skip_to = p + 2
+                    if skip_to > len(chunk):
+                        self.skip_next = True
+                elif c == _QUOTE:
+                    self.in_string = False
+                    if self._key is not None:
+                        self._end_key(chunk[key_start:p])
+                continue
+            if c == _QUOTE:
+                self.in_string = True
+                if (
+                    self.target_depth is None
+                    and self._frames
+                    and self._frames[-1][2]
+                    and len(self._frames) <= len(self.path)
+                ):
+                    self._key = bytearray()
+                    key_start = p + 1
+            elif c in _OPEN:
+                self.depth += 1
+                if self.target_depth is None:
+                    if c == _OPEN[0] and self._at_list():
+                        self.target_depth = self.depth
+                        seg_start = p + 1
+                    else:
+                        is_object = c == _OPEN[1]
+                        self._frames.append([is_object, None, is_object])
+            elif c in _CLOSE:
+                if self.depth == self.target_depth:
+                    self._flush(chunk[seg_start:p], out)
+                    self.done = True
+                    return out
+                self.depth -= 1
+                if self.target_depth is None and self._frames:
+                    self._frames.pop()
+            elif c == _COMMA:
+                if self.depth == self.target_depth:
+                    self._flush(chunk[seg_start:p], out)
+                    seg_start = p + 1
+                elif self.target_depth is None and self._frames:
+                    self._frames[-1][2] = self._frames[-1][0]
+
+        if self._key is not None:
+            self._key += chunk[key_start:]
+        if self.target_depth is not None:
+            self._item += chunk[seg_start:]
+        return out
+
+
+def compact_line(raw: bytes) -> bytes:
+    """
+    Make a raw JSON value safe for NDJSON. Raw newlines can only be
+    insignificant whitespace (strings must escape them), so drop them.
+    """
+    return raw.replace(b"\r", b"").replace(b"\n", b"") + b"\n"
+
+
+# ----- field projection -----
+# Marks a field kept whole in a field tree.
+WHOLE = object()
+MAX_FIELDS = 64
+
+_WS = re.compile(rb"[ \t\r\n]*")
+_STRING_BODY = re.compile(rb'(?:[^"\\]|\\.)*', re.DOTALL)
+_RAW_SPECIAL = re.compile(rb'["\[\]{}]')
+_SCALAR = re.compile(rb'[^ \t\r\n{}\[\]:,"]+')
+_COLON = ord(":")
+_PUNCT = b"[]{}:,"
+
+
+class ProjectionError(ValueError):
+    """The upstream document is not valid JSON."""
+
+
+def field_paths(spec: str) -> list[str]:
+    """
+    Validate a `fields=` value ("id,package.name,...") and return its
+    dotted paths deduplicated and sorted, i.e. in a canonical order.
+    """
+    paths = sorted({p.strip() for p in spec.split(",") if p.strip()})
+    if not paths:
+        raise ValueError("fields must name at least one field")
+    if len(paths) > MAX_FIELDS:
+        raise ValueError(f"At most {MAX_FIELDS} fields can be requested")
+    for path in paths:
+        if any(not part for part in path.split(".")):
+            raise ValueError(f"Invalid field path: {path!r}")
+    return paths
+
+
+def field_tree(paths: list[str]) -> dict:
+    """["id", "package.name"] -> {"id": WHOLE, "package": {"name": WHOLE}}"""
+    tree: dict = {}
+    for path in paths:
+        *parents, leaf = path.split(".")
+        node = tree
+        for part in parents:
+            node = node.setdefault(part, {})
+            if node is WHOLE:
+                break
+        else:
+            node[leaf] = WHOLE
+    return tree
+
+
+class _Frame:
+    __slots__ = ("container", "emitted", "expect_key", "node", "prefix", "spec")
+
+    def __init__(self, container: int, node: dict):
+        self.container = container
+        self.node = node
+        self.emitted = False
+        self.expect_key = True
+        self.spec = None
+        self.prefix = b""
+
+
+class JsonProjector:
+    """
+    Project a JSON byte stream onto a field tree (see field_tree()) and emit
+    the result as compact JSON, incrementally.
+
+    Paths are dotted object keys from the document root. Arrays are
+    transparent: a path applies to every element, so "vulns.id" keeps the
+    id of each item of {"vulns": [...]}. Kept fields are copied verbatim;
+    everything else is skipped token by token. Only the current token and
+    the open containers on the kept path are held in memory, never the
+    document. Call feed() with successive chunks and close() at the end;
+    both return the projected bytes produced so far.
+    """
+
+    def __init__(self, tree: dict):
+        self._tree = tree
+        self._buf = bytearray()
+        # Where to resume scanning an unfinished string token in _buf.
+        self._resume = 0
+        self._out = bytearray()
+        self._stack: list[_Frame] = []
+        # Nesting inside a value copied or skipped whole.
+        self._raw_depth = 0
+        self._raw_copy = False
+        self._keys: dict = {}
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        self._buf += chunk
+        self._scan(final=False)
+        return self._take()
+
+    def close(self) -> bytes:
+        self._scan(final=True)
+        if not self.done or self._buf.strip():
+            raise ProjectionError("Truncated JSON document")
+        return self._take()
+
+    def _take(self) -> bytes:
+        out = bytes(self._out)
+        self._out.clear()
+        return out
+
+    # ----- tokens -----
+    def _scan(self, final: bool):
+        buf, pos = self._buf, 0
+        n = len(buf)
+        while True:
+            if self._raw_depth:
+                pos = self._raw(buf, pos, n)
+                if self._raw_depth:
+                    break
+            pos = _WS.match(buf, pos).end()
+            if pos >= n:
+                break
+            c = buf[pos]
+            if c == _QUOTE:
+                end = _STRING_BODY.match(buf, max(pos + 1, self._resume)).end()
+                # Unterminated so far, possibly cut after a backslash.
+                if end >= n or buf[end] != _QUOTE:
+                    self._resume = end
+                    break
+                self._resume = 0
+                self._token(c, buf[pos : end + 1])
+                pos = end + 1
+            elif c in _PUNCT:
+                self._token(c, buf[pos : pos + 1])
+                pos += 1
+            else:
+                end = _SCALAR.match(buf, pos).end()
+                # A number at the end of a chunk may continue in the next.
+                if end >= n and not final:
+                    break
+                self._token(c, buf[pos:end])
+                pos = end
+        del buf[:pos]
+        if self._resume:
+            self._resume -= pos
+
+    def _raw(self, buf: bytearray, pos: int, n: int) -> int:
+        """
+        Fast path inside a value kept or skipped whole: only brackets and
+        string boundaries matter. Returns where scanning stopped.
+        """
+        start = pos
+        while self._raw_depth:
+            m = _RAW_SPECIAL.search(buf, pos)
+            if m is None:
+                pos = n
+                break
+            p = m.start()
+            if buf[p] == _QUOTE:
+                end = _STRING_BODY.match(buf, max(p + 1, self._resume)).end()
+                if end >= n or buf[end] != _QUOTE:
+                    self._resume = end
+                    pos = p
+                    break
+                self._resume = 0
+                pos = end + 1
+            else:
+                self._raw_depth += 1 if buf[p] in _OPEN else -1
+                pos = p + 1
+        if self._raw_copy:
+            self._out += buf[start:pos]
+        if not self._raw_depth:
+            self._value_done()
+        return pos
+
+    def _token(self, c: int, raw: bytes):
+        if self.done:
+            raise ProjectionError("Unexpected data after the JSON document")
+        if not self._stack:
+            self._value(c, raw, self._tree, b"")
+            return
+
+        frame = self._stack[-1]
+        if c in _CLOSE:
+            if c != frame.container + 2:  # "[" + 2 == "]", "{" + 2 == "}"
+                raise ProjectionError("Mismatched bracket in JSON document")
+            self._out += raw
+            self._stack.pop()
+            self._value_done()
+        elif c == _COMMA:
+            frame.expect_key = frame.container == _OPEN[1]
+        elif frame.container == _OPEN[0]:
+            self._value(c, raw, frame.node, b"," if frame.emitted else b"")
+        elif frame.expect_key:
+            if c != _QUOTE:
+                raise ProjectionError("Expected an object key")
+            frame.spec = frame.node.get(self._key(raw))
+            frame.prefix = (b"," if frame.emitted else b"") + raw + b":"
+            frame.expect_key = False
+        elif c != _COLON:
+            self._value(c, raw, frame.spec, frame.prefix)
+
+    def _key(self, raw: bytes) -> str:
+        # Records repeat the same few keys: decode each one once.
+        raw = bytes(raw)
+        key = self._keys.get(raw)
+        if key is None:
+            key = json.loads(raw) if _BACKSLASH in raw else raw[1:-1].decode()
+            if len(self._keys) < 4096:
+                self._keys[raw] = key
+        return key
+
+    def _value(self, c: int, raw: bytes, spec, prefix: bytes):
+        if c in _CLOSE or c == _COMMA or c == _COLON:
+            raise ProjectionError("Unexpected punctuation in JSON document")
+        parent = self._stack[-1] if self._stack else None
+        opens = c in _OPEN
+        if spec is None:
+            # Not asked for: skip it.
+            if opens:
+                self._raw_depth, self._raw_copy = 1, False
+            else:
+                self._value_done()
+        elif spec is WHOLE or (parent is None and not opens):
+            self._emit(parent, prefix, raw)
+            if opens:
+                self._raw_depth, self._raw_copy = 1, True
+            else:
+                self._value_done()
+        elif opens:
+            self._emit(parent, prefix, raw)
+            self._stack.append(_Frame(c, spec))
+        else:
+            # A path runs through a scalar: there is nothing below to keep.
+            self._value_done()
+
+    def _emit(self, parent: _Frame | None, prefix: bytes, raw: bytes):
+        self._out += prefix
+        self._out += raw
+        if parent is not None:
+            parent.emitted = True
+
+    def _value_done(self):
+        if not self._stack:
+            self.done = True
+
+
+# ----- canonical digest -----
+_WS_TEXT = re.compile(r"[ \t\r\n]*")
+
+
+class CanonicalDigest:
+    """
+    SHA-256 of a JSON object document that ignores formatting, string
+    escapes, key order, the order of lists under the keys in `unordered`
+    and the values at the key paths in `dropped` (tuples of object keys
+    from the root).
+
+    The document is read incrementally: each member of the root object, or
+    each element of a member that is a list, is decoded, normalized and
+    hashed on its own, then dropped. Memory is thus bounded by the largest
+    such element (one SBOM component, say), not the document; an element
+    over MAX_ELEMENT_CHARS is refused. Scalar members of the root are kept
+    in `top_level`. Call feed() with successive chunks, then hexdigest();
+    both raise ValueError for invalid JSON or a root that is not an object.
+    """
+
+    MAX_ELEMENT_CHARS = 8 * 1024 * 1024
+
+    def __init__(self, unordered=(), dropped=()):
+        self._unordered = set(unordered)
+        self._dropped = {tuple(p) for p in dropped}
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        # Skip decode attempts until the pending text reaches this length,
+        # so a long element is re-tried a logarithmic number of times.
+        self._retry_at = 0
+        self._state = "start"
+        self._key: str | None = None
+        self._list = None
+        self._members: list[tuple[str, str]] = []
+        self.top_level: dict = {}
+
+    def feed(self, chunk: bytes):
+        self._text = self._text[self._pos :] + self._utf8.decode(chunk)
+        self._pos = 0
+        self._parse(final=False)
+
+    def hexdigest(self) -> str:
+        self._text = self._text[self._pos :] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        self._parse(final=True)
+        if self._state != "done" or self._text[self._pos :].strip():
+            raise ValueError("Truncated JSON document")
+        sha = hashlib.sha256(b"{")
+        for key, digest in sorted(self._members):
+            sha.update(f"{json.dumps(key, ensure_ascii=False)}:{digest},".encode())
+        return sha.hexdigest()
+
+    # ----- parsing -----
+    def _parse(self, final: bool):
+        text = self._text
+        if not final and len(text) < self._retry_at:
+            return
+        while self._state != "done":
+            pos = _WS_TEXT.match(text, self._pos).end()
+            if pos >= len(text):
+                self._pos = pos
+                return
+            c = text[pos]
+            state = self._state
+            if state == "start":
+                if c != "{":
+                    raise ValueError("JSON document is not an object")
+                self._state, self._pos = "key", pos + 1
+            elif state in ("key", "item") and c in "}]":
+                # Only right after "{" / "[", i.e. an empty container.
+                self._close(c, pos)
+            elif state in ("after_value", "after_item"):
+                if c == ",":
+                    self._state = "key" if state == "after_value" else "item"
+                    self._pos = pos + 1
+                else:
+                    self._close(c, pos)
+            elif state == "colon":
+                if c != ":":
+                    raise ValueError("Expected ':' in JSON document")
+                self._state, self._pos = "value", pos + 1
+            elif state == "value" and c == "[":
+                unordered = self._key in self._unordered
+                self._list = [] if unordered else hashlib.sha256(b"[")
+                self._state, self._pos = "item", pos + 1
+            else:
+                value, end = self._decode(pos, final)
+                if end is None:
+                    return
+                self._pos = end
+                if state == "key":
+                    if not isinstance(value, str):
+                        raise ValueError("Expected an object key")
+                    self._key, self._state = value, "colon"
+                elif state == "value":
+                    self._member(value)
+                    self._state = "after_value"
+                else:
+                    digest = self._hash(self._normalize(value))
+                    if isinstance(self._list, list):
+                        self._list.append(digest)
+                    else:
+                        self._list.update(digest.encode() + b",")
+                    self._state = "after_item"
+
+    def _decode(self, pos: int, final: bool):
+        """Decode the value at `pos`: (value, end), or (None, None) for more."""
+        text = self._text
+        try:
+            value, end = self._decoder.raw_decode(text, pos)
+        except ValueError:
+            end = None
+        # A value reaching the end of the text may continue in the next chunk,
+        # and so may a number cut before its fraction or exponent ("1." -> 1).
+        if end is None or (not final and (end == len(text) or text[end] in ".eE")):
+            if final:
+                raise ValueError("Invalid JSON document")
+            if len(text) - pos > self.MAX_ELEMENT_CHARS:
+                raise ValueError("JSON element too large to canonicalize")
+            self._pos = pos
+            # feed() then starts the text at `pos`.
+            pending = len(text) - pos
+            self._retry_at = pending + max(pending, 64 * 1024)
+            return None, None
+        self._retry_at = 0
+        return value, end
+
+    def _close(self, c: str, pos: int):
+        if self._state in ("key", "after_value"):
+            if c != "}":
+                raise ValueError("Mismatched bracket in JSON document")
+            self._state = "done"
+        else:
+            if c != "]":
+                raise ValueError("Mismatched bracket in JSON document")
+            if isinstance(self._list, list):
+                sha = hashlib.sha256(b"[")
+                for digest in sorted(self._list):
+                    sha.update(digest.encode() + b",")
+                self._list = sha
+            if (self._key,) not in self._dropped:
+                self._members.append((self._key, self._list.hexdigest()))
+            self._list = None
+            self._state = "after_value"
+        self._pos = pos + 1
+
+    # ----- values -----
+    def _member(self, value):
+        key = self._key
+        if (key,) in self._dropped:
+            return
+        if not isinstance(value, (dict, list)):
+            self.top_level[key] = value
+        for path in self._dropped:
+            if len(path) > 1 and path[0] == key:
+                parent = value
+                for part in path[1:-1]:
+                    parent = parent.get(part) if isinstance(parent, dict) else None
+                if isinstance(parent, dict):
+                    parent.pop(path[-1], None)
+        self._members.append((key, self._hash(self._normalize(value))))
+
+    def _normalize(self, value, unordered: bool = False):
+        if isinstance(value, dict):
+            return {
+                k: self._normalize(v, k in self._unordered) for k, v in value.items()
+            }
+        if isinstance(value, list):
+            items = [self._normalize(v) for v in value]
+            if unordered:
+                items.sort(key=lambda v: json.dumps(v, sort_keys=True))
+            return items
+        return value
+
+    @staticmethod
+    def _hash(value) -> str:
+        text = json.dumps(
+            value, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(text.encode()).hexdigest()
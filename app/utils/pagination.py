@@ -0,0 +1,216 @@
+"""
+Cursor pagination and streaming passthrough for large upstream lists.
+
+Contract shared by every list route:
+- no paging params: the upstream body is relayed as a byte stream, unchanged
+- `limit` and/or `cursor`: one page as {"items": [...], "next_cursor": str|null}
+- `format=ndjson` (or Accept: application/x-ndjson): every item from `cursor`
+  onwards, one per line, relayed as upstream pages arrive
+
+Items are split out of the upstream body incrementally and never decoded, so
+gateway memory per request is bounded by the page size, not the list size.
+Each route names where its upstream keeps the list (`list_key`, see
+ArrayItemSplitter); a body without that list is answered with 502.
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+from app.core.upstreams import upstreams
+from app.utils.batch import NDJSON_MEDIA_TYPE
+from app.utils.jsonstream import ArrayItemSplitter, compact_line
+
+# Query parameters owned by the gateway and never forwarded upstream.
+PAGING_PARAMS = ("limit", "cursor", "format")
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+
+def _parse_limit(raw: str | None) -> int:
+    if raw is None:
+        return settings.PAGE_DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="limit must be an integer")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return min(limit, settings.PAGE_MAX_LIMIT)
+
+
+def _error_detail(body: bytes):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body.decode(errors="replace")
+    return data.get("detail", data) if isinstance(data, dict) else data
+
+
+class UpstreamList:
+    """Reads one upstream list route page by page."""
+
+    def __init__(
+        self,
+        route: str,
+        service: str,
+        path: str,
+        params: dict,
+        list_key: str | None,
+        **kwargs,
+    ):
+        self.service = service
+        self.path = path
+        self.params = params
+        self.list_key = list_key
+        self.kwargs = kwargs
+        # Only routes whose upstream honours offset/limit get real paging;
+        # otherwise the gateway skips and truncates the full stream itself.
+        self.upstream_pages = route in settings.PAGINATED_UPSTREAMS.split(",")
+
+    async def iter_items(self, offset: int, limit: int | None) -> AsyncIterator:
+        """
+        Yield raw items starting at `offset`; at most `limit` (None = all).
+        Upstream error responses raise HTTPException with their body.
+        """
+        emitted = 0
+        while limit is None or emitted < limit:
+            want = settings.PAGE_DEFAULT_LIMIT if limit is None else limit - emitted
+            params = dict(self.params)
+            if self.upstream_pages:
+                params.update({"offset": offset + emitted, "limit": want})
+            page_items = 0
+            async with upstreams.stream(
+                self.service, "GET", self.path, params=params, **self.kwargs
+            ) as res:
+                if res.status_code >= 400:
+                    raise HTTPException(
+                        status_code=res.status_code,
+                        detail=_error_detail(await res.aread()),
+                    )
+                splitter = ArrayItemSplitter(self.list_key)
+                skip = 0 if self.upstream_pages else offset + emitted
+                async for chunk in res.aiter_bytes():
+                    for item in splitter.feed(chunk):
+                        if skip:
+                            skip -= 1
+                            continue
+                        page_items += 1
+                        emitted += 1
+                        yield item
+                        if limit is not None and emitted >= limit:
+                            return
+                    if splitter.done:
+                        break
+                if not splitter.done:
+                    raise HTTPException(
+                        status_code=502,
+                        detail=f"{self.service} returned no complete "
+                        f"{self.list_key or 'top-level'} list",
+                    )
+            # A short (or unpaginated, fully consumed) page is the last one.
+            if not self.upstream_pages or page_items < want:
+                return
+
+
+async def paginated_list(
+    request: Request,
+    route: str,
+    service: str,
+    path: str,
+    *,
+    list_key: str | None,
+    **kwargs,
+) -> Response:
+    """
+    Serve an upstream list route under the gateway pagination contract.
+    `list_key` is the dotted key path of the list in the upstream body, or
+    None when the body is the list itself.
+    """
+    query = request.query_params
+    params = {k: v for k, v in query.items() if k not in PAGING_PARAMS}
+    accept = request.headers.get("accept", "")
+    stream = query.get("format") == "ndjson" or NDJSON_MEDIA_TYPE in accept
+    paginated = "limit" in query or "cursor" in query
+
+    if not stream and not paginated:
+        return await _passthrough(service, path, params, **kwargs)
+
+    offset = decode_cursor(query["cursor"]) if "cursor" in query else 0
+    listing = UpstreamList(route, service, path, params, list_key, **kwargs)
+
+    if stream:
+        limit = _parse_limit(query["limit"]) if "limit" in query else None
+        items = listing.iter_items(offset, limit)
+        # Pull the first item eagerly so upstream errors surface as a
+        # proper status instead of a truncated 200 stream.
+        try:
+            first = await items.__anext__()
+        except StopAsyncIteration:
+            first = None
+
+        async def lines():
+            try:
+                if first is None:
+                    return
+                yield compact_line(first)
+                async for item in items:
+                    yield compact_line(item)
+            finally:
+                await items.aclose()
+
+        return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+    limit = _parse_limit(query.get("limit"))
+    # One extra item tells us whether another page exists.
+    page = [item async for item in listing.iter_items(offset, limit + 1)]
+    next_cursor = encode_cursor(offset + limit) if len(page) > limit else None
+    body = (
+        b'{"items":['
+        + b",".join(page[:limit])
+        + b'],"next_cursor":'
+        + json.dumps(next_cursor).encode()
+        + b"}"
+    )
+    return Response(content=body, media_type="application/json")
+
+
+async def _passthrough(service: str, path: str, params: dict, **kwargs) -> Response:
+    """Relay the upstream body chunk by chunk without decoding it."""
+    stack = AsyncExitStack()
+    res = await stack.enter_async_context(
+        upstreams.stream(service, "GET", path, params=params, **kwargs)
+    )
+
+    async def body():
+        try:
+            async for chunk in res.aiter_bytes():
+                yield chunk
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(
+        body(),
+        status_code=res.status_code,
+        media_type=res.headers.get("content-type", "application/json"),
+        background=BackgroundTask(stack.aclose),
+    )
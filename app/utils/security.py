@@ -28,8 +28,6 @@ def verify_jwt(request: Request):
     """
     token = get_token_from_header(request)
     try:
-        print(SECRET_KEY)
-        print(ALGORITHM)
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
         exp = payload.get("exp")
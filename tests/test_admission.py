@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from app.core import admission as admission_module
+from app.core.admission import (
+    BULK,
+    CRITICAL,
+    STANDARD,
+    AdmissionController,
+    AdmissionMiddleware,
+)
+from app.core.config import settings
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENCY", 32)
+    monkeypatch.setattr(admission_module.watchdog, "lag", 0.0)
+    fresh = AdmissionController()
+    monkeypatch.setattr(admission_module, "admission", fresh)
+    return fresh
+
+
+def respond(status: int):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+async def call(app, path: str) -> list[dict]:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    await AdmissionMiddleware(app)(scope, receive, send)
+    return sent
+
+
+def test_classify():
+    assert AdmissionController.classify("/api/auth/login") == CRITICAL
+    assert AdmissionController.classify("/api/sbom/upload/chunked") == BULK
+    assert AdmissionController.classify("/api/projects/") == STANDARD
+    assert AdmissionController.classify("/api/vulnerability/stream") is None
+
+
+def test_bulk_is_shed_at_its_class_limit(controller):
+    bulk_limit = int(controller.classes[BULK].limit)
+    tickets = [controller.try_acquire("/api/sbom/batch") for _ in range(bulk_limit)]
+    assert all(t.admitted for t in tickets)
+    shed = controller.try_acquire("/api/sbom/batch")
+    assert not shed.admitted
+    assert shed.retry_after == AdmissionController.RETRY_AFTER[BULK]
+    # Other classes still have room.
+    assert controller.try_acquire("/api/projects/").admitted
+    assert controller.try_acquire("/api/auth/login").admitted
+
+
+def test_loop_lag_sheds_low_priority_first(controller, monkeypatch):
+    monkeypatch.setattr(
+        admission_module.watchdog, "lag", controller.lag_threshold * 1.5
+    )
+    assert not controller.try_acquire("/api/sbom/batch").admitted
+    assert controller.try_acquire("/api/projects/").admitted
+    assert controller.try_acquire("/api/auth/login").admitted
+
+
+def test_shed_request_gets_503_with_retry_after(controller):
+    for _ in range(int(controller.classes[BULK].limit)):
+        controller.try_acquire("/api/sbom/batch")
+    sent = asyncio.run(call(respond(200), "/api/sbom/batch"))
+    assert sent[0]["status"] == 503
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"10"
+
+
+def test_upstream_errors_do_not_cut_the_limit(controller):
+    before = controller.classes[STANDARD].limit
+    for status in (502, 503, 500):
+        sent = asyncio.run(call(respond(status), "/api/projects/"))
+        assert sent[0]["status"] == status
+    assert controller.classes[STANDARD].limit >= before
+    assert controller.global_limit.in_flight == 0
+
+
+def test_timeouts_cut_the_limit(controller):
+    before = controller.classes[STANDARD].limit
+
+    async def timing_out(scope, receive, send):
+        raise TimeoutError
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(call(timing_out, "/api/projects/"))
+    assert controller.classes[STANDARD].limit < before
+    assert controller.classes[STANDARD].in_flight == 0
+
+
+def test_release_judges_latency_against_the_class_target(controller):
+    ticket = controller.try_acquire("/api/projects/")
+    ticket.started -= controller.classes[STANDARD].target_latency * 2
+    before = controller.classes[STANDARD].limit
+    controller.release(ticket)
+    assert controller.classes[STANDARD].limit < before
+
+
+def test_streamed_response_holds_its_slot(controller):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def streaming(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"a", "more_body": True})
+            await release.wait()
+            await send({"type": "http.response.body", "body": b"b"})
+
+        request = asyncio.create_task(call(streaming, "/api/sbom/batch"))
+        await asyncio.sleep(0.01)
+        held = controller.classes[BULK].in_flight
+        release.set()
+        await request
+        return held
+
+    assert asyncio.run(scenario()) == 1
+    assert controller.classes[BULK].in_flight == 0
+    assert controller.global_limit.in_flight == 0
+
+
+def test_exempt_paths_take_no_slot(controller):
+    asyncio.run(call(respond(200), "/api/vulnerability/stream"))
+    assert controller.global_limit.admitted == 0
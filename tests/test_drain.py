@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from app.core import drain
+from app.core.config import settings
+from app.core.drain import Drainer, DrainMiddleware
+
+
+@pytest.fixture(autouse=True)
+def drainer(monkeypatch):
+    fresh = Drainer()
+    monkeypatch.setattr(drain, "drainer", fresh)
+    monkeypatch.setattr(settings, "DRAIN_GRACE_S", 5.0)
+
+    async def flushed(*args):
+        return 0
+
+    monkeypatch.setattr(drain.analytics, "flush", flushed)
+    monkeypatch.setattr(drain.webhook_queue, "flush", flushed)
+    monkeypatch.setattr(drain.sse_hub, "close", lambda retry_ms=None: 0)
+    yield fresh
+    drain.draining_gauge.set(0)
+
+
+def streaming_app(release: asyncio.Event):
+    """Sends one chunk, then the last one once `release` is set."""
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        await release.wait()
+        await send({"type": "http.response.body", "body": b"b"})
+
+    return app
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware, path: str) -> list[dict]:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    await middleware(scope, receive, send)
+    return sent
+
+
+def test_new_requests_are_refused_while_draining(drainer):
+    async def scenario():
+        drainer.start()
+        refused = await call(DrainMiddleware(ok_app), "/api/x")
+        served = await call(DrainMiddleware(ok_app), "/ready")
+        await drainer._task
+        return refused, served
+
+    refused, served = asyncio.run(scenario())
+    assert refused[0]["status"] == 503
+    retry_after = dict(refused[0]["headers"])[b"retry-after"]
+    assert retry_after == str(settings.DRAIN_RETRY_AFTER_S).encode()
+    assert served[0]["status"] == 200
+
+
+def test_drain_waits_for_a_stream_to_end(drainer):
+    async def scenario():
+        release = asyncio.Event()
+        request = asyncio.create_task(
+            call(DrainMiddleware(streaming_app(release)), "/api/sbom/batch")
+        )
+        await asyncio.sleep(0.01)
+        assert drainer.in_flight == 1
+        task = drainer.start()
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        release.set()
+        await request
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(scenario())
+    assert drainer.in_flight == 0
+    assert drainer.report["abandoned_requests"] == 0
+
+
+def test_failed_request_leaves_flight(drainer):
+    async def failing(scope, receive, send):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(call(DrainMiddleware(failing), "/api/x"))
+    assert drainer.in_flight == 0
+
+
+def test_sse_streams_are_not_waited_for(drainer):
+    async def scenario():
+        release = asyncio.Event()
+        stream = asyncio.create_task(
+            call(DrainMiddleware(streaming_app(release)), "/api/vulnerability/stream")
+        )
+        await asyncio.sleep(0.01)
+        assert drainer.in_flight == 0
+        await asyncio.wait_for(drainer.start(), 1)
+        release.set()
+        await stream
+
+    asyncio.run(scenario())
+    assert drainer.report["abandoned_requests"] == 0
@@ -0,0 +1,105 @@
+import fakeredis
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.core import idempotency
+from app.core.config import settings
+from app.core.idempotency import IdempotencyMiddleware
+
+ROUTE = "/api/projects/"
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(monkeypatch, calls):
+    redis = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(idempotency, "get_async_redis", lambda: redis)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_ENABLED", True)
+
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware)
+
+    @app.post(ROUTE)
+    async def create(request: Request, status: int = 201):
+        body = await request.body()
+        calls.append(body)
+        return JSONResponse({"call": len(calls), "size": len(body)}, status_code=status)
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def post(client, key="k1", body=b"{}", status=201):
+    return client.post(
+        ROUTE,
+        params={"status": status},
+        content=body,
+        headers={"Idempotency-Key": key, "Content-Type": "application/json"},
+    )
+
+
+def test_retry_replays_the_stored_response(client, calls):
+    first = post(client)
+    again = post(client)
+    assert first.status_code == again.status_code == 201
+    assert again.json() == first.json() == {"call": 1, "size": 2}
+    assert again.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_other_keys_run_separately(client, calls):
+    post(client, key="k1")
+    post(client, key="k2")
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("status", [404, 422])
+def test_own_client_errors_are_replayed(client, calls, status):
+    post(client, status=status)
+    again = post(client, status=status)
+    assert again.status_code == status
+    assert again.headers.get("idempotent-replayed") == "true"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("status", [401, 409, 429, 500, 503])
+def test_transient_failures_release_the_key(client, calls, status):
+    post(client, status=status)
+    again = post(client, status=status)
+    assert again.status_code == status
+    assert "idempotent-replayed" not in again.headers
+    assert len(calls) == 2
+
+
+def test_different_request_with_the_same_key_is_rejected(client, calls):
+    post(client, body=b'{"name": "a"}')
+    mismatch = post(client, body=b'{"name": "b"}')
+    assert mismatch.status_code == 422
+    assert len(calls) == 1
+
+
+def test_oversized_key_is_rejected(client, calls):
+    assert post(client, key="k" * 256).status_code == 400
+    assert calls == []
+
+
+def test_spooled_body_reaches_the_handler(client, calls, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_SPOOL_BYTES", 100)
+    body = bytes(range(256)) * 1200
+    first = post(client, body=body)
+    again = post(client, body=body)
+    assert first.json() == {"call": 1, "size": len(body)}
+    assert again.headers["idempotent-replayed"] == "true"
+    assert calls == [body]
+
+
+def test_requests_without_a_key_pass_through(client, calls):
+    client.post(ROUTE, content=b"{}")
+    client.post(ROUTE, content=b"{}")
+    assert len(calls) == 2
@@ -0,0 +1,189 @@
+import json
+import random
+
+import pytest
+
+from app.utils.jsonstream import (
+    WHOLE,
+    ArrayItemSplitter,
+    CanonicalDigest,
+    JsonProjector,
+    ProjectionError,
+    field_paths,
+    field_tree,
+)
+
+KEYS = ["id", "severity", "package", "name", "version", 'a"b', "é"]
+SCALARS = [1, -2.5e10, 'x\\"y\n', True, None, "", "ü", 12345678901234567890]
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    roll = rng.random()
+    if depth > 4 or roll < 0.3:
+        return rng.choice(SCALARS)
+    if roll < 0.65:
+        return {
+            rng.choice(KEYS): random_value(rng, depth + 1)
+            for _ in range(rng.randint(0, 4))
+        }
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+
+
+def random_dump(rng: random.Random, doc) -> bytes:
+    return json.dumps(
+        doc, indent=rng.choice([None, 0, 2]), ensure_ascii=rng.random() < 0.5
+    ).encode()
+
+
+def chunks(rng: random.Random, raw: bytes, largest: int = 7):
+    pos = 0
+    while pos < len(raw):
+        size = rng.randint(1, largest)
+        yield raw[pos : pos + size]
+        pos += size
+
+
+def projected(value, spec):
+    """What JsonProjector should produce, computed on the parsed document."""
+    if spec is WHOLE:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: projected(item, spec[key])
+            for key, item in value.items()
+            if key in spec and (spec[key] is WHOLE or isinstance(item, (dict, list)))
+        }
+    if isinstance(value, list):
+        return [
+            projected(item, spec) for item in value if isinstance(item, (dict, list))
+        ]
+    return value
+
+
+# ----- JsonProjector -----
+def test_projector_matches_json_loads():
+    rng = random.Random(1)
+    specs = ["id", "package.name", "package.version", "severity", "name.id", 'a"b']
+    specs += ["é.id", "package"]
+    for _ in range(2000):
+        doc = random_value(rng)
+        raw = random_dump(rng, doc)
+        tree = field_tree(field_paths(",".join(rng.sample(specs, rng.randint(1, 3)))))
+        projector = JsonProjector(tree)
+        out = b"".join(projector.feed(chunk) for chunk in chunks(rng, raw))
+        out += projector.close()
+        assert json.loads(out) == projected(doc, tree), raw
+
+
+@pytest.mark.parametrize("bad", [b'{"a":1', b'{"a":1}}', b"[1,2}", b"{1: 2}"])
+def test_projector_rejects_malformed_json(bad):
+    projector = JsonProjector(field_tree(["a"]))
+    with pytest.raises(ProjectionError):
+        projector.feed(bad)
+        projector.close()
+
+
+# ----- ArrayItemSplitter -----
+def split(raw: bytes, rng: random.Random, list_key=None) -> ArrayItemSplitter:
+    splitter = ArrayItemSplitter(list_key)
+    items = []
+    for chunk in chunks(rng, raw):
+        items += splitter.feed(chunk)
+    return splitter, [json.loads(item) for item in items]
+
+
+def test_splitter_top_level_array_matches_json_loads():
+    rng = random.Random(2)
+    for _ in range(1000):
+        doc = [random_value(rng) for _ in range(rng.randint(0, 6))]
+        splitter, items = split(random_dump(rng, doc), rng)
+        assert items == doc
+        assert splitter.found and splitter.done
+
+
+def test_splitter_nested_list_matches_json_loads():
+    rng = random.Random(3)
+    for _ in range(1000):
+        items = [random_value(rng) for _ in range(rng.randint(0, 6))]
+        doc = {"meta": random_value(rng), "data": {"total": 1, "items": items}}
+        doc["tail"] = {"items": random_value(rng)}
+        splitter, got = split(random_dump(rng, doc), rng, "data.items")
+        assert got == items
+        assert splitter.found and splitter.done
+
+
+def test_splitter_without_the_list():
+    splitter, items = split(
+        b'{"data": {"other": [1, 2]}}', random.Random(4), "data.items"
+    )
+    assert items == []
+    assert not splitter.found
+
+
+# ----- CanonicalDigest -----
+def shuffled(rng: random.Random, value):
+    """The same JSON value with every object's keys in a random order."""
+    if isinstance(value, dict):
+        keys = list(value)
+        rng.shuffle(keys)
+        return {key: shuffled(rng, value[key]) for key in keys}
+    if isinstance(value, list):
+        return [shuffled(rng, item) for item in value]
+    return value
+
+
+def digest(raw: bytes, rng: random.Random, unordered=(), dropped=()) -> str:
+    canonical = CanonicalDigest(unordered, dropped)
+    for chunk in chunks(rng, raw, largest=64):
+        canonical.feed(chunk)
+    return canonical.hexdigest()
+
+
+def test_digest_ignores_formatting_and_key_order():
+    rng = random.Random(5)
+    for _ in range(1000):
+        doc = {rng.choice(KEYS): random_value(rng) for _ in range(rng.randint(0, 5))}
+        first = digest(random_dump(rng, doc), rng)
+        again = digest(random_dump(rng, shuffled(rng, doc)), rng)
+        assert first == again, doc
+
+
+def test_digest_changes_with_content():
+    rng = random.Random(6)
+    for _ in range(1000):
+        doc = {rng.choice(KEYS): random_value(rng) for _ in range(rng.randint(1, 5))}
+        other = json.loads(json.dumps(doc))
+        other[rng.choice(list(other))] = ["changed", rng.random()]
+        if other == doc:
+            continue
+        assert digest(random_dump(rng, doc), rng) != digest(
+            random_dump(rng, other), rng
+        )
+
+
+def test_digest_unordered_lists_and_dropped_fields():
+    rng = random.Random(7)
+    doc = {"items": [{"n": i} for i in range(20)], "meta": {"at": 1, "keep": 2}}
+    other = {"items": doc["items"][::-1], "meta": {"at": 99, "keep": 2}}
+    options = {"unordered": {"items"}, "dropped": [("meta", "at")]}
+    assert digest(json.dumps(doc).encode(), rng, **options) == digest(
+        json.dumps(other).encode(), rng, **options
+    )
+    assert digest(json.dumps(doc).encode(), rng) != digest(
+        json.dumps(other).encode(), rng
+    )
+
+
+def test_digest_keeps_top_level_scalars():
+    canonical = CanonicalDigest()
+    canonical.feed(b'{"bomFormat": "CycloneDX", "components": [{"name": "a"}]}')
+    canonical.hexdigest()
+    assert canonical.top_level == {"bomFormat": "CycloneDX"}
+
+
+@pytest.mark.parametrize("bad", [b'{"a": 1', b"[1, 2]", b'{"a": 1} x', b'{"a" 1}'])
+def test_digest_rejects_invalid_documents(bad):
+    canonical = CanonicalDigest()
+    with pytest.raises(ValueError):
+        canonical.feed(bad)
+        canonical.hexdigest()
@@ -0,0 +1,118 @@
+import io
+import json
+import random
+
+from app.core import sbom_dedupe
+from app.core.sbom_dedupe import digest_file
+
+
+def cyclonedx(components, serial="urn:uuid:1", timestamp="2025-01-01T00:00:00Z"):
+    return {
+        "bomFormat": "CycloneDX",
+        "specVersion": "1.5",
+        "serialNumber": serial,
+        "version": 1,
+        "metadata": {"timestamp": timestamp, "component": {"name": "app"}},
+        "components": components,
+        "dependencies": [
+            {"ref": c["bom-ref"], "dependsOn": ["lib-0", "lib-1"]} for c in components
+        ],
+    }
+
+
+def spdx(packages, namespace="https://example.com/1", created="2025-01-01T00:00:00Z"):
+    return {
+        "spdxVersion": "SPDX-2.3",
+        "SPDXID": "SPDXRef-DOCUMENT",
+        "name": "app",
+        "documentNamespace": namespace,
+        "creationInfo": {"created": created, "creators": ["Tool: x"]},
+        "packages": packages,
+        "relationships": [
+            {
+                "spdxElementId": "SPDXRef-DOCUMENT",
+                "relationshipType": "DESCRIBES",
+                "relatedSpdxElement": p["SPDXID"],
+            }
+            for p in packages
+        ],
+    }
+
+
+COMPONENTS = [
+    {
+        "bom-ref": f"lib-{i}",
+        "name": f"lib-{i}",
+        "version": f"1.{i}",
+        "purl": f"pkg:x{i}",
+    }
+    for i in range(50)
+]
+PACKAGES = [
+    {"SPDXID": f"SPDXRef-{i}", "name": f"pkg-{i}", "versionInfo": f"2.{i}"}
+    for i in range(50)
+]
+
+
+def digest(doc, indent=None):
+    return digest_file(io.BytesIO(json.dumps(doc, indent=indent).encode()))
+
+
+def reversed_lists(doc: dict) -> dict:
+    doc = json.loads(json.dumps(doc))
+    for key in ("components", "dependencies", "packages", "relationships"):
+        if key in doc:
+            doc[key].reverse()
+    for dep in doc.get("dependencies", []):
+        dep["dependsOn"].reverse()
+    return doc
+
+
+def test_cyclonedx_digest_ignores_order_volatile_fields_and_formatting(monkeypatch):
+    base, kind = digest(cyclonedx(COMPONENTS))
+    assert kind == "cyclonedx"
+    shuffled = random.Random(1).sample(COMPONENTS, len(COMPONENTS))
+    regenerated = cyclonedx(shuffled, serial="urn:uuid:2", timestamp="2026-02-02")
+    regenerated["version"] = 7
+    monkeypatch.setattr(sbom_dedupe, "CHUNK", 97)
+    assert digest(regenerated, indent=2) == (base, kind)
+    assert digest(reversed_lists(cyclonedx(COMPONENTS))) == (base, kind)
+
+
+def test_cyclonedx_digest_changes_with_components():
+    base, _ = digest(cyclonedx(COMPONENTS))
+    bumped = [dict(c) for c in COMPONENTS]
+    bumped[3]["version"] = "9.9"
+    assert digest(cyclonedx(bumped))[0] != base
+    assert digest(cyclonedx(COMPONENTS[:-1]))[0] != base
+
+
+def test_spdx_digest_ignores_order_volatile_fields_and_formatting(monkeypatch):
+    base, kind = digest(spdx(PACKAGES))
+    assert kind == "spdx"
+    regenerated = spdx(PACKAGES[::-1], namespace="https://example.com/2", created="x")
+    monkeypatch.setattr(sbom_dedupe, "CHUNK", 61)
+    assert digest(regenerated, indent=4) == (base, kind)
+    assert digest(reversed_lists(spdx(PACKAGES))) == (base, kind)
+
+
+def test_spdx_digest_changes_with_packages():
+    base, _ = digest(spdx(PACKAGES))
+    renamed = [dict(p) for p in PACKAGES]
+    renamed[0]["name"] = "other"
+    assert digest(spdx(renamed))[0] != base
+
+
+def test_other_documents_hash_raw_bytes():
+    doc = {"name": "not an sbom", "items": [1, 2]}
+    compact, kind = digest(doc)
+    assert kind == "raw"
+    assert digest(doc, indent=2)[0] != compact
+    assert digest_file(io.BytesIO(b"not json"))[1] == "raw"
+    assert digest_file(io.BytesIO(b'{"bomFormat": "CycloneDX", '))[1] == "raw"
+
+
+def test_digest_file_rewinds():
+    fileobj = io.BytesIO(json.dumps(cyclonedx(COMPONENTS)).encode())
+    digest_file(fileobj)
+    assert fileobj.tell() == 0